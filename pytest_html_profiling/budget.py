@@ -0,0 +1,82 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+
+MARKER = 'perf_budget'
+MARKER_HELP = ('perf_budget(max_seconds=None, max_calls=None, max_peak_memory=None, '
+               'functions=None, xfail=False): fail the test if its call phase takes '
+               'longer than max_seconds, makes more than max_calls function calls, '
+               'allocates more than max_peak_memory bytes at its peak, or calls any '
+               'function of the functions dict, e.g. {"package.module.func": 10}, more '
+               'often than given. Marks the test as xfailed instead if xfail is true. '
+               'Only checked with --html-profiling (or --html-memory-profiling for '
+               'max_peak_memory).')
+
+
+class PerfBudget(object):
+    """Limits set on the call phase of a test with the perf_budget marker."""
+
+    def __init__(self, max_seconds=None, max_calls=None, max_peak_memory=None,
+                 functions=None, xfail=False):
+        self.max_seconds = max_seconds
+        self.max_calls = max_calls
+        self.max_peak_memory = max_peak_memory
+        self.functions = functions or {}
+        self.xfail = xfail
+
+    @classmethod
+    def from_item(cls, item):
+        marker = item.get_closest_marker(MARKER)
+        if marker is not None:
+            return cls(*marker.args, **marker.kwargs)
+
+    def check(self, seconds, data=None, peak_memory=None):
+        """Return a (budget, limit, actual value) tuple per limit, with None as actual
+        value for the limits that were not measured, i.e. those on calls without a
+        profile counting the calls, and those on memory without a peak."""
+        checks = []
+        if self.max_seconds is not None:
+            checks.append(('seconds', self.max_seconds, seconds))
+        if self.max_calls is not None:
+            checks.append(('calls', self.max_calls, data.total_calls if data else None))
+        if self.max_peak_memory is not None:
+            checks.append(('peak memory (bytes)', self.max_peak_memory, peak_memory))
+        for name, max_calls in sorted(self.functions.items()):
+            calls = None
+            if data is not None:
+                calls = sum(data.stats[key][1] for key in data.stats
+                            if matches(key, name))
+            checks.append(('calls of {0}'.format(name), max_calls, calls))
+        return checks
+
+
+def exceeded(checks):
+    return [(budget, limit, actual) for budget, limit, actual in checks
+            if actual is not None and actual > limit]
+
+
+def matches(key, name):
+    """Return whether a profile key is that of the function with the given dotted name.
+
+    The name is the name of the module followed by the name of the function,
+    possibly prefixed with its class, e.g. 'package.module.Class.method', or
+    the name a built-in function is profiled as, e.g. 'builtins.sorted'.
+    """
+    filename, line, func = key
+    parts = name.split('.')
+    if filename == '~':
+        return func == '<built-in method {0}>'.format(name)
+    if func != parts[-1]:
+        return False
+    path = os.path.splitext(os.path.normcase(filename))[0]
+    for end in range(len(parts) - 1, 0, -1):
+        module = os.path.normcase(os.path.join(*parts[:end]))
+        if path == module or path.endswith(os.sep + module) or (
+                path.endswith(os.sep + '__init__') and
+                os.path.dirname(path).endswith(os.sep + module)):
+            return True
+    return False
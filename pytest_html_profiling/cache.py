@@ -0,0 +1,124 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import json
+import marshal
+import os
+import sqlite3
+import zlib
+
+
+class ProfileCache(object):
+    """Cache of the last profile of each test and of the results generated from it,
+    reused by later sessions for the tests whose sources did not change.
+
+    The cache is an SQLite database with one row per test node id, kept
+    across sessions like the profile history. A row holds the statistics and
+    folded stacks of the profile, the statistics reports and call graphs
+    generated from it, as returned by process_profile, the files the
+    profile ran code of and a digest of their content and of the options
+    the results were generated with. A profile is only returned while the
+    digest is unchanged, e.g.:
+
+        cache = ProfileCache('pytest_profiles/profile_cache.sqlite', options)
+        cached = cache.get('test_foo.py::test_bar')
+
+    The files are only read once per session. Writes are buffered and
+    committed in bulk, as in ProfileStore.
+    """
+
+    def __init__(self, path, options='', batch_size=100):
+        self.path = path
+        self.options = options
+        self.batch_size = batch_size
+        self._pending = []
+        self._file_digests = {}
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS tests ('
+                'nodeid TEXT PRIMARY KEY, session TEXT NOT NULL, files TEXT NOT NULL, '
+                'digest TEXT NOT NULL, profile BLOB NOT NULL, results BLOB)')
+
+    def get(self, nodeid):
+        """Return the cached profile of a test, or None if there is none or if the files
+        it ran code of or the options changed since."""
+        self.flush()
+        row = self._conn.execute(
+            'SELECT session, files, digest, profile, results FROM tests '
+            'WHERE nodeid = ?', (nodeid,)).fetchone()
+        if row is None or row[4] is None:
+            return None
+        session, files, digest, profile, results = row
+        if self.digest(json.loads(files)) != digest:
+            return None
+        stats, folded = marshal.loads(zlib.decompress(bytes(profile)))
+        return CachedProfile(session, stats, folded,
+                             marshal.loads(zlib.decompress(bytes(results))))
+
+    def put_profile(self, nodeid, session, stats, folded=None):
+        """Cache the profile of a test, whose results are cached once generated, see
+        put_results."""
+        files = sorted(set(filename for filename, line, name in stats
+                           if os.path.isfile(filename)))
+        self._pending.append((
+            'INSERT OR REPLACE INTO tests '
+            '(nodeid, session, files, digest, profile, results) '
+            'VALUES (?, ?, ?, ?, ?, NULL)',
+            (nodeid, session, json.dumps(files), self.digest(files),
+             sqlite3.Binary(zlib.compress(marshal.dumps((stats, folded)))))))
+        self._flush_batch()
+
+    def put_results(self, nodeid, session, results):
+        self._pending.append((
+            'UPDATE tests SET results = ? WHERE nodeid = ? AND session = ?',
+            (sqlite3.Binary(zlib.compress(marshal.dumps(results))), nodeid, session)))
+        self._flush_batch()
+
+    def digest(self, files):
+        """Return the digest of the content of the given files and of the options."""
+        digest = hashlib.sha1(self.options.encode('utf-8'))
+        for filename in files:
+            digest.update('{0}\0{1}\0'.format(filename, self._get_file_digest(filename))
+                          .encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get_file_digest(self, filename):
+        if filename not in self._file_digests:
+            try:
+                with open(filename, 'rb') as f:
+                    self._file_digests[filename] = hashlib.sha1(f.read()).hexdigest()
+            except EnvironmentError:
+                # e.g. a deleted file
+                self._file_digests[filename] = ''
+        return self._file_digests[filename]
+
+    def _flush_batch(self):
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self._conn:
+                for statement, parameters in self._pending:
+                    self._conn.execute(statement, parameters)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class CachedProfile(object):
+    """A profile of a test recorded in a past session, with the (statistics reports,
+    call graph artifacts) tuple generated from it by process_profile."""
+
+    def __init__(self, session, stats, folded, results):
+        self.session = session
+        self.stats = stats
+        self.folded = folded
+        self.results = results
@@ -0,0 +1,324 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Command line tools working on the profile directory of past test sessions.
+
+    pytest-html-profiling render [--session NAME] [--html PATH] PROFILE_DIR [OPTIONS]
+
+renders the report of a session again from its manifest and stored
+profiles, without running the tests, and
+
+    pytest-html-profiling merge --html PATH SHARD [SHARD ...] [OPTIONS]
+
+merges the sessions of shards of a test suite, e.g. run on several CI
+machines, into the report of one session, stored in the --html-profile-dir
+given in the OPTIONS. The OPTIONS are those of pytest and
+pytest-html-profiling, given as --option=value, e.g. --html-call-graph or
+--html-profile-top=20, so that the same profiles can be rendered with other
+settings.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+from _pytest.config import _prepareconfig
+
+from .profile_data import ProfileData
+from .profiling_plugin import ProfilingHTMLReport
+from .store import ProfileStore
+
+
+class StoredSession(object):
+    """A session recorded in a profile directory: its manifest and its stored profiles.
+
+    The manifest is read as the entries are iterated, so that only the
+    current entry is held in memory.
+    """
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.profile_dir = os.path.dirname(os.path.abspath(manifest))
+        self._lines = iter_manifest(manifest)
+        self.header = next(self._lines)
+        self.name = self.header['session']
+        self.footer = {}
+        self.store = None
+        if self.header.get('store'):
+            self.store = ProfileStore(os.path.join(
+                self.profile_dir, self.name + ProfilingHTMLReport.STORE_SUFFIX))
+
+    def entries(self):
+        """Yield the entries of the manifest; the footer is set once they are all read.
+        It is left empty if the session did not finish."""
+        for entry in self._lines:
+            if 'report' in entry:
+                yield entry
+            else:
+                self.footer = entry
+
+    def load_profile(self, nodeid, dirname):
+        """Return the stored profile of a test and its folded stacks, if any, or None,
+        None if the profile was not stored. The dirname is the profile directory of the
+        test recorded in the manifest."""
+        try:
+            if self.store is not None:
+                data = ProfileData(self.store.get_stats(nodeid))
+            else:
+                data = ProfileData.load(
+                    self._get_filename(dirname, ProfilingHTMLReport.STATS_FILENAME))
+        except (KeyError, EnvironmentError):
+            return None, None
+        try:
+            if self.store is not None:
+                folded = self.store.get(
+                    nodeid, ProfilingHTMLReport.FOLDED_FILENAME).decode('utf-8')
+            else:
+                path = self._get_filename(dirname, ProfilingHTMLReport.FOLDED_FILENAME)
+                with io.open(path, encoding='utf-8') as f:
+                    folded = f.read()
+        except (KeyError, EnvironmentError):
+            folded = None
+        return data, folded
+
+    def _get_filename(self, dirname, filename):
+        return os.path.join(self.profile_dir, self.name, dirname, filename)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+class ProfileRenderer(ProfilingHTMLReport):
+    """Renders a report from the manifests and stored profiles of past sessions.
+
+    The statistics and call graphs are generated from the stored profiles,
+    by a pool of worker processes as with --html-profile-deferred, with the
+    options the renderer is configured with. The report is that of a new
+    session, which the profiles are stored in, see merge.
+    """
+
+    def __init__(self, logfile, config):
+        super(ProfileRenderer, self).__init__(logfile, config)
+        self._deferred = True
+        # only what can be derived from the stored profiles is rendered again
+        self._profile_phases = False
+        self._memory_profiling = False
+
+    def _open_profile_cache(self, config):
+        # the stored profiles may not match the current sources
+        return None
+
+    def _open_session_trace(self):
+        # the timelines are those of the sessions as they ran, on the clocks of their
+        # machines
+        return None
+
+    def add_report(self, report, data=None, folded=None, name=None):
+        """Add a report of a manifest, with the stored profile of the test for call
+        reports. The name of the test, which its call graphs are rooted at, defaults to
+        that in its node id."""
+        if getattr(report, 'when', None) is None:
+            self.pytest_collectreport(report)
+            return
+        if data is not None and report.when == 'call':
+            name = name or report.nodeid.split('::')[-1]
+            self._handle_profile(report.nodeid, name, data, folded)
+            report.extra = (getattr(report, 'extra', []) +
+                            self._get_test_extras(report.nodeid))
+        self.pytest_runtest_logreport(report)
+
+    def finish(self, config, duration, metadata=None):
+        """Write the report, stating the given duration and metadata of the session."""
+        if metadata is not None:
+            config._metadata = metadata
+        # the report states the duration of the session, not of the rendering
+        self.suite_start_time = time.time() - duration
+        self.pytest_sessionfinish(RenderSession(config))
+
+
+class SessionRenderer(ProfileRenderer):
+    """Renders the report of a past session again, in place: the profiles are left as
+    they are and the statistics and call graphs are written to the directory of the
+    session."""
+
+    def __init__(self, logfile, config, stored):
+        self._stored = stored
+        super(SessionRenderer, self).__init__(logfile, config)
+
+    def _get_session_name(self, config):
+        return self._stored.name
+
+    def _open_store(self, config):
+        # the store of the session, whether or not --html-profile-store is given
+        return self._stored.store
+
+    def _open_manifest(self):
+        return None
+
+    def _save_profile(self, nodeid, data, folded=None):
+        # the profile is already stored
+        return True
+
+
+class RenderSession(object):
+    """Stands in for the pytest session the report of which is rendered again."""
+
+    def __init__(self, config):
+        self.config = config
+
+
+def find_manifest(profile_dir, session=None):
+    """Return the manifest of the given session in the profile directory, or the last
+    one."""
+    if session is not None:
+        return os.path.join(profile_dir, session + ProfilingHTMLReport.MANIFEST_SUFFIX)
+    manifests = sorted(glob.glob(
+        os.path.join(profile_dir, '*' + ProfilingHTMLReport.MANIFEST_SUFFIX)))
+    if not manifests:
+        raise IOError('no manifest found in {0}'.format(profile_dir))
+    return manifests[-1]
+
+
+def iter_manifest(path):
+    """Yield the lines of a manifest, see ProfilingHTMLReport._open_manifest: the
+    header, the entries and the footer, if the session finished."""
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _load_report(config, entry):
+    return config.hook.pytest_report_from_serializable(config=config,
+                                                       data=entry['report'])
+
+
+@contextlib.contextmanager
+def _configured(args):
+    """Yield the pytest configuration the report is rendered with, configured as for a
+    test session and unconfigured once done: it provides the options of the report, and
+    the hooks and metadata of the plugins.
+
+    pytest has no public API parsing the command line into a configuration without
+    running a session, which is why _prepareconfig, that pytest.main calls, is used. As
+    --html is not given, the plugin writes no report of its own, the renderer does.
+    """
+    config = _prepareconfig(args)
+    config.hook.pytest_configure.call_historic(kwargs=dict(config=config))
+    try:
+        yield config
+    finally:
+        config.hook.pytest_unconfigure(config=config)
+
+
+def render(args, options):
+    stored = StoredSession(find_manifest(args.profile_dir, args.session))
+    html_path = args.html or os.path.join(args.profile_dir, stored.name + '.html')
+    pytest_args = ['--html-profiling', '--html-profile-dir', args.profile_dir] + options
+    with _configured(pytest_args) as config:
+        renderer = SessionRenderer(html_path, config, stored)
+        config.pluginmanager.register(renderer)
+        try:
+            for entry in stored.entries():
+                report = _load_report(config, entry)
+                data, folded = (None, None)
+                if entry.get('profile') is not None:
+                    # the profile is not saved again, only its statistics and call
+                    # graphs
+                    data, folded = stored.load_profile(report.nodeid, entry['profile'])
+                renderer.add_report(report, data, folded)
+            renderer.finish(config, stored.footer.get('duration', 0.0),
+                            stored.footer.get('metadata'))
+        finally:
+            config.pluginmanager.unregister(renderer)
+            stored.close()
+    print('generated html file: file://{0}'.format(renderer.logfile))
+    return 0
+
+
+def merge(args, options):
+    """Merge the sessions of shards into the report of one session.
+
+    The shards are read one after the other, one entry at a time. A test
+    reported by more than one shard, e.g. one rerun on another machine, is
+    kept once per shard, with the node id suffixed with '@shard<N>' from its
+    second occurrence on, where N is the position of the shard on the
+    command line.
+    """
+    seen = set()
+    duration, metadata = 0.0, None
+    with _configured(['--html-profiling'] + options) as config:
+        merger = ProfileRenderer(args.html, config)
+        config.pluginmanager.register(merger)
+        try:
+            for index, path in enumerate(args.shards, 1):
+                manifest = path if os.path.isfile(path) else find_manifest(path)
+                stored = StoredSession(manifest)
+                nodeids = set()
+                try:
+                    for entry in stored.entries():
+                        report = _load_report(config, entry)
+                        nodeid = report.nodeid
+                        if nodeid in seen:
+                            report.nodeid = '{0}@shard{1}'.format(nodeid, index)
+                        nodeids.add(nodeid)
+                        data, folded = (None, None)
+                        if entry.get('profile') is not None:
+                            data, folded = stored.load_profile(nodeid, entry['profile'])
+                        # the suffix of the node id is not part of the name of the test
+                        merger.add_report(report, data, folded, nodeid.split('::')[-1])
+                finally:
+                    stored.close()
+                seen.update(nodeids)
+                # the shards ran in parallel
+                duration = max(duration, stored.footer.get('duration', 0.0))
+                if metadata is None:
+                    metadata = stored.footer.get('metadata')
+            merger.finish(config, duration, metadata)
+        finally:
+            config.pluginmanager.unregister(merger)
+    print('generated html file: file://{0}'.format(merger.logfile))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pytest-html-profiling',
+                                     description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    render_parser = commands.add_parser(
+        'render',
+        help='render the report of a session again from its profile directory')
+    render_parser.add_argument('profile_dir',
+                               help='the --html-profile-dir of the session')
+    render_parser.add_argument('--session',
+                               help='the name of the session, i.e. its start time, by '
+                                    'default the last one')
+    render_parser.add_argument('--html',
+                               help='the report file to write, by default the name of '
+                                    'the session in the profile directory')
+    merge_parser = commands.add_parser(
+        'merge', help='merge the sessions of shards, e.g. CI machines, into one report')
+    merge_parser.add_argument('shards', nargs='+', metavar='SHARD',
+                              help='the --html-profile-dir of a shard, for its last '
+                                   'session, or the manifest of a session')
+    merge_parser.add_argument('--html', required=True, help='the report file to write')
+    args, options = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.command == 'merge':
+        return merge(args, options)
+    return render(args, options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
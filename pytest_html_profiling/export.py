@@ -0,0 +1,212 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Exporters of profiles to the formats of external viewers.
+
+speedscope (https://www.speedscope.app), the Chrome trace event format,
+read by chrome://tracing and Perfetto (https://ui.perfetto.dev), and the
+callgrind format, read by KCachegrind and QCachegrind. The exporters write
+their output to a file object as they go, one stack or event at a time,
+rather than building the whole document first, e.g.:
+
+    with io.open('test.trace.json', 'w', encoding='utf-8') as f:
+        write_chrome_trace(f, 'test_foo.py::test_bar', ProfileData.load('test.cprof'))
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import hashlib
+import json
+from collections import defaultdict
+
+from . import flamegraph
+
+SPEEDSCOPE = 'speedscope'
+CHROME = 'chrome'
+CALLGRIND = 'callgrind'
+FORMATS = [SPEEDSCOPE, CHROME, CALLGRIND]
+FILENAMES = {SPEEDSCOPE: 'test.speedscope.json', CHROME: 'test.trace.json',
+             CALLGRIND: 'callgrind.out.{0}'}
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+EXPORTER = 'pytest-html-profiling'
+# stacks reconstructed from a profile are exported in more detail than flame graphs
+# are drawn
+MIN_FRACTION = 0.0001
+MICROSECONDS = 1e6
+
+
+def write_speedscope(f, name, data=None, roots=None, folded=None, interval=None):
+    """Write a profile as a sampled profile of the speedscope file format.
+
+    The stacks are the folded stacks if given, weighted by the sampling
+    interval in seconds if given, or are reconstructed from the profile
+    data as for flame graphs, weighted by the time spent in their last
+    frame.
+    """
+    unit = 'none' if folded and not interval else 'seconds'
+    f.write('{{"$schema":{0},"exporter":{1},"name":{2},"activeProfileIndex":0,'
+            '"profiles":[{{"type":"sampled","name":{2},"unit":{3},"startValue":0,'
+            '"samples":['.format(_dumps(SPEEDSCOPE_SCHEMA), _dumps(EXPORTER),
+                                 _dumps(name), _dumps(unit)))
+    frames = {}
+    weights = []
+    for stack, weight in _stacks(data, roots, folded, interval):
+        indices = []
+        for key in stack:
+            index = frames.get(key)
+            if index is None:
+                index = frames[key] = len(frames)
+            indices.append(index)
+        f.write((',' if weights else '') + _dumps(indices))
+        weights.append(weight)
+    f.write('],"weights":{0},"endValue":{1}}}],"shared":{{"frames":['.format(
+        _dumps(weights), _dumps(sum(weights))))
+    for i, key in enumerate(sorted(frames, key=frames.get)):
+        filename, line, function = key
+        frame = {'name': function, 'file': filename, 'line': line}
+        f.write((',' if i else '') + _dumps(frame))
+    f.write(']}}\n')
+
+
+def write_chrome_trace(f, name, data=None, roots=None, folded=None, interval=None):
+    """Write a profile as nested complete events of the Chrome trace event format, one
+    per frame of the flame graph of the profile, laid out one after the other from time
+    0."""
+    if folded:
+        graph = flamegraph.from_folded(folded, MIN_FRACTION, _frame_key)
+        scale = (interval or 1 / MICROSECONDS) * MICROSECONDS
+    else:
+        graph = flamegraph.from_profile(data, roots, MIN_FRACTION, _frame_key)
+        scale = MICROSECONDS
+    trace = TraceWriter(f)
+    trace.add({'ph': 'M', 'name': 'thread_name', 'pid': 0, 'tid': 0,
+               'args': {'name': name}})
+    frontier = [(graph['root'], 0.0)]
+    while frontier:
+        node, start = frontier.pop()
+        for child in node[2]:
+            filename, line, function = child[0]
+            trace.add({'ph': 'X', 'name': function, 'cat': 'function', 'pid': 0,
+                       'tid': 0, 'ts': start * scale, 'dur': child[1] * scale,
+                       'args': {'file': filename, 'line': line}})
+            frontier.append((child, start))
+            start += child[1]
+    trace.close()
+
+
+def write_callgrind(f, name, data, roots=None, folded=None, interval=None):
+    """Write a profile in the callgrind format, with the internal time of each function
+    and the calls it made to other functions, with their cumulative time, in
+    microseconds.
+
+    The file and function names are compressed, i.e. written once and then
+    referred to by number. The calls are attributed to the first line of the
+    calling function, whose call sites are not recorded by cProfile.
+    """
+    f.write('# callgrind format\nversion: 1\ncreator: {0}\ncmd: {1}\npositions: line\n'
+            'events: Microseconds\nsummary: {2}\n\n'.format(
+                EXPORTER, name, _microseconds(data.total_time)))
+    callees = defaultdict(list)
+    for key, (cc, nc, tt, ct, callers) in data.stats.items():
+        for caller, value in callers.items():
+            callees[caller].append((key, value, nc, ct))
+    files = {}
+    functions = {}
+
+    def compress(names, prefix, value):
+        if value in names:
+            return '{0}=({1})\n'.format(prefix, names[value])
+        names[value] = len(names) + 1
+        return '{0}=({1}) {2}\n'.format(prefix, names[value], value)
+
+    for key in sorted(data.stats):
+        filename, line, function = key
+        lines = [compress(files, 'fl', filename),
+                 compress(functions, 'fn', _callgrind_name(key)),
+                 '{0} {1}\n'.format(line, _microseconds(data.stats[key][2]))]
+        for callee, value, nc, ct in sorted(callees.get(key, ())):
+            if isinstance(value, tuple):
+                calls, time = value[1], value[3]
+            else:
+                calls, time = value, float(value) / nc * ct if nc else 0.0
+            lines.append(compress(files, 'cfi', callee[0]))
+            lines.append(compress(functions, 'cfn', _callgrind_name(callee)))
+            lines.append('calls={0} {1}\n{2} {3}\n'.format(
+                calls, callee[1], line, _microseconds(time)))
+        lines.append('\n')
+        f.write(''.join(lines))
+
+
+WRITERS = {SPEEDSCOPE: write_speedscope, CHROME: write_chrome_trace,
+           CALLGRIND: write_callgrind}
+
+
+def get_filename(export_format, nodeid):
+    """Return the name of the file a test profile is exported to in the given format."""
+    if export_format == CALLGRIND:
+        # the tools find callgrind files by their prefix
+        digest = hashlib.sha1(nodeid.encode('utf-8')).hexdigest()
+        return FILENAMES[CALLGRIND].format(digest[:12])
+    return FILENAMES[export_format]
+
+
+class TraceWriter(object):
+    """Writes the events of a Chrome trace event format file as they are added."""
+
+    def __init__(self, f):
+        self.file = f
+        self._empty = True
+        f.write('{"displayTimeUnit":"ms","traceEvents":[\n')
+
+    def add(self, event):
+        self.file.write(('' if self._empty else ',\n') + _dumps(event))
+        self._empty = False
+
+    def close(self):
+        self.file.write('\n]}\n')
+
+
+def _stacks(data, roots, folded, interval):
+    """Yield the stacks of a profile as (list of keys, weight) tuples."""
+    if folded:
+        for line in folded.splitlines():
+            stack, _, count = line.rpartition(' ')
+            if stack:
+                yield ([_frame_key(frame) for frame in stack.split(';')],
+                       int(count) * interval if interval else int(count))
+        return
+    graph = flamegraph.from_profile(data, roots, MIN_FRACTION, _frame_key)
+    frontier = [(graph['root'], [])]
+    while frontier:
+        node, stack = frontier.pop()
+        own = round(node[1] - sum(child[1] for child in node[2]), 6)
+        if stack and own > 0:
+            yield stack, own
+        for child in node[2]:
+            frontier.append((child, stack + [child[0]]))
+
+
+def _callgrind_name(key):
+    # functions of the same name in the same file are told apart by their line
+    filename, line, function = key
+    return '{0}:{1}'.format(function, line)
+
+
+def _microseconds(seconds):
+    return int(round(seconds * MICROSECONDS))
+
+
+def _frame_key(frame):
+    # the key of a frame of folded stacks or of a function of a profile
+    if isinstance(frame, tuple):
+        return frame
+    return flamegraph.parse_frame(frame) or ('', 0, frame)
+
+
+def _dumps(value):
+    text = json.dumps(value, separators=(',', ':'))
+    if not isinstance(text, type('')):
+        text = text.decode('utf-8')
+    return text
@@ -0,0 +1,167 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Flame graphs built from folded stacks or from the caller/callee data of a profile.
+
+A flame graph is returned as plain lists, so that it can be serialized
+compactly as JSON and drawn by the viewer of the report: each frame is a
+[name, value, children] list, where the value is the time spent in the
+frame and the frames it called, and the children are the frames it
+called, sorted by name. Frames smaller than min_fraction of the whole
+graph are left out, which bounds the size of the graph however many
+unique stacks the profile holds.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import bisect
+import os
+import re
+from collections import defaultdict
+
+MIN_FRACTION = 0.001
+ROOT_NAME = 'all'
+# separator of the frames of the stacks while they are sorted, and the character after
+# it
+SEPARATOR = '\x00'
+AFTER_SEPARATOR = '\x01'
+
+FRAME_REGEX = re.compile(r'^(?P<name>.*) \((?P<filename>.*):(?P<line>\d+)\)$')
+
+
+def from_folded(folded, min_fraction=MIN_FRACTION, name=None):
+    """Return the flame graph of stacks in the folded format, e.g. of a StackSampler.
+
+    The values are numbers of samples. The frames are named by the given
+    function of the frame, or as by ProfileData.function_name. The stacks
+    are sorted as strings, with a separator sorting before any other
+    character, so that the stacks going through a frame are next to each
+    other and are found by bisection, without splitting the stacks into
+    frames.
+    """
+    stacks = []
+    for line in folded.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack:
+            stacks.append((stack.replace(';', SEPARATOR), int(count)))
+    stacks.sort()
+    keys = [stack for stack, count in stacks]
+    # number of samples of the stacks before each stack
+    before = [0]
+    for stack, count in stacks:
+        before.append(before[-1] + count)
+    total = before[-1]
+    min_value = total * min_fraction
+    names = {}
+
+    def frame_name(frame):
+        if frame not in names:
+            key = parse_frame(frame)
+            if name is not None:
+                names[frame] = name(frame if key is None else key)
+            else:
+                names[frame] = frame if key is None else _function_name(*key)
+        return names[frame]
+
+    root = [ROOT_NAME, total, []]
+    # frame, range of the stacks going through it, and the stack up to it
+    frontier = [(root, 0, len(keys), None)]
+    while frontier:
+        node, start, end, prefix = frontier.pop()
+        offset = 0
+        if prefix is not None:
+            # the stacks ending at the frame come first
+            start = bisect.bisect_right(keys, prefix, start, end)
+            offset = len(prefix) + 1
+        while start < end:
+            stop = keys[start].find(SEPARATOR, offset)
+            child_prefix = keys[start] if stop < 0 else keys[start][:stop]
+            child_end = bisect.bisect_left(keys, child_prefix + AFTER_SEPARATOR, start,
+                                           end)
+            value = before[child_end] - before[start]
+            if value >= min_value:
+                child = [frame_name(child_prefix[offset:]), value, []]
+                node[2].append(child)
+                frontier.append((child, start, child_end, child_prefix))
+            start = child_end
+        node[2].sort(key=lambda child: child[0])
+    return {'unit': 'samples', 'total': total, 'root': root}
+
+
+def from_profile(data, roots=None, min_fraction=MIN_FRACTION, name=None):
+    """Return the flame graph of a ProfileData, starting at the given functions or at
+    the functions without callers, with the frames named by the given function of their
+    key, or by ProfileData.function_name.
+
+    A profile only holds the time of each call edge, not of whole stacks, so
+    the stacks are reconstructed by splitting the time of a function among
+    its callees in proportion to the time of each call edge. This assumes
+    that a function costs the same whatever calls it. Recursive calls are
+    left in the time of the outermost frame. The values are seconds.
+    """
+    stats = data.stats
+    callees = defaultdict(list)
+    for key, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, value in callers.items():
+            if isinstance(value, tuple):
+                time = value[3]
+            else:
+                time = float(value) / nc * ct if nc else 0.0
+            callees[caller].append((key, time))
+    if not roots:
+        roots = [key for key, (cc, nc, tt, ct, callers) in stats.items() if not callers]
+
+    root = [ROOT_NAME, 0.0, {}]
+    frontier = []
+    for key in roots:
+        if key in stats:
+            node = root[2][key] = [key, stats[key][3], {}]
+            root[1] += node[1]
+            frontier.append((key, node, (key,)))
+    min_time = root[1] * min_fraction
+    while frontier:
+        key, node, path = frontier.pop()
+        ct = stats[key][3]
+        scale = node[1] / ct if ct else 0.0
+        for callee, time in callees.get(key, ()):
+            time *= scale
+            if callee in path or time <= 0 or time < min_time:
+                continue
+            child = node[2][callee] = [callee, time, {}]
+            frontier.append((callee, child, path + (callee,)))
+
+    def frame_name(key):
+        return key if key == ROOT_NAME else (name or data.function_name)(key)
+
+    graph = _to_lists(root, min_fraction, frame_name)
+    return {'unit': 's', 'total': graph[1], 'root': graph}
+
+
+def _to_lists(root, min_fraction, name):
+    min_value = root[1] * min_fraction
+    result = [name(root[0]), round(root[1], 6), []]
+    frontier = [(root, result)]
+    while frontier:
+        node, lists = frontier.pop()
+        children = [[name(child[0]), round(child[1], 6), [], child]
+                    for child in node[2].values()
+                    if child[1] > 0 and child[1] >= min_value]
+        children.sort(key=lambda child: child[0])
+        for child in children:
+            frontier.append((child.pop(), child))
+            lists[2].append(child)
+    return result
+
+
+def parse_frame(frame):
+    """Return the (filename, line, function name) key of a frame of folded stacks, see
+    sampling.format_frame, or None if it cannot be parsed."""
+    match = FRAME_REGEX.match(frame)
+    if match is not None:
+        return match.group('filename'), int(match.group('line')), match.group('name')
+
+
+def _function_name(filename, line, name):
+    # the name ProfileData.function_name gives to a function
+    return '%s:%d:%s' % (os.path.splitext(os.path.basename(filename))[0], line, name)
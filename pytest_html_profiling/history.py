@@ -0,0 +1,156 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+import os
+import sqlite3
+import zlib
+
+LAST = 'last'
+
+
+class ProfileHistory(object):
+    """Store of the performance of the tests of past sessions, to compare sessions with.
+
+    The history is an SQLite database with one row per session, by session
+    name, holding the profiler and sampling interval the session was profiled
+    with, and one row per session and test node id, holding a
+    PerformanceRecord. It is kept across sessions, unlike the profile
+    directories of the sessions, e.g.:
+
+        history = ProfileHistory('pytest_profiles/history.sqlite')
+        records = history.get_run(history.last_run('cprofile'))
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS runs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, '
+                'profiler TEXT, interval REAL)')
+            columns = [row[1] for row in self._conn.execute('PRAGMA table_info(runs)')]
+            if 'profiler' not in columns:
+                # recorded before the profiler was, such sessions are never compared
+                self._conn.execute('ALTER TABLE runs ADD COLUMN profiler TEXT')
+                self._conn.execute('ALTER TABLE runs ADD COLUMN interval REAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS tests ('
+                'run INTEGER NOT NULL, nodeid TEXT NOT NULL, duration REAL NOT NULL, '
+                'calls INTEGER NOT NULL, time REAL NOT NULL, functions BLOB NOT NULL, '
+                'PRIMARY KEY (run, nodeid))')
+
+    def add_run(self, name, records, profiler='cprofile', interval=None):
+        """Record the performance of the tests of a session, by node id, profiled with
+        the given profiler and sampling interval (None for cProfile)."""
+        with self._conn:
+            # a session recorded again replaces the previous record
+            self._conn.execute(
+                'DELETE FROM tests WHERE run IN (SELECT id FROM runs WHERE name = ?)',
+                (name,))
+            self._conn.execute('DELETE FROM runs WHERE name = ?', (name,))
+            run = self._conn.execute(
+                'INSERT INTO runs (name, profiler, interval) VALUES (?, ?, ?)',
+                (name, profiler, interval)).lastrowid
+            self._conn.executemany(
+                'INSERT INTO tests (run, nodeid, duration, calls, time, functions) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(run, nodeid, record.duration, record.calls, record.time,
+                  sqlite3.Binary(zlib.compress(
+                      json.dumps(record.functions).encode('utf-8'))))
+                 for nodeid, record in records.items()])
+
+    def runs(self):
+        """Return the names of the recorded sessions, from the oldest to the newest."""
+        return [row[0] for row in
+                self._conn.execute('SELECT name FROM runs ORDER BY id')]
+
+    def last_run(self, profiler, interval=None):
+        """Return the name of the last session profiled with the given profiler and
+        sampling interval, or None."""
+        row = self._conn.execute(
+            'SELECT name FROM runs WHERE profiler = ? AND interval IS ? '
+            'ORDER BY id DESC LIMIT 1', (profiler, interval)).fetchone()
+        if row is not None:
+            return row[0]
+
+    def get_profiler(self, name):
+        """Return the profiler and sampling interval a session was profiled with."""
+        row = self._conn.execute(
+            'SELECT profiler, interval FROM runs WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return tuple(row)
+
+    def get_run(self, name):
+        row = self._conn.execute(
+            'SELECT id FROM runs WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        records = {}
+        for nodeid, duration, calls, time, functions in self._conn.execute(
+                'SELECT nodeid, duration, calls, time, functions FROM tests '
+                'WHERE run = ?', row):
+            functions = json.loads(zlib.decompress(bytes(functions)).decode('utf-8'))
+            records[nodeid] = PerformanceRecord(duration, calls, time, functions)
+        return records
+
+    def close(self):
+        self._conn.close()
+
+
+class PerformanceRecord(object):
+    """Performance of a test in a session: the duration of its call phase, the total
+    calls and cumulative time of its profile, and the calls and internal time of the
+    functions that took the most time, as a dict of [calls, internal time] lists by
+    function name."""
+
+    def __init__(self, duration, calls, time, functions):
+        self.duration = duration
+        self.calls = calls
+        self.time = time
+        self.functions = functions
+
+    @classmethod
+    def from_profile(cls, duration, data, limit=50):
+        functions = {}
+        for key in data.top_functions('time', limit):
+            cc, nc, tt, ct, callers = data.stats[key]
+            name = function_name(key)
+            calls, time = functions.get(name, (0, 0.0))
+            functions[name] = [calls + nc, time + tt]
+        return cls(duration, data.total_calls, data.max_cumulative_time, functions)
+
+
+def function_name(key):
+    """Return the name of a function in the history, i.e. 'module:name'.
+
+    The line is left out, so that a function is still recognized after the
+    code above it changed.
+    """
+    filename, line, name = key
+    return '%s:%s' % (os.path.splitext(os.path.basename(filename))[0], name)
+
+
+def relative_change(value, baseline):
+    """Return the change from baseline to value in percent, or None if baseline is 0."""
+    if not baseline:
+        return None
+    return (value - baseline) * 100.0 / baseline
+
+
+def function_deltas(record, baseline, limit=5):
+    """Return the functions whose internal time changed the most between the baseline
+    and the given record, as (function name, change in calls, change in internal time)
+    tuples. The calls of a sampled profile are the numbers of samples."""
+    deltas = []
+    for name in set(record.functions) | set(baseline.functions):
+        calls, time = record.functions.get(name, (0, 0.0))
+        baseline_calls, baseline_time = baseline.functions.get(name, (0, 0.0))
+        deltas.append((name, calls - baseline_calls, time - baseline_time))
+    deltas.sort(key=lambda delta: abs(delta[2]), reverse=True)
+    return deltas[:limit]
@@ -0,0 +1,193 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""A local HTTP server showing the results of a session while it runs.
+
+    pytest --html=report.html --html-live=8000
+
+serves a page at http://127.0.0.1:8000/ with the results table of the
+report, which polls /updates?since=N for the rows and test records
+published since its last poll, e.g.:
+
+    {"next": 12, "dropped": 0, "summary": {...}, "updates": [["row", [...]], ...]}
+
+The files the rows link to, e.g. images and profiles, are served too, if
+they are in the directory of the report or in another given directory.
+The page is then served at the path of the directory of the report
+relative to the directory they have in common, so that the relative links
+resolve as in the report.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import mimetypes
+import os
+import threading
+from collections import deque
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, quote, unquote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote, unquote
+    from urlparse import parse_qs
+
+HOST = '127.0.0.1'
+ROW = 'row'
+TEST = 'test'
+# updates kept for the clients to poll, the oldest ones are dropped first
+MAX_UPDATES = 10000
+POLL_INTERVAL = 0.5
+# seconds the server is kept up once closed, for the pages polling it to see the end
+CLOSE_TIMEOUT = 5.0
+
+
+class LiveServer(object):
+    """Serves the live page of a session and the updates published by its report.
+
+    The report publishes updates without ever waiting on the server: they
+    are appended to a bounded deque, which can be appended to and copied
+    from different threads without a lock, and the oldest updates are
+    dropped once it is full, e.g. while nobody polls. An update is only
+    serialized when it is polled, by the thread serving the request.
+
+    The page is served as if it was in page_dir, if given, along with the
+    files in page_dir and in the file_dirs.
+    """
+
+    def __init__(self, port, page, serialize, host=HOST, page_dir=None, file_dirs=()):
+        self.page = page
+        self.summary = {}
+        self.closing = False
+        # set once a page polled the server after it was closed
+        self.final_poll = threading.Event()
+        self._polled = False
+        self._serialize = serialize
+        self._updates = deque(maxlen=MAX_UPDATES)
+        self._next = 0
+        self._file_dirs = []
+        self._root = None
+        self.page_path = '/'
+        if page_dir is not None:
+            self._file_dirs = [os.path.realpath(path)
+                               for path in [page_dir] + list(file_dirs)]
+            # the directory all the files are in, the root of the URL paths
+            self._root = os.path.dirname(os.path.commonprefix(
+                [os.path.join(path, '') for path in self._file_dirs]))
+            page_dir = os.path.relpath(self._file_dirs[0], self._root)
+            if page_dir != os.curdir:
+                self.page_path += quote(page_dir.replace(os.sep, '/')) + '/'
+        self.server = LiveHTTPServer((host, port), LiveRequestHandler)
+        self.server.live = self
+        self.url = 'http://{0}:{1}{2}'.format(host, self.server.server_address[1],
+                                              self.page_path)
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        args=(POLL_INTERVAL,), name='pytest-html-live')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def publish(self, kind, payload):
+        """Publish an update of the given kind, e.g. ROW, serialized by
+        serialize(kind, payload) once polled. Only the thread running the tests
+        publishes."""
+        self._updates.append((self._next, kind, payload))
+        self._next += 1
+
+    def get_updates(self, since):
+        """Return the JSON text of the updates from the given sequence number on, with
+        the summary of the session and the number of updates dropped before they were
+        polled."""
+        self._polled = True
+        while True:
+            try:
+                updates = list(self._updates)
+                break
+            except RuntimeError:
+                # appended to while copied
+                continue
+        dropped = max(0, updates[0][0] - since) if updates else 0
+        updates = [update for update in updates if update[0] >= since]
+        return '{{"next":{0},"dropped":{1},"summary":{2},"updates":[{3}]}}'.format(
+            updates[-1][0] + 1 if updates else since, dropped,
+            self._serialize(None, self.summary),
+            ','.join('["{0}",{1}]'.format(kind, self._serialize(kind, payload))
+                     for seq, kind, payload in updates))
+
+    def get_file(self, path):
+        """Return the name of the file served at the given URL path, or None if there is
+        none, e.g. as it is outside of the directories of the files."""
+        if self._root is None:
+            return None
+        filename = os.path.realpath(os.path.join(
+            self._root, *[part for part in unquote(path).split('/') if part]))
+        if not os.path.isfile(filename):
+            return None
+        for file_dir in self._file_dirs:
+            if filename.startswith(os.path.join(file_dir, '')):
+                return filename
+        return None
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Stop the server. If a page polled it, it is first kept up until polled again,
+        so that the page sees the last summary, but for at most timeout seconds."""
+        self.closing = True
+        if self._polled:
+            self.final_poll.wait(timeout)
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+
+class LiveHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # e.g. a browser closing the page while polling
+        pass
+
+
+class LiveRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        live = self.server.live
+        if path == live.page_path:
+            self._send(live.page, 'text/html')
+        elif path == live.page_path + 'updates':
+            try:
+                since = int(parse_qs(query).get('since', ['0'])[0])
+            except ValueError:
+                since = 0
+            closing = live.closing
+            self._send(live.get_updates(since), 'application/json')
+            if closing:
+                live.final_poll.set()
+        else:
+            filename = live.get_file(path)
+            if filename is None:
+                self.send_error(404)
+                return
+            with open(filename, 'rb') as f:
+                body = f.read()
+            self._send_body(body, mimetypes.guess_type(filename)[0] or
+                            'application/octet-stream')
+
+    def _send(self, text, content_type):
+        self._send_body(text.encode('utf-8'), content_type + '; charset=utf-8')
+
+    def _send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the requests would be mixed with the output of pytest
+        pass
@@ -0,0 +1,78 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import cProfile
+import os
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def is_supported():
+    return tracemalloc is not None
+
+
+class MemoryTracer(object):
+    """Traces the memory allocated by Python code while a test phase runs.
+
+    tracemalloc is started on start and stopped again on stop, unless it was
+    already tracing, e.g. because of PYTHONTRACEMALLOC. The peak and the net
+    growth of the traced memory are measured relative to the memory traced
+    on start, and the allocation sites are the lines whose traced memory
+    changed the most between start and stop.
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self._started = False
+        self._start_size = 0
+        self._start_snapshot = None
+
+    def start(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._start_snapshot = self._take_snapshot()
+        self._start_size = tracemalloc.get_traced_memory()[0]
+
+    def stop(self):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._take_snapshot()
+        if self._started:
+            tracemalloc.stop()
+        diffs = snapshot.compare_to(self._start_snapshot, 'lineno')[:self.top]
+        sites = [(diff.traceback[0].filename, diff.traceback[0].lineno, diff.size_diff,
+                  diff.count_diff) for diff in diffs if diff.size_diff]
+        self._start_snapshot = None
+        return MemoryProfile(max(peak - self._start_size, 0),
+                             current - self._start_size, sites)
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, os.path.join(os.path.dirname(__file__), '*')),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+
+
+class MemoryProfile(object):
+    """Memory traced during a test phase: peak and net growth in bytes, and the top
+    allocation sites as (filename, line, size difference, count difference) tuples."""
+
+    def __init__(self, peak, net, sites):
+        self.peak = peak
+        self.net = net
+        self.sites = sites
+
+
+def format_size(size):
+    return '{0:.1f} KiB'.format(size / 1024.0)
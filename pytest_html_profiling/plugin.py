@@ -12,8 +12,8 @@ import json
 import os
 import pkg_resources
 import sys
+import tempfile
 import time
-import bisect
 import warnings
 import re
 
@@ -27,9 +27,11 @@ except ImportError:
     # ansi2html is not installed
     ANSI = False
 
+import pytest
 from py.xml import html, raw
 
 from . import extras
+from . import live
 from . import __version__, __pypi_url__
 
 PY3 = sys.version_info[0] == 3
@@ -37,10 +39,13 @@ PY3 = sys.version_info[0] == 3
 # Python 2.X and 3.X compatibility
 if PY3:
     basestring = str
-    from html import escape
+    from html import escape, unescape
 else:
     from codecs import open
     from cgi import escape
+    from HTMLParser import HTMLParser
+
+    unescape = HTMLParser().unescape
 
 
 def pytest_addhooks(pluginmanager):
@@ -75,6 +80,53 @@ def pytest_addoption(parser):
         default=[],
         help="append given css file content to report style file.",
     )
+    group.addoption(
+        "--html-streaming",
+        action="store_true",
+        default=False,
+        dest="html_streaming",
+        help="spill the rows of the results table to temporary files as the "
+        "tests finish, and stream them into the report at the end, so that the "
+        "memory used by the report does not grow with the number of tests.",
+    )
+    group.addoption(
+        "--html-virtual-table",
+        action="store_true",
+        default=False,
+        dest="html_virtual_table",
+        help="embed the rows of the results table as JSON data, and only render "
+        "the rows in view in the browser, which keeps reports with many tests "
+        "responsive.",
+    )
+    group.addoption(
+        "--html-json",
+        action="store",
+        dest="html_json",
+        metavar="path",
+        default=None,
+        help="write the results to given path as they arrive, one JSON object per "
+        "line per test, followed by a summary of the session.",
+    )
+    group.addoption(
+        "--html-live",
+        action="store",
+        type=int,
+        dest="html_live",
+        metavar="port",
+        default=None,
+        help="serve a page showing the results as the tests finish on given local "
+        "port, or on a free port if 0, while the session runs.",
+    )
+
+
+def pytest_cmdline_main(config):
+    # the results are written by the report, which is only made with --html
+    if config.getoption("html_json", None) and not config.getoption("htmlpath"):
+        raise pytest.UsageError("--html-json requires --html.")
+    if config.getoption("html_live", None) is not None and not config.getoption(
+        "htmlpath"
+    ):
+        raise pytest.UsageError("--html-live requires --html.")
 
 
 def pytest_configure(config):
@@ -83,7 +135,7 @@ def pytest_configure(config):
     if htmlpath:
         for csspath in config.getoption("css"):
             open(csspath)
-        if not hasattr(config, "slaveinput"):
+        if not is_xdist_worker(config):
             # prevent opening htmlpath on slave nodes (xdist)
             if config.reportCls:
                 config._html = config.reportCls(htmlpath, config)
@@ -94,6 +146,11 @@ def pytest_configure(config):
             config.pluginmanager.register(config._html)
 
 
+def is_xdist_worker(config):
+    # newer versions of pytest-xdist call slaveinput workerinput
+    return hasattr(config, "slaveinput") or hasattr(config, "workerinput")
+
+
 def pytest_unconfigure(config):
     html = getattr(config, "_html", None)
     if html:
@@ -106,21 +163,56 @@ def data_uri(content, mime_type="text/plain", charset="utf-8"):
     return "data:{0};charset={1};base64,{2}".format(mime_type, charset, data)
 
 
+def data_uri_bytes(content, mime_type="application/octet-stream"):
+    data = b64encode(content).decode("ascii")
+    return "data:{0};base64,{1}".format(mime_type, data)
+
+
 class HTMLReport(object):
     def __init__(self, logfile, config):
         logfile = os.path.expanduser(os.path.expandvars(logfile))
         self.logfile = os.path.abspath(logfile)
-        self.test_logs = []
-        self.results = []
+        # rows of the results table by outcome, listed in sort order at the end
+        self.test_logs = dict(
+            (outcome, []) for outcome in self.TestResult.OUTCOME_ORDER
+        )
         self.errors = self.failed = 0
         self.passed = self.skipped = 0
         self.xfailed = self.xpassed = 0
         has_rerun = config.pluginmanager.hasplugin("rerunfailures")
         self.rerun = 0 if has_rerun else None
         self.self_contained = config.getoption("self_contained_html")
+        self.streaming = config.getoption("html_streaming", False)
+        self.virtual_table = config.getoption("html_virtual_table", False)
         self.config = config
+        # one temporary file of serialized rows per outcome, in streaming mode
+        self.segments = {}
+        self.json_results = self._open_json_results(config)
+        # the outcome and phase durations of the tests being run, until torn down
+        self._json_tests = {}
+        # server of the live page, started with the session
+        self.live = None
+
+    RESULTS_MARKER = "<!-- pytest-html:results -->"
+    ROW_REGEX = re.compile(
+        r'^\s*<tbody class="(?P<outcome>\w+) results-table-row">'
+        r"(?P<rows>.*)</tbody>\s*$",
+        re.S,
+    )
+    CELL_REGEX = re.compile(r"<td\b[^>]*>(.*?)</td>", re.S)
+    TAG_REGEX = re.compile(r"<[^>]*>")
 
     class TestResult:
+        OUTCOME_ORDER = (
+            "Error",
+            "Failed",
+            "Rerun",
+            "XFailed",
+            "XPassed",
+            "Skipped",
+            "Passed",
+        )
+
         def __init__(self, outcome, report, logfile, config):
             self.test_id = report.nodeid
             if getattr(report, "when", "call") != "call":
@@ -160,18 +252,6 @@ class HTMLReport(object):
                     html.td(self.additional_html, class_="extra", colspan=len(cells))
                 )
 
-        def __lt__(self, other):
-            order = (
-                "Error",
-                "Failed",
-                "Rerun",
-                "XFailed",
-                "XPassed",
-                "Skipped",
-                "Passed",
-            )
-            return order.index(self.outcome) < order.index(other.outcome)
-
         def create_asset(
             self, content, extra_index, test_index, file_extension, mode="w"
         ):
@@ -298,17 +378,66 @@ class HTMLReport(object):
                 additional_html.append(log)
 
     def _appendrow(self, outcome, report):
+        if self.json_results is not None or self.live is not None:
+            self._add_json_outcome(outcome, report)
         result = self.TestResult(outcome, report, self.logfile, self.config)
         if result.row_table is not None:
-            index = bisect.bisect_right(self.results, result)
-            self.results.insert(index, result)
             tbody = html.tbody(
                 result.row_table,
                 class_="{0} results-table-row".format(result.outcome.lower()),
             )
             if result.row_extra is not None:
                 tbody.append(result.row_extra)
-            self.test_logs.insert(index, tbody)
+            self._add_row(result.outcome, tbody)
+            if self.live is not None:
+                self.live.publish(live.ROW, tbody)
+                self.live.summary = self._get_live_summary()
+
+    def _add_row(self, outcome, tbody):
+        if self.streaming:
+            self._spill_row(outcome, tbody)
+        else:
+            self.test_logs[outcome].append(tbody)
+
+    def _result_rows(self):
+        # the rows of each outcome are kept in the order they arrived
+        return [
+            tbody
+            for outcome in self.TestResult.OUTCOME_ORDER
+            for tbody in self.test_logs[outcome]
+        ]
+
+    def _spill_row(self, outcome, tbody):
+        if outcome not in self.segments:
+            self.segments[outcome] = tempfile.TemporaryFile()
+        row = tbody.unicode(indent=2).encode("utf-8", "xmlcharrefreplace")
+        segment = self.segments[outcome]
+        segment.write("{0}\n".format(len(row)).encode("ascii"))
+        segment.write(row)
+
+    def _iter_result_rows(self):
+        """Yield the serialized rows of the results table, in sort order."""
+        for outcome in self.TestResult.OUTCOME_ORDER:
+            segment = self.segments.pop(outcome, None)
+            if segment is not None:
+                with segment:
+                    segment.seek(0)
+                    for size in iter(segment.readline, b""):
+                        yield segment.read(int(size)).decode("utf-8")
+            for tbody in self.test_logs[outcome]:
+                yield tbody.unicode(indent=2)
+
+    def _row_to_json(self, row):
+        # [outcome, text of each cell of the result row to sort by, row HTML]
+        match = self.ROW_REGEX.match(row)
+        rows = match.group("rows")
+        result_row = rows[: rows.find("</tr>")]
+        keys = [
+            unescape(self.TAG_REGEX.sub("", cell)).strip()
+            for cell in self.CELL_REGEX.findall(result_row)
+        ]
+        # escape "<" so that the data cannot end the script element it is in
+        return json.dumps([match.group("outcome"), keys, rows]).replace("<", "\\u003c")
 
     def append_passed(self, report):
         if report.when == "call":
@@ -345,17 +474,174 @@ class HTMLReport(object):
         self.rerun += 1
         self._appendrow("Rerun", report)
 
-    def _generate_report(self, session):
-        suite_stop_time = time.time()
-        suite_time_delta = suite_stop_time - self.suite_start_time
-        numtests = self.passed + self.failed + self.xpassed + self.xfailed
-        generated = datetime.datetime.now()
+    def _open_json_results(self, config):
+        """Open the NDJSON file of the results, written as the tests finish.
+
+        Each test is written as one JSON object per line once it is torn
+        down, with its outcome and the duration of each phase, followed by a
+        line summarizing the session once it finishes.
+        """
+        path = config.getoption("html_json", None)
+        if not path:
+            return None
+        path = os.path.abspath(os.path.expanduser(os.path.expandvars(path)))
+        dir_name = os.path.dirname(path)
+        if not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        return open(path, "w", encoding="utf-8")
+
+    def _add_json_outcome(self, outcome, report):
+        outcome = outcome.lower()
+        if getattr(report, "when", "collect") == "collect":
+            # collection errors have no phases
+            self._write_json_result(
+                {"type": "test", "nodeid": report.nodeid, "outcome": outcome}
+            )
+            return
+        result = self._json_tests.setdefault(report.nodeid, {"durations": {}})
+        order = [name.lower() for name in self.TestResult.OUTCOME_ORDER]
+        # the first outcome in the sort order wins, e.g. an error in teardown
+        # over a failed call
+        if "outcome" not in result or order.index(outcome) < order.index(
+            result["outcome"]
+        ):
+            result["outcome"] = outcome
+
+    def _add_json_phase(self, report):
+        result = self._json_tests.setdefault(report.nodeid, {"durations": {}})
+        result["durations"][report.when] = report.duration
+        if report.when != "teardown":
+            return
+        del self._json_tests[report.nodeid]
+        record = {
+            "type": "test",
+            "nodeid": report.nodeid,
+            "outcome": result.get("outcome", "passed"),
+            "durations": result["durations"],
+            "duration": sum(result["durations"].values()),
+        }
+        record.update(self._get_json_details(report.nodeid))
+        self._write_json_result(record)
+
+    def _get_json_details(self, nodeid):
+        """Return the additional data of the JSON record of a test."""
+        return {}
+
+    def _write_json_result(self, record):
+        if self.live is not None:
+            self.live.publish(live.TEST, record)
+        if self.json_results is None:
+            return
+        line = json.dumps(record, default=str)
+        if not isinstance(line, type(u"")):
+            line = line.decode("utf-8")
+        self.json_results.write(line + u"\n")
+        # tools may be reading the results while the session runs
+        self.json_results.flush()
+
+    def _close_json_results(self):
+        if self.json_results is None and self.live is None:
+            return
+        self._write_json_result(self._get_results_summary())
+        if self.json_results is not None:
+            self.json_results.close()
+            self.json_results = None
+
+    def _get_results_summary(self):
+        return {
+            "type": "summary",
+            "tests": self.passed + self.failed + self.xpassed + self.xfailed,
+            "passed": self.passed,
+            "failed": self.failed,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "xfailed": self.xfailed,
+            "xpassed": self.xpassed,
+            "rerun": self.rerun,
+            "duration": time.time() - self.suite_start_time,
+        }
+
+    def _start_live_server(self, session):
+        port = session.config.getoption("html_live", None)
+        if port is None:
+            return None
+        try:
+            server = live.LiveServer(
+                port,
+                self._generate_live_page(session),
+                self._serialize_live_update,
+                page_dir=os.path.dirname(self.logfile),
+                file_dirs=self._get_live_file_dirs(),
+            )
+        except EnvironmentError as err:
+            raise pytest.UsageError(
+                "--html-live: cannot serve on port {0}: {1}".format(port, err)
+            )
+        terminalreporter = session.config.pluginmanager.getplugin("terminalreporter")
+        if terminalreporter is not None:
+            terminalreporter.write_line("live html report: {0}".format(server.url))
+        return server
+
+    def _get_live_file_dirs(self):
+        """Return the directories besides that of the report whose files the rows of the
+        live page may link to."""
+        return []
+
+    def _stop_live_server(self):
+        if self.live is None:
+            return
+        self.live.summary = dict(self._get_live_summary(), finished=True)
+        self.live.close()
+        self.live = None
+
+    def _get_live_summary(self):
+        return dict(self._get_results_summary(), report=self.logfile, finished=False)
+
+    def _serialize_live_update(self, kind, payload):
+        # run by the thread of the server, when the update is polled
+        if kind == live.ROW:
+            return self._row_to_json(self._get_live_row(payload.unicode(indent=2)))
+        text = json.dumps(payload, default=str)
+        if not isinstance(text, type(u"")):
+            text = text.decode("utf-8")
+        return text
+
+    def _get_live_row(self, row):
+        """Return the HTML of a row of the live page, given that of the report."""
+        return row
+
+    def _generate_live_page(self, session):
+        """Return the page served by --html-live, the results table of which is filled
+        in with the rows polled from the server as the tests finish, see init_live in
+        main.js.
+        """
+        body = html.body(
+            html.script(raw(self._get_main_js())),
+            html.h1("{0} (live)".format(os.path.basename(self.logfile))),
+            html.p("Waiting for the first results.", id="live-status"),
+            html.h2("Results"),
+            self._generate_results_table(self._generate_results_header(session), []),
+            html.script(
+                raw("[]"),
+                type="application/json",
+                id="results-data",
+                **{"data-live": "updates"}
+            ),
+            onLoad="init(); init_live()",
+        )
+        head = html.head(
+            html.meta(charset="utf-8"),
+            html.title("Test Report (live)"),
+            html.style(raw(self._get_style_css())),
+        )
+        return u"<!DOCTYPE html>\n{0}".format(html.html(head, body).unicode(indent=2))
 
-        self.style_css = pkg_resources.resource_string(
+    def _get_style_css(self):
+        style_css = pkg_resources.resource_string(
             __name__, os.path.join("resources", "style.css")
         )
         if PY3:
-            self.style_css = self.style_css.decode("utf-8")
+            style_css = style_css.decode("utf-8")
 
         if ANSI:
             ansi_css = [
@@ -364,16 +650,68 @@ class HTMLReport(object):
                 " ******************************/\n",
             ]
             ansi_css.extend([str(r) for r in style.get_styles()])
-            self.style_css += "\n".join(ansi_css)
+            style_css += "\n".join(ansi_css)
 
         # <DF> Add user-provided CSS
         for path in self.config.getoption("css"):
-            self.style_css += "\n/******************************"
-            self.style_css += "\n * CUSTOM CSS"
-            self.style_css += "\n * {}".format(path)
-            self.style_css += "\n ******************************/\n\n"
+            style_css += "\n/******************************"
+            style_css += "\n * CUSTOM CSS"
+            style_css += "\n * {}".format(path)
+            style_css += "\n ******************************/\n\n"
             with open(path, "r") as f:
-                self.style_css += f.read()
+                style_css += f.read()
+        return style_css
+
+    @staticmethod
+    def _get_main_js():
+        main_js = pkg_resources.resource_string(
+            __name__, os.path.join("resources", "main.js")
+        )
+        if PY3:
+            main_js = main_js.decode("utf-8")
+        return main_js
+
+    @staticmethod
+    def _generate_results_header(session):
+        cells = [
+            html.th("Result", class_="sortable result initial-sort", col="result"),
+            html.th("Test", class_="sortable", col="name"),
+            html.th("Duration", class_="sortable numeric", col="duration"),
+            html.th("Links"),
+        ]
+        session.config.hook.pytest_html_results_table_header(cells=cells)
+        return cells
+
+    @staticmethod
+    def _generate_results_table(cells, rows):
+        return html.table(
+            [
+                html.thead(
+                    html.tr(cells),
+                    html.tr(
+                        [
+                            html.th(
+                                "No results found. Try to check the filters",
+                                colspan=len(cells),
+                            )
+                        ],
+                        id="not-found-message",
+                        hidden="true",
+                    ),
+                    id="results-table-head",
+                ),
+                rows,
+            ],
+            id="results-table",
+        )
+
+    def _generate_report(self, session):
+        suite_stop_time = time.time()
+        suite_time_delta = suite_stop_time - self.suite_start_time
+        numtests = self.passed + self.failed + self.xpassed + self.xfailed
+        generated = datetime.datetime.now()
+
+        self.style_css = self._get_style_css()
 
         css_href = "{0}/{1}".format("assets", "style.css")
         html_css = html.link(href=css_href, rel="stylesheet", type="text/css")
@@ -446,46 +784,28 @@ class HTMLReport(object):
             if i < len(outcomes):
                 summary.append(", ")
 
-        cells = [
-            html.th("Result", class_="sortable result initial-sort", col="result"),
-            html.th("Test", class_="sortable", col="name"),
-            html.th("Duration", class_="sortable numeric", col="duration"),
-            html.th("Links"),
-        ]
-        session.config.hook.pytest_html_results_table_header(cells=cells)
+        cells = self._generate_results_header(session)
 
-        results = [
-            html.h2("Results"),
-            html.table(
-                [
-                    html.thead(
-                        html.tr(cells),
-                        html.tr(
-                            [
-                                html.th(
-                                    "No results found. Try to check the filters",
-                                    colspan=len(cells),
-                                )
-                            ],
-                            id="not-found-message",
-                            hidden="true",
-                        ),
-                        id="results-table-head",
-                    ),
-                    self.test_logs,
-                ],
-                id="results-table",
-            ),
-        ]
-
-        main_js = pkg_resources.resource_string(
-            __name__, os.path.join("resources", "main.js")
-        )
-        if PY3:
-            main_js = main_js.decode("utf-8")
+        if self.virtual_table:
+            # the rows are added as JSON data by _save_report
+            rows = []
+        elif self.streaming:
+            rows = raw(self.RESULTS_MARKER)
+        else:
+            rows = self._result_rows()
+
+        results = [html.h2("Results"), self._generate_results_table(cells, rows)]
+        if self.virtual_table:
+            results.append(
+                html.script(
+                    raw("[{0}]".format(self.RESULTS_MARKER)),
+                    type="application/json",
+                    id="results-data",
+                )
+            )
 
         body = html.body(
-            html.script(raw(main_js)),
+            html.script(raw(self._get_main_js())),
             html.h1(os.path.basename(self.logfile)),
             html.p(
                 "Report generated on {0} at {1} by ".format(
@@ -549,7 +869,17 @@ class HTMLReport(object):
             os.makedirs(assets_dir)
 
         with open(self.logfile, "w", encoding="utf-8") as f:
-            f.write(report_content)
+            if self.streaming or self.virtual_table:
+                head, tail = report_content.split(self.RESULTS_MARKER, 1)
+                f.write(head)
+                for index, row in enumerate(self._iter_result_rows()):
+                    if self.virtual_table:
+                        f.write((",\n" if index else "") + self._row_to_json(row))
+                    else:
+                        f.write(row)
+                f.write(tail)
+            else:
+                f.write(report_content)
         if not self.self_contained:
             style_path = os.path.join(assets_dir, "style.css")
             with open(style_path, "w", encoding="utf-8") as f:
@@ -564,6 +894,8 @@ class HTMLReport(object):
             self.append_skipped(report)
         else:
             self.append_other(report)
+        if self.json_results is not None or self.live is not None:
+            self._add_json_phase(report)
 
     def pytest_collectreport(self, report):
         if report.failed:
@@ -571,10 +903,13 @@ class HTMLReport(object):
 
     def pytest_sessionstart(self, session):
         self.suite_start_time = time.time()
+        self.live = self._start_live_server(session)
 
     def pytest_sessionfinish(self, session):
+        self._close_json_results()
         report_content = self._generate_report(session)
         self._save_report(report_content)
+        self._stop_live_server()
 
     def pytest_terminal_summary(self, terminalreporter):
         terminalreporter.write_sep(
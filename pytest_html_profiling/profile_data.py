@@ -0,0 +1,297 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import fnmatch
+import heapq
+import marshal
+import os
+import pstats
+import zlib
+from base64 import b64decode, b64encode
+from collections import Counter, defaultdict
+
+import gprof2dot
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# index of the internal and cumulative time in the statistics of a function, by pstats
+# sort key
+SORT_INDEX = {'time': 2, 'cumulative': 3}
+
+
+class ProfileData(object):
+    """Structured, in-memory profile of a single test.
+
+    Wraps the raw statistics of a cProfile.Profile (or a StackSampler), i.e.
+    a dict mapping (filename, line, function name) keys to (primitive calls,
+    total calls, internal time, cumulative time, callers) tuples. The
+    statistics reports and call graphs of a test are all derived from one
+    instance, without dumping the profile to disk and parsing it again.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self._pstats = None
+        self._names = None
+        self._callees = None
+
+    @classmethod
+    def from_profiler(cls, prof):
+        prof.create_stats()
+        return cls(prof.stats)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(marshal.load(f))
+
+    def dump(self, path):
+        with open(path, 'wb') as f:
+            marshal.dump(self.stats, f)
+
+    def serialize(self):
+        """Return the statistics as a compact ASCII string, e.g. for another process."""
+        return b64encode(zlib.compress(marshal.dumps(self.stats))).decode('ascii')
+
+    @classmethod
+    def deserialize(cls, data):
+        return cls(marshal.loads(zlib.decompress(b64decode(data))))
+
+    @property
+    def total_calls(self):
+        return sum(nc for cc, nc, tt, ct, callers in self.stats.values())
+
+    @property
+    def total_time(self):
+        return sum(tt for cc, nc, tt, ct, callers in self.stats.values())
+
+    @property
+    def max_cumulative_time(self):
+        return max([ct for cc, nc, tt, ct, callers in self.stats.values()] + [0.0])
+
+    def format_stats(self, sort_key, limit=0):
+        """Return the output of pstats.Stats.print_stats, sorted by the given key.
+
+        Only the first limit functions are printed, unless limit is 0.
+        """
+        out = StringIO()
+        if self._pstats is None:
+            self._pstats = pstats.Stats(StatsSource(self.stats))
+        self._pstats.stream = out
+        self._pstats.sort_stats(sort_key)
+        self._pstats.print_stats(*([limit] if limit else []))
+        return out.getvalue()
+
+    def top_functions(self, sort_key, limit=0):
+        """Return the keys of the functions sorted by internal or cumulative time.
+
+        All functions are returned, unless limit is not 0.
+        """
+        index = SORT_INDEX[sort_key]
+        keys = sorted(self.stats, key=lambda key: self.stats[key][index], reverse=True)
+        return keys[:limit] if limit else keys
+
+    def rooted_at(self, root):
+        """Return the profile of the given function and the functions it called, e.g. to
+        leave out the frames of the test harness calling a test function.
+
+        The statistics of a function that was also called by functions left
+        out are recomputed from the calls made by the functions kept. The
+        profile is returned as is if it does not contain the function.
+        """
+        if root not in self.stats:
+            return self
+        keys = self.reachable_from([root])
+        stats = {}
+        for key in keys:
+            cc, nc, tt, ct, callers = self.stats[key]
+            kept = dict((caller, value) for caller, value in callers.items()
+                        if caller in keys)
+            if key != root and len(kept) < len(callers) and all(
+                    isinstance(value, tuple) for value in kept.values()):
+                cc, nc, tt, ct = [sum(value[i] for value in kept.values())
+                                  for i in range(4)]
+            stats[key] = (cc, nc, tt, ct, kept)
+        return ProfileData(stats)
+
+    def restrict(self, include=(), exclude=()):
+        """Return the profile of the functions whose file matches any of the include
+        patterns, if given, and none of the exclude patterns, matched with fnmatch."""
+        def matches(filename, patterns):
+            return any(fnmatch.fnmatch(filename, pattern) for pattern in patterns)
+
+        return ProfileData(dict(
+            (key, stats) for key, stats in self.stats.items()
+            if (not include or matches(key[0], include)) and
+            not matches(key[0], exclude)))
+
+    def function_name(self, key):
+        """Return the name gprof2dot gives to a function, i.e. 'module:line:name'."""
+        if self._names is None:
+            self._names = {}
+        try:
+            return self._names[key]
+        except KeyError:
+            filename, line, name = key
+            module = os.path.splitext(os.path.basename(filename))[0]
+            self._names[key] = '%s:%d:%s' % (module, line, name)
+            return self._names[key]
+
+    def find_functions(self, name_suffix):
+        return [key for key in self.stats
+                if self.function_name(key).endswith(name_suffix)]
+
+    def callees(self):
+        if self._callees is None:
+            self._callees = dict((key, set()) for key in self.stats)
+            for key, (cc, nc, tt, ct, callers) in self.stats.items():
+                for caller in callers:
+                    self._callees.setdefault(caller, set()).add(key)
+        return self._callees
+
+    def reachable_from(self, roots):
+        callees = self.callees()
+        visited = set()
+        frontier = list(roots)
+        while frontier:
+            key = frontier.pop()
+            if key not in visited:
+                visited.add(key)
+                frontier.extend(callees.get(key, ()))
+        return visited
+
+    def call_graph(self, roots=None):
+        """Return the call graph as plain lists, from the roots if given.
+
+        Only the functions reachable from the roots are included. Each node is
+        a [name, filename, calls, internal time, cumulative time] list and each
+        edge a [caller index, callee index, calls, cumulative time] list, so
+        that the graph can be serialized compactly as JSON.
+        """
+        keys = sorted(self.reachable_from(roots) if roots else self.stats)
+        index = dict((key, i) for i, key in enumerate(keys))
+        nodes = []
+        edges = []
+        for key in keys:
+            cc, nc, tt, ct, callers = self.stats.get(key, (0, 0, 0.0, 0.0, {}))
+            nodes.append([self.function_name(key), key[0], nc, tt, ct])
+            for caller_key, value in callers.items():
+                if caller_key in index:
+                    if isinstance(value, tuple):
+                        calls, time = value[1], value[3]
+                    else:
+                        calls, time = value, ct
+                    edges.append([index[caller_key], index[key], calls, time])
+        return {'total_time': self.max_cumulative_time, 'nodes': nodes, 'edges': edges}
+
+    def to_gprof2dot(self, roots=None):
+        """Build a gprof2dot profile, restricted to the functions reachable from roots.
+
+        This is equivalent to parsing the statistics with gprof2dot.PstatsParser
+        and calling prune_root on the result, but builds the graph straight
+        from the in-memory statistics. The time ratios stay relative to the
+        whole profile, as with prune_root.
+        """
+        keys = self.reachable_from(roots) if roots else set(self.stats)
+        profile = gprof2dot.Profile()
+        profile[gprof2dot.TIME] = self.total_time
+        profile[gprof2dot.TOTAL_TIME] = self.max_cumulative_time
+
+        functions = {}
+        for index, key in enumerate(sorted(keys)):
+            function = gprof2dot.Function(index, self.function_name(key))
+            function.filename = key[0]
+            functions[key] = function
+            profile.add_function(function)
+
+        for key in keys:
+            cc, nc, tt, ct, callers = self.stats.get(key, (0, 0, 0.0, 0.0, {}))
+            callee = functions[key]
+            callee.called = nc
+            callee[gprof2dot.TOTAL_TIME] = ct
+            callee[gprof2dot.TIME] = tt
+            for caller_key, value in callers.items():
+                if caller_key not in functions:
+                    continue
+                call = gprof2dot.Call(callee.id)
+                if isinstance(value, tuple):
+                    call[gprof2dot.CALLS] = value[1]
+                    call[gprof2dot.TOTAL_TIME] = value[3]
+                else:
+                    call[gprof2dot.CALLS] = value
+                    call[gprof2dot.TOTAL_TIME] = gprof2dot.ratio(value, nc) * ct
+                functions[caller_key].add_call(call)
+
+        profile.validate()
+        profile.ratio(gprof2dot.TIME_RATIO, gprof2dot.TIME)
+        profile.ratio(gprof2dot.TOTAL_TIME_RATIO, gprof2dot.TOTAL_TIME)
+        return profile
+
+
+class SessionProfile(object):
+    """Aggregate of the profiles of all tests of a session.
+
+    The statistics of each test are merged in as it finishes, the same way
+    as pstats.Stats.add does. For each function, the number of tests that
+    called it is counted and only the max_tests tests that spent the most
+    cumulative time in it are kept, so memory does not grow with the number
+    of tests.
+    """
+
+    def __init__(self, max_tests=10):
+        self.stats = {}
+        self.num_tests = 0
+        self.test_counts = Counter()
+        self.max_tests = max_tests
+        self._top_tests = defaultdict(list)
+
+    def add(self, nodeid, data):
+        self.num_tests += 1
+        for func, func_stats in data.stats.items():
+            if func in self.stats:
+                self.stats[func] = pstats.add_func_stats(self.stats[func], func_stats)
+            else:
+                cc, nc, tt, ct, callers = func_stats
+                self.stats[func] = (cc, nc, tt, ct, dict(callers))
+            self.test_counts[func] += 1
+            heap = self._top_tests[func]
+            if len(heap) < self.max_tests:
+                heapq.heappush(heap, (func_stats[3], nodeid))
+            elif func_stats[3] > heap[0][0]:
+                heapq.heapreplace(heap, (func_stats[3], nodeid))
+
+    def top_tests(self, func):
+        """Return the node ids of the tests that spent the most time in func."""
+        return [nodeid for _, nodeid in sorted(self._top_tests[func], reverse=True)]
+
+    def hotspots(self, sort_key, limit):
+        """Return the keys of the limit functions with the highest time by sort_key."""
+        index = SORT_INDEX[sort_key]
+        return sorted(self.stats, key=lambda func: self.stats[func][index],
+                      reverse=True)[:limit]
+
+    def to_profile_data(self):
+        return ProfileData(self.stats)
+
+
+class StatsSource(object):
+    """Wraps raw profile statistics so that they can be loaded by pstats.Stats.
+
+    pstats.Stats (and thus gprof2dot.PstatsParser) accepts any object with a
+    create_stats method and a stats attribute, and empties the stats
+    attribute once loaded, so create_stats hands out a fresh copy on every
+    load.
+    """
+
+    def __init__(self, stats):
+        self._stats = stats
+        self.stats = {}
+
+    def create_stats(self):
+        self.stats = dict(self._stats)
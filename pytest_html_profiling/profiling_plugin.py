@@ -5,17 +5,28 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 import cProfile
-import cgi
 import datetime
 import errno
+import hashlib
+import io
+import json
+import marshal
+import mimetypes
 import os
 import pstats
+import re
 import sys
-from collections import defaultdict
+import time
+import timeit
+import zlib
+from base64 import b64decode, b64encode
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 import gprof2dot
 import pygraphviz
 import pytest
+from py.xml import html, raw
 
 try:
     from StringIO import StringIO
@@ -23,7 +34,10 @@ except ImportError:
     from io import StringIO
 
 import pytest_html_profiling.plugin as plugin
-from .plugin import HTMLReport
+from . import __version__, budget, cache, export, flamegraph, history, memory, sampling
+from .plugin import HTMLReport, escape, is_xdist_worker
+from .profile_data import ProfileData, SessionProfile
+from .store import ProfileStore
 
 
 def pytest_addhooks(pluginmanager):
@@ -42,6 +56,22 @@ def pytest_addoption(parser):
                     help="Adds call graph visualizations based on the profiling to the "
                           "HTML file for each test.")
 
+    group.addoption("--html-call-graph-format", action="store", default='png',
+                    choices=['png', 'json'], dest='call_graph_format',
+                    help="Format of the call graphs added by --html-call-graph. 'png' "
+                         "renders three pruned variants of each graph with Graphviz, "
+                         "'json' embeds the graph data in the report, to be rendered "
+                         "by an interactive viewer in the browser with adjustable "
+                         "pruning thresholds. Default value: png.")
+
+    group.addoption("--html-flame-graph", action="store_true", default=False,
+                    dest='flame_graph',
+                    help="Adds an interactive flame graph of each test, and of the "
+                         "whole session to the 'Suite hotspots' section, to the HTML "
+                         "file. The stacks are those sampled by the 'sampling' "
+                         "profiler, or are reconstructed from the calls between "
+                         "functions recorded by cProfile.")
+
     group.addoption("--html-profile-dir", action="store",
                           default=os.environ.get('PYTEST_HTML_PROFILE_DIR', 'pytest_profiles'),
                           dest="profile_dir",
@@ -52,9 +82,151 @@ def pytest_addoption(parser):
                                "Default value: profile_dir. Can also be specified in the "
                                "environment variable PYTEST_HTML_PROFILE_DIR.")
 
+    group.addoption("--html-profile-deferred", action="store_true", default=False,
+                    dest='profile_deferred',
+                    help="Only dump the profile of each test during the run, and "
+                         "generate the statistics and call graphs in a pool of worker "
+                         "processes in the background. The results are collected "
+                         "before the HTML file is written.")
+
+    group.addoption("--html-profile-workers", action="store", type=int, default=None,
+                    dest='profile_workers', metavar="N",
+                    help="Number of worker processes used by --html-profile-deferred. "
+                         "Default value: the number of processors on the machine.")
+
+    group.addoption("--html-profiler", action="store", default='cprofile',
+                    choices=['cprofile', 'sampling'], dest='profiler',
+                    help="Profiler used for --html-profiling. 'cprofile' traces every "
+                         "function call, 'sampling' periodically samples the stack of "
+                         "the test, which adds much less overhead to call-heavy tests. "
+                         "Default value: cprofile.")
+
+    group.addoption("--html-sampling-interval", action="store", type=float,
+                    default=0.001, dest='sampling_interval', metavar="SECONDS",
+                    help="CPU time between two stack samples of the 'sampling' "
+                         "profiler. Default value: 0.001.")
+
+    group.addoption("--html-profile-store", action="store_true", default=False,
+                    dest='profile_store',
+                    help="Store the profiles and call graphs of all tests in a single "
+                         "SQLite file per session in the profile directory, keyed by "
+                         "test node id, instead of in one directory per test.")
+
+    group.addoption("--html-profile-hotspots", action="store", type=int, default=20,
+                    dest='profile_hotspots', metavar="N",
+                    help="Number of functions listed in the 'Suite hotspots' section "
+                         "of the report, which aggregates the profiles of all tests of "
+                         "the session. 0 disables the section. Default value: 20.")
+
+    group.addoption("--html-profile-phases", action="store_true", default=False,
+                    dest='profile_phases',
+                    help="Also profile the setup and teardown phases of each test, "
+                         "time the setup of each fixture, and add a table of the total "
+                         "and amortized setup cost of each fixture to the report.")
+
+    group.addoption("--html-memory-profiling", action="store_true", default=False,
+                    dest='memory_profiling',
+                    help="Trace the memory allocated by each test phase with "
+                         "tracemalloc, and add the peak and net growth of the traced "
+                         "memory and the top allocation sites to the report HTML file.")
+
+    group.addoption("--html-profile-lazy", action="store_true", default=False,
+                    dest='profile_lazy',
+                    help="Load the profiling reports and call graphs of a test only "
+                         "when they are opened in the report, from one script file per "
+                         "report in the profile directory, or from compressed data "
+                         "embedded in the report HTML file with --self-contained-html "
+                         "or --html-profile-store.")
+
+    group.addoption("--html-profile-top", action="store", type=int, default=0,
+                    dest='profile_top', metavar="N",
+                    help="Only list the N functions with the highest internal or "
+                         "cumulative time in the profiling reports. 0 lists all "
+                         "functions, which is the default.")
+
+    group.addoption("--html-profile-include", action="append", default=None,
+                    dest='profile_include', metavar="GLOB",
+                    help="Only list the functions defined in files matching the given "
+                         "fnmatch-style pattern in the profiling reports, e.g. "
+                         "'*/src/*'. May be given multiple times. The call graphs are "
+                         "not affected.")
+
+    group.addoption("--html-profile-exclude", action="append", default=None,
+                    dest='profile_exclude', metavar="GLOB",
+                    help="Leave out the functions defined in files matching the given "
+                         "fnmatch-style pattern from the profiling reports, e.g. "
+                         "'*/_pytest/*' or '*/pluggy/*'. May be given multiple times. "
+                         "The call graphs are not affected.")
+
+    group.addoption("--html-profile-table", action="store_true", default=False,
+                    dest='profile_table',
+                    help="Render the profiling reports as sortable tables instead of "
+                         "the text output of pstats.")
+
+    group.addoption("--html-profile-history", action="store_true", default=False,
+                    dest='profile_history',
+                    help="Record the duration, total calls, cumulative time and most "
+                         "costly functions of each test in the history file of the "
+                         "profile directory, to compare later sessions with, see "
+                         "--html-profile-baseline.")
+
+    group.addoption("--html-profile-baseline", action="store", default=None,
+                    dest='profile_baseline', metavar="SESSION",
+                    help="Compare the profile of each test with the one recorded in "
+                         "the given session of the profile history, named after its "
+                         "start time, e.g. 2019_08_06_12_00_00, or with the last "
+                         "recorded session if 'last'. The report gets a column with "
+                         "the change in cumulative time and a list of the tests that "
+                         "regressed.")
+
+    group.addoption("--html-profile-regression-threshold", action="store", type=float,
+                    default=20.0, dest='regression_threshold', metavar="PERCENT",
+                    help="Increase in cumulative time or total calls over the "
+                         "baseline, in percent, beyond which a test is reported as "
+                         "regressed. Default value: 20.")
+
+    group.addoption("--html-profile-regression-min-time", action="store", type=float,
+                    default=0.005, dest='regression_min_time', metavar="SECONDS",
+                    help="Increase in cumulative time over the baseline, in seconds, "
+                         "below which a test is not reported as regressed in time, "
+                         "whatever the relative increase, so that the timer noise of "
+                         "short tests is not reported. Default value: 0.005.")
+
+    group.addoption("--html-profile-export", action="append", default=None,
+                    choices=export.FORMATS, dest='profile_export', metavar="FORMAT",
+                    help="Also write the profile of each test and of the session in "
+                         "the given format, 'speedscope' for "
+                         "https://www.speedscope.app, 'chrome' for the trace event "
+                         "format of chrome://tracing and Perfetto, or 'callgrind' for "
+                         "KCachegrind. With 'chrome', the timeline of the tests of the "
+                         "session and their phases is written too. May be given "
+                         "multiple times.")
+
+    group.addoption("--html-profile-cache", action="store_true", default=False,
+                    dest='profile_cache',
+                    help="Cache the profile of each test and its reports and call "
+                         "graphs in the profile directory, and reuse them in later "
+                         "sessions instead of profiling the test again, as long as the "
+                         "files its profile ran code of and the profiling options are "
+                         "unchanged. Not used by pytest-xdist workers.")
+
+
+def pytest_cmdline_main(config):
+    plugin.pytest_cmdline_main(config)
+
 
 def pytest_configure(config):
+    config.addinivalue_line('markers', budget.MARKER_HELP)
     profiling = config.getoption('html_profiling')
+    sampling_profiler = config.getoption('profiler') == 'sampling'
+    if profiling and sampling_profiler and not sampling.is_supported():
+        raise pytest.UsageError("--html-profiler=sampling requires signal.setitimer, "
+                                "which is not available on this platform.")
+    if config.getoption('memory_profiling'):
+        if not memory.is_supported():
+            raise pytest.UsageError("--html-memory-profiling requires tracemalloc, "
+                                    "which is not available on this Python version.")
+        profiling = True
     if profiling:
         config.reportCls = ProfilingHTMLReport
     else:
@@ -64,12 +236,35 @@ def pytest_configure(config):
     config._html = None
     plugin.pytest_configure(config)
 
+    htmlpath = config.getoption('htmlpath')
+    if profiling and htmlpath and is_xdist_worker(config):
+        # the report is only written by the controller, the tests are profiled on the
+        # workers
+        config._html_profiling_worker = ProfilingWorker(htmlpath, config)
+        config.pluginmanager.register(config._html_profiling_worker)
+
+
+def pytest_unconfigure(config):
+    worker = getattr(config, '_html_profiling_worker', None)
+    if worker:
+        del config._html_profiling_worker
+        config.pluginmanager.unregister(worker)
+    plugin.pytest_unconfigure(config)
+
 
 class ProfilingHTMLReport(HTMLReport):
     STATS_FILENAME = 'test.cprof'
+    FOLDED_FILENAME = 'test.folded'
+    STORE_SUFFIX = '.sqlite'
+    MANIFEST_SUFFIX = '.manifest.jsonl'
+    TRACE_SUFFIX = '.trace.json'
+    EXPORT_LINK = {export.SPEEDSCOPE: 'speedscope profile',
+                   export.CHROME: 'Chrome trace',
+                   export.CALLGRIND: 'Callgrind profile'}
     PROFILE_DIRNAME = 'results_profiles'
     DOT_SUFFIX = '.dot'
     GRAPH_SUFFIX = '.png'
+    JSON_SUFFIX = '.json'
 
     CUMULATIVE = 'cumulative'
     INTERNAL = 'time'
@@ -83,13 +278,20 @@ class ProfilingHTMLReport(HTMLReport):
     PRUNED_CUMULATIVE = 'pruned_cumulative'
     PRUNED_INTERNAL = 'pruned_internal'
     NON_PRUNED = 'non_pruned'
+    INTERACTIVE = 'interactive'
+    FLAME = 'flame'
 
     CALLGRAPH_NAME = {PRUNED_CUMULATIVE: 'call_graph_pruned_cumulative',
                       PRUNED_INTERNAL: 'call_graph_pruned_internal',
-                      NON_PRUNED: 'call_graph_non_pruned'}
-    CALLGRAPH_TITLE = {PRUNED_CUMULATIVE: 'Call-graph (pruned, colored by cumulative time)',
-                       PRUNED_INTERNAL: 'Call-graph (pruned, colored by internal time)',
-                       NON_PRUNED: 'Call-graph (not pruned, colored by cumulative time)'}
+                      NON_PRUNED: 'call_graph_non_pruned',
+                      INTERACTIVE: 'call_graph',
+                      FLAME: 'flame_graph'}
+    CALLGRAPH_TITLE = {
+        PRUNED_CUMULATIVE: 'Call-graph (pruned, colored by cumulative time)',
+        PRUNED_INTERNAL: 'Call-graph (pruned, colored by internal time)',
+        NON_PRUNED: 'Call-graph (not pruned, colored by cumulative time)',
+        INTERACTIVE: 'Call-graph (interactive)',
+        FLAME: 'Flame graph'}
 
     LINK_TEMPLATE = """
             <a onfocus="this.blur();" href="javascript:toggle_collapsed(\'{0}\')">{1}</a>
@@ -105,10 +307,63 @@ class ProfilingHTMLReport(HTMLReport):
             
             """
 
+    SETUP = 'setup'
+    TEARDOWN = 'teardown'
+    PHASES = [SETUP, TEARDOWN]
+    PHASE_HEADER = '--- {0} PROFILE (SORTED BY CUMULATIVE TIME)---\n'
+    PHASE_LINK = {SETUP: 'Setup profile (cumulative time)',
+                  TEARDOWN: 'Teardown profile (cumulative time)'}
+
+    MEMORY = 'memory'
+    MEMORY_PEAK = 'memory_peak'
+    MEMORY_HEADER = '--- MEMORY PROFILE ---\n'
+    MEMORY_FOOTER = '--- END MEMORY PROFILE ---'
+    MEMORY_LINK = 'Memory profile'
+    MEBIBYTE = 1024.0 * 1024.0
+
+    HISTORY_FILENAME = 'history.sqlite'
+    CACHE_FILENAME = 'profile_cache.sqlite'
+    REUSED_TEMPLATE = ('<p class="profile-reused">Profile reused from session {0}, the '
+                       'files it ran code of are unchanged.</p>')
+    ERROR_TEMPLATE = ('<p class="profile-error">The profile could not be processed: '
+                      '{0}</p>')
+    # number of functions listed in the JSON results, unless --html-profile-top is given
+    JSON_TOP_FUNCTIONS = 10
+    MAX_DELTA_FUNCTIONS = 5
+
+    SESSION_NAME = 'session'
+    SESSION_NODEID = '<session>'
+    UNSAFE_FILENAME_REGEX = re.compile(r'[^\w.\[\]-]')
+    MAX_DIRNAME_LENGTH = 64
+    MAX_HOTSPOT_TESTS = 10
+
+    LAZY_DIRNAME = 'extras'
+    LAZY_SUFFIX = '.js'
+    LAZY_TEMPLATE = ('<script type="application/octet-stream" class="lazy-extra">'
+                     '{0}</script>')
+    LAZY_SRC_TEMPLATE = ('<script type="application/octet-stream" class="lazy-extra" '
+                         'data-src="{0}"></script>')
+    LAZY_ASSET_TEMPLATE = 'load_extra_content({0}, {1});\n'
+
+    # key of the report extras generated from the profiles, left out of the manifest
+    PROFILING_EXTRA = 'profiling'
+
+    PLACEHOLDER_TEMPLATE = '<!-- pytest-html-profiling:{key}:{name} -->'
+    PLACEHOLDER_REGEX = re.compile(
+        r'<!-- pytest-html-profiling:(?P<key>\w+):(?P<name>.*?) -->')
+
     IMG_TEMPLATE = """
     <img src="{0}">
     """
 
+    VIEWER_TEMPLATE = """
+    <div class="call-graph-viewer"><script type="application/json">{0}</script></div>
+    """
+
+    FLAME_TEMPLATE = """
+    <div class="flame-graph-viewer"><script type="application/json">{0}</script></div>
+    """
+
     TEMPERATURE_COLORMAP = gprof2dot.Theme(
         mincolor=(2.0 / 3.0, 0.80, 0.25),  # dark blue
         maxcolor=(0.0, 1.0, 0.5),  # satured red
@@ -120,141 +375,1344 @@ class ProfilingHTMLReport(HTMLReport):
         super(ProfilingHTMLReport, self).__init__(logfile, config)
         self.profiling = config.getoption('html_profiling')
         self._call_graph = config.getoption('call_graph', False)
+        self._call_graph_format = config.getoption('call_graph_format', 'png')
+        self._flame_graph = config.getoption('flame_graph', False)
         self._profile_dir = config.getoption('profile_dir')
+        self._deferred = config.getoption('profile_deferred', False)
+        self._workers = config.getoption('profile_workers', None)
+        self._profiler = config.getoption('profiler', 'cprofile')
+        self._sampling_interval = config.getoption('sampling_interval', 0.001)
+        self._hotspots = config.getoption('profile_hotspots', 0)
+        self._profile_phases = (self.profiling and
+                                config.getoption('profile_phases', False))
+        self._memory_profiling = config.getoption('memory_profiling', False)
+        self._lazy = config.getoption('profile_lazy', False)
+        self._report_options = dict(
+            limit=config.getoption('profile_top', 0),
+            include=config.getoption('profile_include', None) or [],
+            exclude=config.getoption('profile_exclude', None) or [],
+            table=config.getoption('profile_table', False))
+        self._history = self.profiling and config.getoption('profile_history', False)
+        self._baseline = self.profiling and config.getoption('profile_baseline', None)
+        self._track_performance = bool(self._history or self._baseline)
+        self._regression_threshold = config.getoption('regression_threshold', 20.0)
+        self._regression_min_time = config.getoption('regression_min_time', 0.005)
+        self._exports = (self.profiling and config.getoption('profile_export', None) or
+                         [])
+        self._summarize = bool(config.getoption('html_json', None) or
+                               config.getoption('html_live', None) is not None)
         if not os.path.exists(self._profile_dir):
             os.makedirs(self._profile_dir)
         self.start_time = datetime.datetime.now()
+        self.session_name = self._get_session_name(config)
+        self.store = self._open_store(config)
+        self.history = self._open_history()
+        self.profile_cache = self._open_profile_cache(config)
+        self.manifest = self._open_manifest()
+        self.session_trace = self._open_session_trace()
+        self._trace_tracks = {}
+        self._trace_processes = {}
+        self.baseline_name, self.baseline = self._load_baseline()
+        self.performance = {}
+        self.budget_results = {}
         self.profs_results = defaultdict(dict)
         self.graph_results = defaultdict(dict)
+        self._executor = None
+        self._pending = {}
+        self.session_profile = SessionProfile(self.MAX_HOTSPOT_TESTS)
+        self.phase_results = defaultdict(dict)
+        self.fixture_setups = []
+        self.fixture_users = Counter()
+        self._phase_fixtures = []
+        self.memory_results = {}
+        self._memory_phases = defaultdict(list)
+        self.profile_summaries = {}
+        # session the profile of a test was reused from, by node id
+        self.reused_profiles = {}
+        # tests whose generated results are still to be cached
+        self._caching = set()
+
+    def _get_session_name(self, config):
+        """Return the name of the session, which its profile files are named after: by
+        default its start time."""
+        return self.start_time.strftime("%Y_%m_%d_%H_%M_%S")
+
+    def _open_store(self, config):
+        if self.profiling and config.getoption('profile_store', False):
+            return ProfileStore(self._get_store_filename())
+
+    def _open_manifest(self):
+        """Open the manifest that the report of the session can be rendered again from.
+
+        The manifest lists the test reports, serialized as for pytest-xdist,
+        without the extras generated from the profiles, one JSON object per
+        line. The first line names the session and the last one holds the
+        duration of the session and its environment.
+        """
+        serializable = getattr(self.config.hook, 'pytest_report_to_serializable', None)
+        if not self.profiling or serializable is None:
+            return None
+        manifest = io.open(self._get_manifest_filename(), 'w', encoding='utf-8')
+        manifest.write(self._to_manifest_line({'session': self.session_name,
+                                               'store': self.store is not None}))
+        return manifest
+
+    def _write_manifest(self, report):
+        if self.manifest is None:
+            return
+        data = self.config.hook.pytest_report_to_serializable(config=self.config,
+                                                              report=report)
+        if data.get('extra'):
+            data['extra'] = [extra for extra in data['extra']
+                             if not extra.get(self.PROFILING_EXTRA)]
+        entry = {'report': data}
+        if getattr(report, 'when', None) == 'call':
+            # the name of the profile directory of the test
+            entry['profile'] = self.get_test_dirname(report.nodeid)
+        self.manifest.write(self._to_manifest_line(entry))
+
+    def _close_manifest(self):
+        if self.manifest is None:
+            return
+        self.manifest.write(self._to_manifest_line({
+            'duration': time.time() - self.suite_start_time,
+            'metadata': getattr(self.config, '_metadata', None)}))
+        self.manifest.close()
+        self.manifest = None
+
+    @staticmethod
+    def _to_manifest_line(entry):
+        line = json.dumps(entry, default=str)
+        if not isinstance(line, type('')):
+            line = line.decode('utf-8')
+        return line + '\n'
+
+    def _open_session_trace(self):
+        """Open the timeline of the session in the Chrome trace event format, with a
+        track per test holding a span for the test and spans for its phases, and a
+        process per xdist worker."""
+        if export.CHROME in self._exports:
+            return export.TraceWriter(io.open(self._get_trace_filename(), 'w',
+                                              encoding='utf-8'))
+
+    def _trace_report(self, report):
+        if self.session_trace is None:
+            return
+        start = getattr(report, 'start', None)
+        if start is None:
+            start = time.time() - report.duration
+        start = (start - self.suite_start_time) * export.MICROSECONDS
+        duration = report.duration * export.MICROSECONDS
+        gateway = getattr(getattr(report, 'node', None), 'gateway', None)
+        worker = getattr(gateway, 'id', None)
+        if worker not in self._trace_processes:
+            pid = self._trace_processes[worker] = len(self._trace_processes)
+            self.session_trace.add({'ph': 'M', 'name': 'process_name', 'pid': pid,
+                                    'args': {'name': worker or 'pytest'}})
+        pid = self._trace_processes[worker]
+        if report.when == self.SETUP or report.nodeid not in self._trace_tracks:
+            tid = len(self._trace_tracks) + 1
+            self._trace_tracks[report.nodeid] = (tid, start)
+            self.session_trace.add({'ph': 'M', 'name': 'thread_name', 'pid': pid,
+                                    'tid': tid, 'args': {'name': report.nodeid}})
+        tid, test_start = self._trace_tracks[report.nodeid]
+        self.session_trace.add({'ph': 'X', 'name': report.when, 'cat': 'phase',
+                                'pid': pid, 'tid': tid, 'ts': start, 'dur': duration,
+                                'args': {'outcome': report.outcome}})
+        if report.when == self.TEARDOWN:
+            self.session_trace.add({'ph': 'X', 'name': report.nodeid, 'cat': 'test',
+                                    'pid': pid, 'tid': tid, 'ts': test_start,
+                                    'dur': start + duration - test_start})
+
+    def _close_session_trace(self):
+        if self.session_trace is not None:
+            self.session_trace.close()
+            self.session_trace.file.close()
+            self.session_trace = None
+
+    def _open_history(self):
+        if self._track_performance:
+            return history.ProfileHistory(
+                os.path.join(self._profile_dir, self.HISTORY_FILENAME))
+
+    def _open_profile_cache(self, config):
+        if not self.profiling or not config.getoption('profile_cache', False):
+            return None
+        # the cached results are only valid for the same options
+        options = json.dumps([__version__, sys.version, self._profiler,
+                              self._get_sampling_interval(),
+                              self._get_graph_variants(),
+                              sorted(self._report_options.items()), self._exports,
+                              self.store is not None])
+        return cache.ProfileCache(os.path.join(self._profile_dir, self.CACHE_FILENAME),
+                                  options)
+
+    def _load_baseline(self):
+        if self.history is None or not self._baseline:
+            return None, None
+        # sampled counts and times are not comparable with those of cProfile, nor
+        # with those sampled at another interval
+        profiler = (self._profiler, self._get_sampling_interval())
+        name = self._baseline
+        if name == history.LAST:
+            name = self.history.last_run(*profiler)
+        if name is None:
+            # nothing recorded yet, e.g. on the first session
+            return None, None
+        try:
+            baseline_profiler = self.history.get_profiler(name)
+        except KeyError:
+            raise pytest.UsageError(
+                "--html-profile-baseline: no session {0} in the profile history "
+                "{1}".format(name, self.history.path))
+        if baseline_profiler != profiler:
+            raise pytest.UsageError(
+                "--html-profile-baseline: session {0} was not profiled with {1}".format(
+                    name, self._describe_profiler()))
+        return name, self.history.get_run(name)
+
+    def _get_sampling_interval(self):
+        return self._sampling_interval if self._profiler == 'sampling' else None
+
+    def _describe_profiler(self):
+        if self._profiler == 'sampling':
+            return '--html-profiler=sampling --html-sampling-interval={0:g}'.format(
+                self._sampling_interval)
+        return '--html-profiler={0}'.format(self._profiler)
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_configure_node(self, node):
+        # make the xdist workers store their profiles in the directory of this session
+        workerinput = getattr(node, 'workerinput', None)
+        if workerinput is None:
+            workerinput = node.slaveinput
+        workerinput['html_profile_session'] = self.session_name
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_setup(self, item):
+        tracer = self._start_memory_tracer()
+        if not self._profile_phases:
+            yield
+            self._stop_memory_tracer(item.nodeid, self.SETUP, tracer)
+        else:
+            self.fixture_users.update(item.fixturenames)
+            prof = self._create_profiler()
+            prof.enable()
+            yield
+            prof.disable()
+            self._stop_memory_tracer(item.nodeid, self.SETUP, tracer)
+            self._handle_phase_profile(item.nodeid, self.SETUP, prof)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_teardown(self, item):
+        tracer = self._start_memory_tracer()
+        if not self._profile_phases:
+            yield
+            self._stop_memory_tracer(item.nodeid, self.TEARDOWN, tracer)
+        else:
+            prof = self._create_profiler()
+            prof.enable()
+            yield
+            prof.disable()
+            self._stop_memory_tracer(item.nodeid, self.TEARDOWN, tracer)
+            self._handle_phase_profile(item.nodeid, self.TEARDOWN, prof)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_fixture_setup(self, fixturedef, request):
+        if not self._profile_phases:
+            yield
+        else:
+            start = timeit.default_timer()
+            yield
+            duration = timeit.default_timer() - start
+            # the test whose setup triggered the fixture, also for higher-scoped
+            # fixtures
+            test = getattr(request, '_pyfuncitem', request.node)
+            fixture_setup = (fixturedef.argname, fixturedef.scope, test.nodeid,
+                             duration)
+            self.fixture_setups.append(fixture_setup)
+            self._phase_fixtures.append(fixture_setup)
 
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_call(self, item):
-        if not self.profiling:
+        perf_budget = budget.PerfBudget.from_item(item)
+        cached = self._get_cached_profile(item.nodeid)
+        tracer = self._start_memory_tracer()
+        data = None
+        if not self.profiling or cached is not None:
+            start = timeit.default_timer()
             yield
+            seconds = timeit.default_timer() - start
+            memory_profile = self._stop_memory_tracer(item.nodeid, 'call', tracer)
+            if cached is not None:
+                data = self._reuse_profile(item, cached)
         else:
-            prof_filename = self._get_test_profile_filename(item.name)
-            prof_dir = os.path.dirname(prof_filename)
-            if not os.path.exists(prof_dir):
-                os.makedirs(prof_dir)
-            prof = cProfile.Profile()
+            prof = self._create_profiler()
             prof.enable()
+            start = timeit.default_timer()
             yield
+            seconds = timeit.default_timer() - start
             prof.disable()
-            try:
-                prof.dump_stats(prof_filename)
-            except EnvironmentError as err:
-                if err.errno != errno.ENAMETOOLONG:
-                    raise
+            memory_profile = self._stop_memory_tracer(item.nodeid, 'call', tracer)
+            data = self._handle_call_profile(item, prof)
+        if perf_budget is not None:
+            peak = memory_profile.peak if memory_profile is not None else None
+            # the call counts of a sampled profile are sample counts, which are not
+            # limited
+            counted = None if self._profiler == 'sampling' else data
+            self.budget_results[item.nodeid] = (
+                perf_budget, perf_budget.check(seconds, counted, peak))
+
+    def _handle_call_profile(self, item, prof):
+        if isinstance(prof, sampling.StackSampler) and not prof.samples:
+            return None
 
-            self._generate_stats_and_graphs(item.name, prof_filename)
+        # leave out the frames of pytest and pluggy calling the test function
+        root = self._get_test_function_key(item)
+        folded = prof.folded(root) if isinstance(prof, sampling.StackSampler) else None
+        data = ProfileData.from_profiler(prof)
+        if root is not None:
+            data = data.rooted_at(root)
+        self._handle_profile(item.nodeid, item.name, data, folded)
+        return data
+
+    def _get_cached_profile(self, nodeid):
+        if self.profile_cache is not None:
+            return self.profile_cache.get(nodeid)
+
+    def _reuse_profile(self, item, cached):
+        """Handle the cached profile of a test run without profiling, as if it was just
+        made: the profile is saved in this session, its cached results are stored, and
+        it is exported again if exported to files."""
+        data = ProfileData(cached.stats)
+        self._aggregate_profile(item.nodeid, data)
+        self.reused_profiles[item.nodeid] = cached.session
+        if item.nodeid in self.profile_summaries:
+            self.profile_summaries[item.nodeid]['reused'] = True
+        if self._save_profile(item.nodeid, data, cached.folded):
+            self._store_results(item.nodeid, item.name, cached.results)
+            export_options = self._get_export_options(item.nodeid, cached.folded)
+            if export_options.get('export_dir') is not None:
+                process_profile(item.name, cached.stats, [],
+                                **dict(self._report_options, **export_options))
+        return data
 
     @pytest.hookimpl(hookwrapper=True)
     def pytest_runtest_makereport(self, item, call):
         outcome = yield
-        if self.profiling:
-            report = outcome.get_result()
-            extra = getattr(report, 'extra', [])
-            if report.when == 'call':
-                for stat in [self.INTERNAL, self.CUMULATIVE]:
-                    prof_result = self.profs_results[item.name][stat]
-                    profHtml = self._link_to_report_html(item.name, stat, self.PROFILE_LINK[stat], prof_result)
-                    extra.append(plugin.extras.html(profHtml))
-
-                if self._call_graph:
-                    for pruned in [self.PRUNED_INTERNAL, self.PRUNED_CUMULATIVE, self.NON_PRUNED]:
-                        graph_abspath = self.graph_results[item.name][pruned]
-                        graph_report_relpath = os.path.relpath(graph_abspath, os.path.dirname(self.logfile))
-                        graph_link = self.IMG_TEMPLATE.format(graph_report_relpath)
-                        graphHtml = self._link_to_report_html(item.name, self.CALLGRAPH_NAME[pruned],
-                                                  self.CALLGRAPH_TITLE[pruned], graph_link)
-                        extra.append(plugin.extras.html(graphHtml))
-
-                report.extra = extra
-
-    def _generate_stats_file(self, name, path, statType):
-        report = self._get_profile_report(path, statType)
-        self.profs_results[name][statType] = report
-
-    def _generate_stats_and_graphs(self, name, path):
-        self._generate_stats_file(name, path, self.CUMULATIVE)
-        self._generate_stats_file(name, path, self.INTERNAL)
-        if self._call_graph:
-            self._generate_graphs(name, path, self.PRUNED_CUMULATIVE)
-            self._generate_graphs(name, path, self.PRUNED_INTERNAL)
-            self._generate_graphs(name, path, self.NON_PRUNED)
-
-    def _generate_graphs(self, name, path, prune):
-        self._write_dot_graph(name, path, prune)
-        self._render_graph(name, prune)
-
-    def _write_dot_graph(self, name, path, prune=''):
-        parser = gprof2dot.PstatsParser(path)
-        profile = parser.parse()
-
-        funcId = self._find_func_id_for_test_case(profile, name)
-        if funcId:
-            profile.prune_root(funcId)
-
-        if prune == self.PRUNED_CUMULATIVE:
+        report = outcome.get_result()
+        if report.when == 'call':
+            self._apply_budget(item.nodeid, report)
+            report.extra = (getattr(report, 'extra', []) +
+                            self._get_test_extras(item.nodeid))
+
+    def pytest_runtest_logreport(self, report):
+        if self._profile_phases:
+            self._receive_phase_results(report)
+        memory_result = getattr(report, 'html_memory', None)
+        if memory_result is not None:
+            # memory profile of a test run by an xdist worker, see ProfilingWorker
+            del report.html_memory
+            self.memory_results[report.nodeid] = tuple(memory_result)
+        shipped = getattr(report, 'html_profile', None)
+        if self.profiling and shipped is not None:
+            # profile shipped by an xdist worker, see ProfilingWorker
+            del report.html_profile
+            folded = getattr(report, 'html_profile_folded', None)
+            if folded is not None:
+                del report.html_profile_folded
+                folded = zlib.decompress(b64decode(folded)).decode('utf-8')
+            data = ProfileData.deserialize(shipped)
+            if getattr(report, 'html_profile_processed', False):
+                # the statistics and call graphs were generated on the worker
+                del report.html_profile_processed
+                self._aggregate_profile(report.nodeid, data)
+            else:
+                self._handle_profile(report.nodeid, report.nodeid.split('::')[-1], data,
+                                     folded)
+                report.extra = (getattr(report, 'extra', []) +
+                                self._get_test_extras(report.nodeid))
+        if report.when == 'call' and report.nodeid in self.performance:
+            self.performance[report.nodeid].duration = report.duration
+        self._write_manifest(report)
+        self._trace_report(report)
+        super(ProfilingHTMLReport, self).pytest_runtest_logreport(report)
+        if self.streaming and report.when == 'call':
+            self._release_results(report.nodeid)
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self._write_manifest(report)
+        super(ProfilingHTMLReport, self).pytest_collectreport(report)
+
+    def _release_results(self, nodeid):
+        # the results embedded in the spilled row are not needed anymore, only
+        # those still to be filled in through placeholders (teardown and memory
+        # profiles) are kept, along with the records of the end of session sections
+        if nodeid not in self._pending:
+            self.profs_results.pop(nodeid, None)
+            self.graph_results.pop(nodeid, None)
+        self.phase_results.get(nodeid, {}).pop(self.SETUP, None)
+
+    def pytest_html_results_table_header(self, cells):
+        if self.baseline is not None:
+            cells.insert(3, html.th('\u0394 vs baseline', class_='sortable numeric',
+                                    col='delta'))
+        if self._memory_profiling:
+            cells.insert(3, html.th('Peak memory (MiB)', class_='sortable numeric',
+                                    col='memory'))
+
+    def pytest_html_results_table_row(self, report, cells):
+        if self.profiling and report.when == 'call':
+            # anchor linked to by the suite hotspots
+            for cell in cells:
+                if getattr(cell.attr, 'class_', None) == 'col-name':
+                    cell.attr.id = self._get_row_anchor(report.nodeid)
+        if self.baseline is not None:
+            cells.insert(3, self._get_delta_cell(report))
+        if self._memory_profiling:
+            # the peak is only known once the test is torn down
+            cells.insert(3, html.td(raw(self.PLACEHOLDER_TEMPLATE.format(
+                name=report.nodeid, key=self.MEMORY_PEAK)), class_='col-memory'))
+
+    def pytest_html_results_summary(self, prefix, summary, postfix):
+        if self.profiling and self._hotspots and self.session_profile.stats:
+            postfix.extend(self._generate_hotspots())
+        if self._profile_phases and self.fixture_setups:
+            postfix.extend(self._generate_fixture_costs())
+        if self.baseline is not None:
+            postfix.extend(self._generate_regressions())
+
+    def _get_test_extras(self, nodeid):
+        extra = self._get_profile_extras(nodeid)
+        if nodeid in self.reused_profiles:
+            extra.insert(0, plugin.extras.html(
+                self.REUSED_TEMPLATE.format(self.reused_profiles.pop(nodeid))))
+        extra.extend(plugin.extras.url(href, name=label)
+                     for label, href in self._get_export_links(nodeid))
+        if self._profile_phases:
+            setup = self.phase_results.get(nodeid, {}).get(self.SETUP)
+            if setup is not None:
+                extra.insert(0, plugin.extras.html(setup))
+            # the test is torn down after its report is made
+            extra.append(plugin.extras.html(
+                self.PLACEHOLDER_TEMPLATE.format(name=nodeid, key=self.TEARDOWN)))
+        if self._memory_profiling:
+            extra.append(plugin.extras.html(
+                self.PLACEHOLDER_TEMPLATE.format(name=nodeid, key=self.MEMORY)))
+        for html_extra in extra:
+            html_extra[self.PROFILING_EXTRA] = True
+        return extra
+
+    def _apply_budget(self, nodeid, report):
+        if nodeid not in self.budget_results:
+            return
+        perf_budget, checks = self.budget_results.pop(nodeid)
+        report.extra = getattr(report, 'extra', []) + [
+            plugin.extras.html(self._get_budget_report(checks))]
+        exceeded = budget.exceeded(checks)
+        if exceeded and report.passed:
+            message = 'Performance budget exceeded: ' + ', '.join(
+                '{0} {1} > {2}'.format(name, self._format_budget_value(actual),
+                                       self._format_budget_value(limit))
+                for name, limit, actual in exceeded)
+            if perf_budget.xfail:
+                report.outcome = 'skipped'
+                report.wasxfail = message
+            else:
+                report.outcome = 'failed'
+                report.longrepr = message
+
+    def _start_memory_tracer(self):
+        if self._memory_profiling:
+            tracer = memory.MemoryTracer()
+            tracer.start()
+            return tracer
+
+    def _stop_memory_tracer(self, nodeid, phase, tracer):
+        if tracer is None:
+            return None
+        profile = tracer.stop()
+        self._memory_phases[nodeid].append((phase, profile))
+        if phase == self.TEARDOWN:
+            phases = self._memory_phases.pop(nodeid)
+            peak = max(profile.peak for phase, profile in phases)
+            report = self._get_memory_report(phases)
+            self.memory_results[nodeid] = (peak, self._link_to_report_html(
+                nodeid, self.MEMORY, self.MEMORY_LINK, report), dict(
+                    (phase, {'peak': profile.peak, 'net': profile.net})
+                    for phase, profile in phases))
+        return profile
+
+    def _get_profile_extras(self, nodeid):
+        extra = []
+        for stat in [self.INTERNAL, self.CUMULATIVE]:
+            prof_result = self._get_profile_result(nodeid, stat)
+            if prof_result is None:
+                continue
+            profHtml = self._link_to_report_html(nodeid, stat, self.PROFILE_LINK[stat],
+                                                 prof_result)
+            extra.append(plugin.extras.html(profHtml))
+
+        for pruned in self._get_graph_variants():
+            graph_link = self._get_graph_result(nodeid, pruned)
+            if graph_link is None:
+                continue
+            graphHtml = self._link_to_report_html(
+                nodeid, self.CALLGRAPH_NAME[pruned], self.CALLGRAPH_TITLE[pruned],
+                graph_link)
+            extra.append(plugin.extras.html(graphHtml))
+        return extra
+
+    def _create_profiler(self):
+        if self._profiler == 'sampling':
+            return sampling.StackSampler(self._sampling_interval)
+        return cProfile.Profile()
+
+    def _handle_profile(self, nodeid, name, data, folded=None):
+        self._aggregate_profile(nodeid, data)
+        if not self._save_profile(nodeid, data, folded):
+            return
+        if self.profile_cache is not None:
+            self.profile_cache.put_profile(nodeid, self.session_name, data.stats,
+                                           folded)
+            self._caching.add(nodeid)
+
+        if self._deferred:
+            self._submit_stats_and_graphs(nodeid, name, data.stats, folded)
+        else:
+            self._generate_stats_and_graphs(nodeid, name, data.stats, folded)
+
+    def _handle_phase_profile(self, nodeid, phase, prof):
+        if isinstance(prof, sampling.StackSampler) and not prof.samples:
+            data = None
+        else:
+            data = ProfileData.from_profiler(prof)
+        fixtures, self._phase_fixtures = self._phase_fixtures, []
+        if data is not None and not self._save_phase_profile(nodeid, phase, data):
+            return
+        report = self._get_phase_report(data, phase, fixtures, **self._report_options)
+        self.phase_results[nodeid][phase] = self._link_to_report_html(
+            nodeid, phase, self.PHASE_LINK[phase], report)
+
+    def _save_phase_profile(self, nodeid, phase, data):
+        try:
+            filename = phase + os.path.splitext(self.STATS_FILENAME)[1]
+            self._save_artifact(nodeid, filename, marshal.dumps(data.stats))
+        except EnvironmentError as err:
+            if err.errno != errno.ENAMETOOLONG:
+                raise
+            return False
+        return True
+
+    def _receive_phase_results(self, report):
+        # phase profiles and fixture setups of a test run by an xdist worker, see
+        # ProfilingWorker
+        fixture_users = getattr(report, 'html_fixture_users', None)
+        if fixture_users is not None:
+            del report.html_fixture_users
+            self.fixture_users.update(fixture_users)
+        fixture_setups = getattr(report, 'html_fixture_setups', None)
+        if fixture_setups is not None:
+            del report.html_fixture_setups
+            self.fixture_setups.extend(tuple(fixture_setup)
+                                       for fixture_setup in fixture_setups)
+        phase_result = getattr(report, 'html_profile_phase', None)
+        if phase_result is not None:
+            del report.html_profile_phase
+            self.phase_results[report.nodeid][report.when] = phase_result
+        stats = getattr(report, 'html_profile_phase_stats', None)
+        if stats is not None:
+            del report.html_profile_phase_stats
+            self._save_phase_profile(report.nodeid, report.when,
+                                     ProfileData.deserialize(stats))
+
+    def _aggregate_profile(self, nodeid, data):
+        if self._hotspots:
+            self.session_profile.add(nodeid, data)
+        if self._track_performance:
+            # the duration is set once the test is reported
+            self.performance[nodeid] = history.PerformanceRecord.from_profile(0.0, data)
+        if self._summarize:
+            # the profile itself is not kept until the test is torn down
+            self.profile_summaries[nodeid] = self._get_profile_summary(data)
+
+    def _get_profile_summary(self, data):
+        """Return the summary of a test profile written to the JSON results: the total
+        calls and time, and the functions with the highest internal and cumulative
+        time."""
+        include = self._report_options['include']
+        exclude = self._report_options['exclude']
+        report_data = data.restrict(include, exclude) if include or exclude else data
+        limit = self._report_options['limit'] or self.JSON_TOP_FUNCTIONS
+        summary = {'calls': data.total_calls, 'time': data.max_cumulative_time,
+                   'reused': False}
+        for stat in [self.INTERNAL, self.CUMULATIVE]:
+            name = 'top_internal' if stat == self.INTERNAL else 'top_cumulative'
+            functions = summary[name] = []
+            for key in report_data.top_functions(stat, limit):
+                cc, nc, tt, ct, callers = report_data.stats[key]
+                functions.append({'function': report_data.function_name(key),
+                                  'file': key[0], 'line': key[1], 'calls': nc,
+                                  'time': tt, 'cumulative': ct})
+        return summary
+
+    def _get_json_details(self, nodeid):
+        details = {}
+        summary = self.profile_summaries.pop(nodeid, None)
+        if summary is not None:
+            details['profile'] = summary
+        if nodeid in self.memory_results:
+            peak, report, phases = self.memory_results[nodeid]
+            details['memory'] = {'peak': peak, 'phases': phases}
+        return details
+
+    def _save_profile(self, nodeid, data, folded=None):
+        """Persist the profile of a test, and return whether this succeeded."""
+        if self.store is not None:
+            self.store.put_stats(nodeid, data.stats)
+            if folded is not None:
+                self.store.put(nodeid, self.FOLDED_FILENAME, folded)
+            return True
+
+        try:
+            if folded is not None:
+                self._save_artifact(nodeid, self.FOLDED_FILENAME, folded)
+            self._save_artifact(nodeid, self.STATS_FILENAME, marshal.dumps(data.stats))
+        except EnvironmentError as err:
+            if err.errno != errno.ENAMETOOLONG:
+                raise
+            return False
+        return True
+
+    def _generate_report(self, session):
+        self._close_manifest()
+        self._close_session_trace()
+        self._collect_deferred_results()
+        self._generate_session_results()
+        report = super(ProfilingHTMLReport, self)._generate_report(session)
+        report = self._resolve_placeholders(report)
+        if self.store is not None:
+            self.store.close()
+        if self.profile_cache is not None:
+            self.profile_cache.close()
+        if self.history is not None:
+            if self._history and self.performance:
+                self.history.add_run(self.session_name, self.performance,
+                                     self._profiler, self._get_sampling_interval())
+            self.history.close()
+        return report
+
+    def _generate_session_results(self):
+        """Save the session profile and generate its statistics and call graphs."""
+        if not self._hotspots or not self.session_profile.stats:
+            return
+        data = self.session_profile.to_profile_data()
+        if self._save_profile(self.SESSION_NODEID, data):
+            # the complete call graph of a session is usually too large to be rendered
+            graph_variants = [prune for prune in self._get_graph_variants()
+                              if prune != self.NON_PRUNED]
+            self._store_results(self.SESSION_NODEID, self.SESSION_NAME,
+                                process_profile(None, data.stats, graph_variants,
+                                                **dict(self._report_options,
+                                                       **self._get_export_options(
+                                                           self.SESSION_NODEID, None))))
+
+    def _generate_hotspots(self):
+        data = self.session_profile.to_profile_data()
+        section = [html.h2('Suite hotspots'),
+                   html.p('Aggregated profile of {0} tests.'.format(
+                       self.session_profile.num_tests))]
+        for stat in [self.INTERNAL, self.CUMULATIVE]:
+            section.append(html.h3('Top {0} functions by {1} time'.format(
+                self._hotspots, 'internal' if stat == self.INTERNAL else 'cumulative')))
+            section.append(self._generate_hotspots_table(data, stat))
+        section.extend(raw(html_extra['content'])
+                       for html_extra in self._get_profile_extras(self.SESSION_NODEID))
+        links = self._get_export_links(self.SESSION_NODEID)
+        if links:
+            section.append(html.p('Exported profiles: ', [
+                [', ' if i else '', html.a(label, href=href)]
+                for i, (label, href) in enumerate(links)]))
+        return section
+
+    def _generate_fixture_costs(self):
+        costs = defaultdict(lambda: [0, 0.0, []])
+        for argname, scope, nodeid, duration in self.fixture_setups:
+            cost = costs[argname, scope]
+            cost[0] += 1
+            cost[1] += duration
+            cost[2].append(nodeid)
+
+        rows = []
+        for (argname, scope), (setups, total, nodeids) in sorted(
+                costs.items(), key=lambda item: item[1][1], reverse=True):
+            users = max(self.fixture_users[argname], 1)
+            nodeids = sorted(set(nodeids))
+            links = [html.a(nodeid, href='#' + self._get_row_anchor(nodeid))
+                     for nodeid in nodeids[:self.MAX_HOTSPOT_TESTS]]
+            if len(nodeids) > self.MAX_HOTSPOT_TESTS:
+                more = len(nodeids) - self.MAX_HOTSPOT_TESTS
+                links.append('and {0} more'.format(more))
+            rows.append(html.tr(
+                html.td(argname, class_='col-fixture'),
+                html.td(scope, class_='col-scope'),
+                html.td(setups, class_='col-setups'),
+                html.td('{0:.3f}'.format(total), class_='col-time'),
+                html.td(users, class_='col-tests'),
+                html.td('{0:.3f}'.format(total / users), class_='col-amortized'),
+                html.td([html.div(link) for link in links], class_='col-links')))
+        return [html.h2('Fixture cost'),
+                html.table(
+                    html.thead(html.tr(
+                        html.th('Fixture'), html.th('Scope'), html.th('Setups'),
+                        html.th('Total setup time (s)'), html.th('Tests'),
+                        html.th('Amortized time per test (s)'), html.th('Set up by'))),
+                    html.tbody(rows),
+                    class_='hotspots')]
+
+    def _generate_hotspots_table(self, data, stat):
+        rows = []
+        for func in self.session_profile.hotspots(stat, self._hotspots):
+            cc, nc, tt, ct, callers = self.session_profile.stats[func]
+            num_tests = self.session_profile.test_counts[func]
+            nodeids = self.session_profile.top_tests(func)
+            links = [html.a(nodeid, href='#' + self._get_row_anchor(nodeid))
+                     for nodeid in nodeids]
+            if num_tests > len(nodeids):
+                links.append('and {0} more'.format(num_tests - len(nodeids)))
+            rows.append(html.tr(
+                html.td(data.function_name(func), title=func[0], class_='col-function'),
+                html.td(nc, class_='col-calls'),
+                html.td('{0:.3f}'.format(tt), class_='col-time'),
+                html.td('{0:.3f}'.format(ct), class_='col-cumulative'),
+                html.td(num_tests, class_='col-tests'),
+                html.td([html.div(link) for link in links], class_='col-links')))
+        return html.table(
+            html.thead(html.tr(
+                html.th('Function'), html.th('Calls'), html.th('Internal time (s)'),
+                html.th('Cumulative time (s)'), html.th('Tests'), html.th('Hit by'))),
+            html.tbody(rows),
+            class_='hotspots')
+
+    def _get_delta_cell(self, report):
+        record = self.performance.get(report.nodeid) if report.when == 'call' else None
+        if record is None:
+            return html.td('-', class_='col-delta')
+        baseline = self.baseline.get(report.nodeid)
+        if baseline is None:
+            return html.td('new', class_='col-delta')
+        change = history.relative_change(record.time, baseline.time)
+        return html.td(
+            '-' if change is None else '{0:+.1f}%'.format(change),
+            title='cumulative time {0:.6f}s -> {1:.6f}s, {2} {3} -> {4}'.format(
+                baseline.time, record.time, self._get_count_name(), baseline.calls,
+                record.calls),
+            class_=('col-delta regression' if self._is_regression(record, baseline)
+                    else 'col-delta'))
+
+    def _get_count_name(self):
+        # the sampling profiler counts samples, not calls
+        return 'samples' if self._profiler == 'sampling' else 'calls'
+
+    def _is_regression(self, record, baseline):
+        changes = []
+        if self._profiler != 'sampling':
+            # more samples only mean more time, which is compared below
+            changes.append(history.relative_change(record.calls, baseline.calls))
+        # a short test can take a lot longer relatively on timer noise alone
+        if record.time - baseline.time >= self._regression_min_time:
+            changes.append(history.relative_change(record.time, baseline.time))
+        return any(change is not None and change > self._regression_threshold
+                   for change in changes)
+
+    def _generate_regressions(self):
+        compared = [(nodeid, record, self.baseline[nodeid])
+                    for nodeid, record in self.performance.items()
+                    if nodeid in self.baseline]
+        regressions = [(nodeid, record, baseline)
+                       for nodeid, record, baseline in compared
+                       if self._is_regression(record, baseline)]
+        regressions.sort(key=lambda regression: regression[1].time - regression[2].time,
+                         reverse=True)
+        if self._profiler == 'sampling':
+            criteria = 'in cumulative time by more than {0:g}% and {1:g}s'
+        else:
+            criteria = ('by more than {0:g}% in calls, or in cumulative time by more '
+                        'than {0:g}% and {1:g}s')
+        section = [html.h2('Performance regressions'),
+                   html.p('{0} of {1} tests compared with session {2} regressed '
+                          '{3}.'.format(len(regressions), len(compared),
+                                        self.baseline_name, criteria.format(
+                                            self._regression_threshold,
+                                            self._regression_min_time)))]
+        if not regressions:
+            return section
+
+        def change(value, baseline):
+            relative = history.relative_change(value, baseline)
+            return '' if relative is None else ' ({0:+.1f}%)'.format(relative)
+
+        rows = []
+        for nodeid, record, baseline in regressions:
+            deltas = ['{0}: {1:+.6f}s, {2:+d} {3}'.format(name, time, calls,
+                                                          self._get_count_name())
+                      for name, calls, time in history.function_deltas(
+                          record, baseline, self.MAX_DELTA_FUNCTIONS)]
+            rows.append(html.tr(
+                html.td(html.a(nodeid, href='#' + self._get_row_anchor(nodeid)),
+                        class_='col-test'),
+                html.td('{0:.6f} -> {1:.6f}{2}'.format(
+                    baseline.time, record.time, change(record.time, baseline.time)),
+                    class_='col-time'),
+                html.td('{0} -> {1}{2}'.format(
+                    baseline.calls, record.calls, change(record.calls, baseline.calls)),
+                    class_='col-calls'),
+                html.td([html.div(delta) for delta in deltas], class_='col-functions')))
+        section.append(html.table(
+            html.thead(html.tr(
+                html.th('Test'), html.th('Cumulative time (s)'),
+                html.th(self._get_count_name().capitalize()),
+                html.th('Largest changes in internal time'))),
+            html.tbody(rows),
+            class_='hotspots'))
+        return section
+
+    @staticmethod
+    def _get_row_anchor(nodeid):
+        return 'test-' + re.sub(r'[^\w.-]', '_', nodeid)
+
+    def _get_graph_variants(self):
+        variants = []
+        if self._call_graph and self._call_graph_format == 'json':
+            variants.append(self.INTERACTIVE)
+        elif self._call_graph:
+            variants.extend([self.PRUNED_INTERNAL, self.PRUNED_CUMULATIVE,
+                             self.NON_PRUNED])
+        if self._flame_graph:
+            variants.append(self.FLAME)
+        return variants
+
+    def _get_profile_result(self, nodeid, stat):
+        if nodeid in self._pending:
+            return self.PLACEHOLDER_TEMPLATE.format(name=nodeid, key=stat)
+        return self.profs_results.get(nodeid, {}).get(stat)
+
+    def _get_graph_result(self, nodeid, prune):
+        if nodeid in self._pending:
+            return self.PLACEHOLDER_TEMPLATE.format(name=nodeid, key=prune)
+        return self.graph_results.get(nodeid, {}).get(prune)
+
+    def _submit_stats_and_graphs(self, nodeid, name, stats, folded=None):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        options = dict(self._report_options, **self._get_export_options(nodeid, folded))
+        future = self._executor.submit(process_profile, name, stats,
+                                       self._get_graph_variants(), **options)
+        self._pending[nodeid] = (name, future)
+
+    def _collect_deferred_results(self):
+        try:
+            for nodeid, (name, future) in self._pending.items():
+                try:
+                    results = future.result()
+                except Exception as err:
+                    # one profile failing to be processed does not fail the report
+                    self._store_error(nodeid, err)
+                else:
+                    self._store_results(nodeid, name, results)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _store_error(self, nodeid, err):
+        """Fill the placeholders of the statistics and call graphs of a test with a note
+        of the error raised while processing its profile."""
+        self._caching.discard(nodeid)
+        note = self.ERROR_TEMPLATE.format(escape('{0}: {1}'.format(
+            type(err).__name__, err)))
+        for stat in [self.INTERNAL, self.CUMULATIVE]:
+            self.profs_results[nodeid][stat] = note
+        for prune in self._get_graph_variants():
+            self.graph_results[nodeid][prune] = note
+
+    def _resolve_placeholders(self, report):
+        if not (self._pending or self._profile_phases or self._memory_profiling):
+            return report
+        lazy = self._lazy
+
+        def replace(match):
+            nodeid, key = match.group('name'), match.group('key')
+            if key in self.PHASES:
+                return self.phase_results[nodeid].get(key, '')
+            if key == self.MEMORY:
+                return self.memory_results.get(nodeid, (0, ''))[1]
+            if key == self.MEMORY_PEAK:
+                peak = self.memory_results.get(nodeid, (0, ''))[0]
+                return '{0:.2f}'.format(peak / self.MEBIBYTE)
+            if key in self.CALLGRAPH_NAME:
+                content = self.graph_results[nodeid][key]
+                label = self.CALLGRAPH_NAME[key]
+            else:
+                content = self.profs_results[nodeid][key]
+                label = key
+            if lazy:
+                return self._get_lazy_content(nodeid + '.' + label, content)
+            return content
+
+        return self.PLACEHOLDER_REGEX.sub(replace, report)
+
+    def _iter_result_rows(self):
+        for row in super(ProfilingHTMLReport, self)._iter_result_rows():
+            yield self._resolve_placeholders(row)
+
+    def _get_live_row(self, row):
+        # deferred results are only in the report, and the row is serialized by the
+        # server
+        return self.PLACEHOLDER_REGEX.sub('', row)
+
+    def _get_live_file_dirs(self):
+        return [self._profile_dir]
+
+    def _store_results(self, nodeid, name, results):
+        if nodeid in self._caching:
+            self._caching.discard(nodeid)
+            self.profile_cache.put_results(nodeid, self.session_name, results)
+        stats, artifacts = results
+        self.profs_results[nodeid].update(stats)
+        for filename, content in artifacts.items():
+            self._save_artifact(nodeid, filename, content)
+        for prune, graph_name in self.CALLGRAPH_NAME.items():
+            graph_filename = graph_name + self.GRAPH_SUFFIX
+            json_filename = graph_name + self.JSON_SUFFIX
+            if graph_filename in artifacts:
+                self.graph_results[nodeid][prune] = self.IMG_TEMPLATE.format(
+                    self._get_artifact_link(nodeid, graph_filename,
+                                            artifacts[graph_filename]))
+            elif json_filename in artifacts:
+                template = (self.FLAME_TEMPLATE if prune == self.FLAME
+                            else self.VIEWER_TEMPLATE)
+                # '</' would end the script element the graph is embedded in
+                self.graph_results[nodeid][prune] = template.format(
+                    artifacts[json_filename].replace('</', '<\\/'))
+
+    def _save_artifact(self, nodeid, filename, content):
+        if self.store is not None:
+            self.store.put(nodeid, filename, content)
+        else:
+            prof_dir = self._get_test_profile_dir(nodeid)
+            if not os.path.exists(prof_dir):
+                os.makedirs(prof_dir)
+            with open(self._get_test_artifact_filename(nodeid, filename),
+                      'wb' if isinstance(content, bytes) else 'wt') as f:
+                f.write(content)
+
+    def _get_artifact_link(self, nodeid, filename, content):
+        if self.store is not None:
+            return plugin.data_uri_bytes(content, mimetypes.guess_type(filename)[0])
+        return os.path.relpath(self._get_test_artifact_filename(nodeid, filename),
+                               os.path.dirname(self.logfile))
+
+    def _generate_stats_and_graphs(self, nodeid, name, stats, folded=None):
+        self._store_results(nodeid, name, process_profile(
+            name, stats, self._get_graph_variants(),
+            **dict(self._report_options, **self._get_export_options(nodeid, folded))))
+
+    def _get_export_options(self, nodeid, folded):
+        """Return the arguments of process_profile on the folded stacks and the exports
+        of the profile of a test, which are written to its profile directory unless the
+        profiles are stored in the session store."""
+        options = dict(folded=folded, exports=[(export_format, export.get_filename(
+            export_format, nodeid)) for export_format in self._exports])
+        if self._profiler == 'sampling' and folded:
+            options['interval'] = self._sampling_interval
+        if self._exports and self.store is None:
+            options['export_dir'] = self._get_test_profile_dir(nodeid)
+        return options
+
+    @classmethod
+    def _get_dot_graph(cls, data, roots, prune=''):
+        profile = data.to_gprof2dot(roots)
+
+        if prune == cls.PRUNED_CUMULATIVE:
             profile.prune(0.005, 0.001, None, True)
-        elif prune == self.PRUNED_INTERNAL:
+        elif prune == cls.PRUNED_INTERNAL:
             profile.prune(0.005, 0.001, None, True)
         else:
             profile.prune(0, 0, None, False)
 
-        with open(self._get_test_dot_filename(name, prune), 'wt') as f:
-            dot = gprof2dot.DotWriter(f)
-            dot.graph(profile, self.TEMPERATURE_COLORMAP)
+        f = StringIO()
+        dot = gprof2dot.DotWriter(f)
+        dot.graph(profile, cls.TEMPERATURE_COLORMAP)
+        return f.getvalue()
+
+    @staticmethod
+    def _get_test_function_key(item):
+        """Return the profile key of the function pytest calls to run a test, if any."""
+        func = getattr(item, 'obj', None)
+        # test methods, also of unittest test cases, are bound methods
+        code = getattr(getattr(func, '__func__', func), '__code__', None)
+        if code is not None:
+            return code.co_filename, code.co_firstlineno, code.co_name
 
-    def _find_func_id_for_test_case(self, profile, testName):
-        funcIds = [func.id for func in profile.functions.values() if func.name.endswith(testName)]
+    @staticmethod
+    def _find_func_id_for_test_case(data, testName):
+        # the parameters of a parametrized test are not part of its function name
+        funcIds = data.find_functions(':' + testName.split('[')[0])
 
         if len(funcIds) == 1:
             return funcIds
 
-    def _get_test_profile_dir(self, name):
-        return os.path.join(self._profile_dir, self.start_time.strftime("%Y_%m_%d_%H_%M_%S"), name)
+    def _get_manifest_filename(self):
+        return os.path.abspath(os.path.join(self._profile_dir,
+                                            self.session_name + self.MANIFEST_SUFFIX))
 
-    def _get_test_profile_filename(self, name):
-        return os.path.abspath(os.path.join(self._get_test_profile_dir(name), self.STATS_FILENAME))
+    def _get_export_links(self, nodeid):
+        """Return the label and the link of each file the profile of a test is exported
+        to. The files exported into the session store are not linked."""
+        if self.store is not None or (nodeid not in self._pending and
+                                      nodeid not in self.profs_results):
+            return []
+        return [(self.EXPORT_LINK[export_format], os.path.relpath(
+            self._get_test_artifact_filename(
+                nodeid, export.get_filename(export_format, nodeid)),
+            os.path.dirname(self.logfile))) for export_format in self._exports]
 
-    def _get_test_dot_filename(self, name, prune):
-        return os.path.abspath(os.path.join(self._get_test_profile_dir(name),
-                            self.CALLGRAPH_NAME[prune] + self.DOT_SUFFIX))
+    def _get_trace_filename(self):
+        return os.path.abspath(os.path.join(self._profile_dir,
+                                            self.session_name + self.TRACE_SUFFIX))
 
-    def _render_graph(self, name, prune):
-        graph = pygraphviz.AGraph(self._get_test_dot_filename(name, prune))
-        graph.layout('dot')
-        graph_path = self._get_test_graph_filename(name, prune)
-        graph.draw(graph_path)
-        self.graph_results[name][prune] = graph_path
+    def _get_store_filename(self):
+        return os.path.abspath(os.path.join(self._profile_dir,
+                                            self.session_name + self.STORE_SUFFIX))
+
+    def _get_test_profile_dir(self, nodeid):
+        return os.path.join(self._profile_dir, self.session_name,
+                            self.get_test_dirname(nodeid))
+
+    def _get_test_artifact_filename(self, nodeid, filename):
+        return os.path.abspath(os.path.join(self._get_test_profile_dir(nodeid),
+                                            filename))
+
+    @classmethod
+    def get_test_dirname(cls, nodeid):
+        """Return the name of the profile directory of a test in its session: the name
+        of the test, made a valid file name, and a hash of its node id, as tests of
+        different modules or classes can have the same name."""
+        if nodeid == cls.SESSION_NODEID:
+            return cls.SESSION_NAME
+        name = cls.UNSAFE_FILENAME_REGEX.sub('_', nodeid.split('::')[-1])
+        return '{0}-{1}'.format(name[:cls.MAX_DIRNAME_LENGTH],
+                                hashlib.sha1(nodeid.encode('utf-8')).hexdigest()[:12])
 
-    def _get_test_graph_filename(self, name, prune):
-        return os.path.abspath(os.path.join(self._get_test_profile_dir(name),
-                            self.CALLGRAPH_NAME[prune] + self.GRAPH_SUFFIX))
+    @staticmethod
+    def _render_graph(dot):
+        graph = pygraphviz.AGraph(string=dot)
+        graph.layout('dot')
+        return graph.draw(format='png')
 
     def _link_to_report_html(self, name, label, title, report):
-        return self.LINK_TEMPLATE.format(name + '.' + label, title, report)
+        element_id = name + '.' + label
+        if self._lazy:
+            report = self._get_lazy_content(element_id, report)
+        return self.LINK_TEMPLATE.format(element_id, title, report)
 
-    def _get_profile_report(self, path, type):
-        report = capture(self._print_profile_report, path, type)
-        report = cgi.escape(report)
-        return report
+    def _get_lazy_content(self, element_id, content):
+        """Return the element main.js replaces by the content when its popup opens."""
+        if self.PLACEHOLDER_REGEX.match(content):
+            # deferred content is made lazy once it is filled in, see
+            # _resolve_placeholders
+            return content
+        if self.self_contained or self.store is not None:
+            return self.LAZY_TEMPLATE.format(
+                b64encode(zlib.compress(content.encode('utf-8'))).decode('ascii'))
+        filename = self._get_lazy_filename(element_id)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'wt') as f:
+            f.write(self.LAZY_ASSET_TEMPLATE.format(json.dumps(element_id),
+                                                    json.dumps(content)))
+        src = os.path.relpath(filename, os.path.dirname(self.logfile))
+        return self.LAZY_SRC_TEMPLATE.format(src.replace(os.sep, '/'))
+
+    def _get_lazy_filename(self, element_id):
+        # node ids are neither unique as file names nor always valid ones
+        return os.path.abspath(os.path.join(
+            self._profile_dir, self.session_name, self.LAZY_DIRNAME,
+            hashlib.sha1(element_id.encode('utf-8')).hexdigest() + self.LAZY_SUFFIX))
+
+    @classmethod
+    def _get_phase_report(cls, data, phase, fixtures, limit=0, include=(), exclude=(),
+                          table=False):
+        report = cls.PHASE_HEADER.format(phase.upper()) + '\n'
+        for argname, scope, nodeid, duration in fixtures:
+            report += 'fixture {0} ({1} scope): {2:.6f}s\n'.format(
+                argname, scope, duration)
+        if fixtures:
+            report += '\n'
+        if data is None:
+            return escape(report + 'No samples recorded.\n' + cls.PROFILE_FOOTER + '\n')
+        if include or exclude:
+            data = data.restrict(include, exclude)
+        return (escape(report) + cls._format_stats(data, cls.CUMULATIVE, limit, table) +
+                escape(cls.PROFILE_FOOTER + '\n'))
+
+    @classmethod
+    def _get_budget_report(cls, checks):
+        rows = []
+        for name, limit, actual in checks:
+            row = html.tr(html.td(name), html.td(cls._format_budget_value(limit)),
+                          html.td(cls._format_budget_value(actual)))
+            if actual is not None and actual > limit:
+                row.attr.class_ = 'exceeded'
+            rows.append(row)
+        return html.table(
+            html.thead(html.tr(html.th('Performance budget'), html.th('Limit'),
+                               html.th('Actual'))),
+            html.tbody(rows),
+            class_='hotspots budget').unicode(indent=0)
+
+    @staticmethod
+    def _format_budget_value(value):
+        if value is None:
+            return 'not measured'
+        if isinstance(value, float):
+            return '{0:.6f}'.format(value)
+        return str(value)
+
+    @classmethod
+    def _get_memory_report(cls, phases):
+        report = cls.MEMORY_HEADER + '\n'
+        report += '{0:<10} {1:>14} {2:>14}\n'.format('phase', 'peak', 'net growth')
+        for phase, profile in phases:
+            report += '{0:<10} {1:>14} {2:>14}\n'.format(
+                phase, memory.format_size(profile.peak),
+                memory.format_size(profile.net))
+        for phase, profile in phases:
+            if profile.sites:
+                report += '\nTop allocation sites ({0}):\n'.format(phase)
+                for filename, line, size_diff, count_diff in profile.sites:
+                    report += '{0:>14} {1:>+8} blocks  {2}:{3}\n'.format(
+                        memory.format_size(size_diff), count_diff, filename, line)
+        report += cls.MEMORY_FOOTER + '\n'
+        return escape(report)
+
+    @classmethod
+    def _get_profile_report(cls, data, type, limit=0, table=False):
+        return (escape(cls.PROFILE_HEADER[type] + '\n') +
+                cls._format_stats(data, type, limit, table) +
+                escape(cls.PROFILE_FOOTER + '\n'))
+
+    @classmethod
+    def _format_stats(cls, data, type, limit=0, table=False):
+        if not table:
+            return escape(data.format_stats(type, limit))
+
+        rows = []
+        for key in data.top_functions(type, limit):
+            cc, nc, tt, ct, callers = data.stats[key]
+            rows.append(html.tr(
+                html.td(nc if nc == cc else '{0}/{1}'.format(nc, cc)),
+                html.td('{0:.6f}'.format(tt)),
+                html.td('{0:.6f}'.format(tt / nc if nc else 0.0)),
+                html.td('{0:.6f}'.format(ct)),
+                html.td('{0:.6f}'.format(ct / cc if cc else 0.0)),
+                html.td(pstats.func_std_string(key))))
+        summary = ('{0} function calls in {1:.6f} seconds, {2} of {3} functions '
+                   'listed\n').format(data.total_calls, data.total_time, len(rows),
+                                      len(data.stats))
+        table = html.table(
+            html.thead(html.tr(
+                html.th('ncalls', class_='numeric'),
+                html.th('tottime', class_='numeric'),
+                html.th('percall', class_='numeric'),
+                html.th('cumtime', class_='numeric'),
+                html.th('percall', class_='numeric'),
+                html.th('filename:lineno(function)'))),
+            html.tbody(rows),
+            class_='profile-table')
+        return escape(summary) + table.unicode(indent=0)
+
+
+class ProfilingWorker(ProfilingHTMLReport):
+    """Profiles the tests run by a pytest-xdist worker.
+
+    The worker never writes a report. If the profiles are stored per test
+    directory and --html-profile-deferred is not given, the statistics and
+    call graphs are generated on the worker and sent to the controller as
+    report extras, along with the serialized statistics for the suite
+    hotspots. Otherwise only the serialized statistics are sent with the
+    reports, and the controller's ProfilingHTMLReport stores and processes
+    them like the profiles of tests it ran itself.
+    """
+
+    def __init__(self, logfile, config):
+        super(ProfilingWorker, self).__init__(logfile, config)
+        self._ship_profiles = self._deferred or config.getoption('profile_store', False)
+        self._shipped = {}
+        self._processed = {}
+        self._shipped_phases = {}
+
+    def _get_session_name(self, config):
+        # the profiles are saved in the directory of the session of the controller
+        workerinput = getattr(config, 'workerinput', getattr(config, 'slaveinput', {}))
+        return workerinput.get('html_profile_session',
+                               super(ProfilingWorker, self)._get_session_name(config))
 
-    def _print_profile_report(self, prof_path, type):
-        stats = pstats.Stats(prof_path)
+    def _open_store(self, config):
+        # only the controller writes to the store
+        return None
 
-        if stats:
-            print(self.PROFILE_HEADER[type])
-            stats.sort_stats(type)
-            stats.print_stats()
-            print(self.PROFILE_FOOTER)
+    def _open_history(self):
+        # only the controller compares with and writes to the history
+        return None
 
+    def _open_profile_cache(self, config):
+        # the tests run by the workers are always profiled
+        return None
 
-def capture(func, *args, **kwArgs):
-    out = StringIO()
-    old_stdout = sys.stdout
-    sys.stdout = out
-    func(*args, **kwArgs)
-    sys.stdout = old_stdout
-    return out.getvalue()
+    def _open_manifest(self):
+        # the reports are listed in the manifest by the controller
+        return None
+
+    def _open_session_trace(self):
+        # the timeline of the session is written by the controller
+        return None
+
+    def _open_json_results(self, config):
+        # the results are written by the controller
+        return None
+
+    def _start_live_server(self, session):
+        # the results are served by the controller
+        return None
+
+    def _handle_profile(self, nodeid, name, data, folded=None):
+        if self._ship_profiles:
+            self._shipped[nodeid] = (data, folded)
+        else:
+            super(ProfilingWorker, self)._handle_profile(nodeid, name, data, folded)
+
+    def _save_phase_profile(self, nodeid, phase, data):
+        if self._ship_profiles:
+            self._shipped_phases[nodeid, phase] = data
+            return True
+        return super(ProfilingWorker, self)._save_phase_profile(nodeid, phase, data)
+
+    def _aggregate_profile(self, nodeid, data):
+        # the session profile and the performance records are made by the controller
+        if (self._hotspots or self._track_performance or self._summarize) and \
+                not self._ship_profiles:
+            self._processed[nodeid] = data
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        outcome = yield
+        report = outcome.get_result()
+        if report.when == 'call':
+            self._apply_budget(item.nodeid, report)
+        if self._profile_phases:
+            self._ship_phase_results(item, report)
+        if report.when == self.TEARDOWN and item.nodeid in self.memory_results:
+            report.html_memory = list(self.memory_results.pop(item.nodeid))
+        if report.when == 'call':
+            if item.nodeid in self._shipped:
+                data, folded = self._shipped.pop(item.nodeid)
+                report.html_profile = data.serialize()
+                if folded is not None:
+                    report.html_profile_folded = b64encode(
+                        zlib.compress(folded.encode('utf-8'))).decode('ascii')
+            else:
+                report.extra = (getattr(report, 'extra', []) +
+                                self._get_test_extras(item.nodeid))
+                if item.nodeid in self._processed:
+                    report.html_profile = self._processed.pop(item.nodeid).serialize()
+                    report.html_profile_processed = True
+
+    def _ship_phase_results(self, item, report):
+        if report.when == self.SETUP:
+            report.html_fixture_users = list(item.fixturenames)
+        if self.fixture_setups:
+            report.html_fixture_setups, self.fixture_setups = self.fixture_setups, []
+        if report.when in self.PHASES:
+            phase_results = self.phase_results[item.nodeid]
+            if report.when in phase_results:
+                report.html_profile_phase = phase_results[report.when]
+            if report.when == self.TEARDOWN:
+                self.phase_results.pop(item.nodeid, None)
+            data = self._shipped_phases.pop((item.nodeid, report.when), None)
+            if data is not None:
+                report.html_profile_phase_stats = data.serialize()
+
+    def pytest_runtest_logreport(self, report):
+        pass
+
+    def pytest_collectreport(self, report):
+        pass
+
+    def pytest_sessionfinish(self, session):
+        pass
+
+    def pytest_terminal_summary(self, terminalreporter):
+        pass
+
+
+def process_profile(name, stats, graph_variants, limit=0, include=(), exclude=(),
+                    table=False, folded=None, exports=(), export_dir=None,
+                    interval=None):
+    """Generate the statistics reports and call graphs of a test profile.
+
+    All of them are derived from a single ProfileData built from the raw
+    statistics, except the flame graph, which is built from the folded
+    stacks of the test if given. This is a module-level function so that it
+    can be run in the worker processes used by --html-profile-deferred.
+    Returns a tuple of the escaped statistics reports and a dict of the call
+    graph artifacts (DOT source and rendered graph, or JSON graph data) by
+    file name. The statistics reports only list the functions selected by
+    limit, include and exclude, unlike the call graphs. The profile is also
+    exported in the given formats, as (format, file name) tuples, see
+    export.FORMATS, written to a file in export_dir if given, or else
+    returned as artifacts. The folded stacks
+    are weighted by the sampling interval, in seconds.
+    """
+    report_cls = ProfilingHTMLReport
+    data = ProfileData(stats)
+    report_data = data.restrict(include, exclude) if include or exclude else data
+    reports = {}
+    for stat in [report_cls.CUMULATIVE, report_cls.INTERNAL]:
+        reports[stat] = report_cls._get_profile_report(report_data, stat, limit, table)
+
+    artifacts = {}
+    if graph_variants:
+        roots = report_cls._find_func_id_for_test_case(data, name) if name else None
+        for prune in graph_variants:
+            graph_name = report_cls.CALLGRAPH_NAME[prune]
+            if prune == report_cls.INTERACTIVE:
+                artifacts[graph_name + report_cls.JSON_SUFFIX] = json.dumps(
+                    data.call_graph(roots), separators=(',', ':'))
+            elif prune == report_cls.FLAME:
+                graph = (flamegraph.from_folded(folded) if folded
+                         else flamegraph.from_profile(data, roots))
+                artifacts[graph_name + report_cls.JSON_SUFFIX] = json.dumps(
+                    graph, separators=(',', ':'))
+            else:
+                dot = report_cls._get_dot_graph(data, roots, prune)
+                artifacts[graph_name + report_cls.DOT_SUFFIX] = dot
+                artifacts[graph_name + report_cls.GRAPH_SUFFIX] = (
+                    report_cls._render_graph(dot))
+
+    if exports:
+        roots = report_cls._find_func_id_for_test_case(data, name) if name else None
+    export_name = name or report_cls.SESSION_NAME
+    for export_format, filename in exports:
+        writer = export.WRITERS[export_format]
+        if export_dir is not None:
+            path = os.path.join(export_dir, filename)
+            with io.open(path, 'w', encoding='utf-8') as f:
+                writer(f, export_name, data, roots, folded, interval)
+        else:
+            out = StringIO()
+            writer(out, export_name, data, roots, folded, interval)
+            artifacts[filename] = out.getvalue()
+    return reports, artifacts
@@ -26,6 +26,10 @@ function find_all(selector, elem) {
 
 function sort_column(elem) {
     toggle_sort_states(elem);
+    if (virtual_table) {
+        sort_virtual_table(elem);
+        return;
+    }
     var colIndex = toArray(elem.parentNode.childNodes).indexOf(elem);
     var key;
     if (elem.classList.contains('numeric')) {
@@ -39,10 +43,18 @@ function sort_column(elem) {
 }
 
 function show_all_extras() {
+    if (virtual_table) {
+        set_all_virtual_rows_collapsed(false);
+        return;
+    }
     find_all('.col-result').forEach(show_extras);
 }
 
 function hide_all_extras() {
+    if (virtual_table) {
+        set_all_virtual_rows_collapsed(true);
+        return;
+    }
     find_all('.col-result').forEach(hide_extras);
 }
 
@@ -76,9 +88,14 @@ function add_collapse() {
                             '<a href="javascript:hide_all_extras()">Hide all details</a>';
     resulttable.parentElement.insertBefore(showhideall, resulttable);
 
+    if (virtual_table) {
+        // the rows get their show/hide links when they are rendered
+        return;
+    }
+
     // Add show/hide link to each result
     find_all('.col-result').forEach(function(elem) {
-        var collapsed = get_query_parameter('collapsed') || 'Error,Failed,Rerun,XFailed,XError,Skipped,Passed';
+        var collapsed = get_collapsed_outcomes();
         var extras = elem.parentNode.nextElementSibling;
         var expandcollapse = document.createElement("span");
         if (collapsed.includes(elem.innerHTML)) {
@@ -99,6 +116,10 @@ function add_collapse() {
     })
 }
 
+function get_collapsed_outcomes() {
+    return get_query_parameter('collapsed') || 'Error,Failed,Rerun,XFailed,XError,Skipped,Passed';
+}
+
 function get_query_parameter(name) {
     var match = RegExp('[?&]' + name + '=([^&]*)').exec(window.location.search);
     return match && decodeURIComponent(match[1].replace(/\+/g, ' '));
@@ -107,6 +128,8 @@ function get_query_parameter(name) {
 function init () {
     reset_sort_headers();
 
+    init_virtual_table();
+
     add_collapse();
 
     show_filters();
@@ -220,6 +243,10 @@ function is_all_rows_hidden(value) {
 function filter_table(elem) {
     var outcome_att = "data-test-result";
     var outcome = elem.getAttribute(outcome_att);
+    if (virtual_table) {
+        filter_virtual_table(outcome, elem.checked);
+        return;
+    }
     class_outcome = outcome + " results-table-row";
     var outcome_rows = document.getElementsByClassName(class_outcome);
 
@@ -236,4 +263,840 @@ function filter_table(elem) {
 function toggle_collapsed(id) {
   var element = document.getElementById(id);
   element.classList.toggle("collapsed");
+  if (!element.classList.contains("collapsed")) {
+    load_lazy_extra(element, function() {
+      find_all('.call-graph-viewer', element).forEach(render_call_graph);
+      find_all('.flame-graph-viewer', element).forEach(render_flame_graph);
+      if (virtual_table) {
+        update_virtual_table();
+      }
+    });
+  }
+  if (virtual_table) {
+    update_virtual_table();
+  }
+}
+
+/* Lazily loaded extras
+ *
+ * With --html-profile-lazy the content of a profiling popup is not part of
+ * the page, but a script element of class lazy-extra stands in for it. Its
+ * data-src attribute names a script file that passes the content to
+ * load_extra_content; script files load from file:// URLs, unlike fetch.
+ * Without data-src the element holds the content zlib compressed and base64
+ * encoded, which is inflated with a DecompressionStream.
+ */
+
+var lazy_extras = {};
+
+function load_lazy_extra(element, callback) {
+    var loader = find('script.lazy-extra', element);
+    if (!loader) {
+        callback();
+        return;
+    }
+    if (lazy_extras[element.id]) {
+        // still loading
+        return;
+    }
+    lazy_extras[element.id] = function(content) {
+        delete lazy_extras[element.id];
+        var container = document.createElement('div');
+        container.innerHTML = content;
+        while (container.firstChild) {
+            loader.parentNode.insertBefore(container.firstChild, loader);
+        }
+        loader.parentNode.removeChild(loader);
+        callback();
+    };
+    var src = loader.getAttribute('data-src');
+    if (src) {
+        var script = document.createElement('script');
+        script.src = src;
+        script.onerror = function() {
+            lazy_extras[element.id]('Could not load ' + src);
+        };
+        document.head.appendChild(script);
+    } else if (typeof DecompressionStream === 'undefined') {
+        lazy_extras[element.id]('This browser cannot decompress the embedded data.');
+    } else {
+        var data = atob(loader.textContent);
+        var bytes = new Uint8Array(data.length);
+        for (var i = 0; i < data.length; i++) {
+            bytes[i] = data.charCodeAt(i);
+        }
+        var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+        new Response(stream).text().then(function(content) {
+            load_extra_content(element.id, content);
+        });
+    }
+}
+
+function load_extra_content(id, content) {
+    if (lazy_extras[id]) {
+        lazy_extras[id](content);
+    }
+}
+
+/* Profile tables
+ *
+ * With --html-profile-table the profiling reports are tables, sorted by
+ * clicking on a column header. Numeric columns are sorted in descending
+ * order first. Clicks are handled on the document, as the tables may only be
+ * added to the page later, by the virtual table or as lazily loaded extras.
+ */
+
+function sort_profile_table(th) {
+    var table = th.parentNode.parentNode.parentNode;
+    var tbody = table.tBodies[0];
+    var numeric = th.classList.contains('numeric');
+    var descending;
+    if (th.classList.contains('asc') || th.classList.contains('desc')) {
+        descending = th.classList.contains('asc');
+    } else {
+        descending = numeric;
+    }
+    find_all('th', table).forEach(function(elem) {
+        elem.classList.remove('asc', 'desc');
+    });
+    th.classList.add(descending ? 'desc' : 'asc');
+
+    var key_func = function(row) {
+        var text = row.cells[th.cellIndex].textContent;
+        return numeric ? parseFloat(text) : text.toLowerCase();
+    };
+    sort(toArray(tbody.rows), key_func, descending).forEach(function(row) {
+        tbody.appendChild(row);
+    });
+}
+
+document.addEventListener('click', function(event) {
+    var th = event.target;
+    if (th.tagName == 'TH' && th.parentNode.parentNode.parentNode.classList.contains('profile-table')) {
+        sort_profile_table(th);
+    }
+});
+
+/* Virtual results table
+ *
+ * With --html-virtual-table the rows of the results table are embedded as
+ * JSON data, one [outcome, sort keys, row HTML] array per test, instead of
+ * as table rows. Only the rows in view (and a margin around them) are
+ * rendered, between two spacer rows standing in for the rows above and below.
+ * Sorting and filtering work on the array in memory, on the sort keys
+ * extracted from the cells when the report was generated; the ascending
+ * order of each column is only computed once. Row heights are estimated
+ * until a row has been rendered once.
+ */
+
+var virtual_table = null;
+var VIRTUAL_ROW_HEIGHT = 30;
+var VIRTUAL_MARGIN = 1000;
+
+function init_virtual_table() {
+    var data = find('#results-data');
+    if (!data) {
+        return;
+    }
+    var collapsed = get_collapsed_outcomes();
+    var table = find('#results-table');
+    var columns = find_all('th', find('#results-table-head tr')).length;
+    var rows = JSON.parse(data.textContent).map(function(row, i) {
+        return {id: i, outcome: row[0], keys: row[1], html: row[2],
+                collapsed: collapsed.includes(row[1][0]), height: null};
+    });
+    virtual_table = {
+        data: rows,
+        rows: rows,
+        orders: {},
+        hidden_outcomes: {},
+        view: [],
+        table: table,
+        top: create_virtual_spacer(columns),
+        bottom: create_virtual_spacer(columns),
+        rendered: [],
+        first: 0,
+        last: 0,
+        pending: false
+    };
+    table.appendChild(virtual_table.top);
+    table.appendChild(virtual_table.bottom);
+    table.addEventListener('click', function(event) {
+        var cell = event.target.closest('.col-result');
+        if (cell && table.contains(cell) && cell.parentNode.parentNode.hasAttribute('data-row')) {
+            toggle_virtual_row(cell.parentNode.parentNode);
+        }
+    });
+    window.addEventListener('scroll', update_virtual_table);
+    window.addEventListener('resize', update_virtual_table);
+    window.addEventListener('hashchange', scroll_to_virtual_anchor);
+    update_virtual_view();
+    scroll_to_virtual_anchor();
+}
+
+function create_virtual_spacer(columns) {
+    var spacer = document.createElement('tbody');
+    spacer.innerHTML = '<tr><td colspan="' + columns + '" style="padding: 0; border: 0"></td></tr>';
+    return spacer;
+}
+
+function set_virtual_spacer_height(spacer, height) {
+    spacer.firstChild.firstChild.style.height = height + 'px';
+    spacer.hidden = height == 0;
+}
+
+function virtual_row_height(row) {
+    return row.height === null ? VIRTUAL_ROW_HEIGHT : row.height;
+}
+
+function update_virtual_view() {
+    var hidden = virtual_table.hidden_outcomes;
+    virtual_table.view = virtual_table.rows.filter(function(row) {
+        return !hidden[row.outcome];
+    });
+    find('#not-found-message').hidden = virtual_table.view.length > 0;
+    render_virtual_table(true);
+}
+
+function update_virtual_table() {
+    // renders at most once per frame while scrolling
+    if (!virtual_table.pending) {
+        virtual_table.pending = true;
+        window.requestAnimationFrame(function() {
+            virtual_table.pending = false;
+            render_virtual_table(false);
+        });
+    }
+}
+
+function render_virtual_table(force) {
+    var vt = virtual_table;
+    var view = vt.view;
+    var table_top = vt.top.getBoundingClientRect().top + window.pageYOffset;
+    var view_top = window.pageYOffset - table_top - VIRTUAL_MARGIN;
+    var view_bottom = window.pageYOffset - table_top + window.innerHeight + VIRTUAL_MARGIN;
+
+    var y = 0;
+    var i = 0;
+    while (i < view.length && y + virtual_row_height(view[i]) < view_top) {
+        y += virtual_row_height(view[i]);
+        i++;
+    }
+    var first = i;
+    var top_height = y;
+    while (i < view.length && y < view_bottom) {
+        y += virtual_row_height(view[i]);
+        i++;
+    }
+    var last = i;
+
+    if (force || first != vt.first || last != vt.last) {
+        vt.rendered.forEach(function(tbody) {
+            vt.table.removeChild(tbody);
+        });
+        vt.rendered = view.slice(first, last).map(function(row) {
+            var tbody = create_virtual_row(row);
+            vt.table.insertBefore(tbody, vt.bottom);
+            return tbody;
+        });
+        vt.first = first;
+        vt.last = last;
+    }
+
+    // measure the rendered rows, their height is known from now on
+    vt.rendered.forEach(function(tbody) {
+        vt.data[tbody.getAttribute('data-row')].height = tbody.offsetHeight;
+    });
+    var bottom_height = 0;
+    for (i = last; i < view.length; i++) {
+        bottom_height += virtual_row_height(view[i]);
+    }
+    set_virtual_spacer_height(vt.top, top_height);
+    set_virtual_spacer_height(vt.bottom, bottom_height);
+}
+
+function create_virtual_row(row) {
+    var tbody = document.createElement('tbody');
+    tbody.className = row.outcome + ' results-table-row';
+    tbody.setAttribute('data-row', row.id);
+    tbody.innerHTML = row.html;
+    var expandcollapse = document.createElement('span');
+    expandcollapse.classList.add(row.collapsed ? 'expander' : 'collapser');
+    find('.col-result', tbody).appendChild(expandcollapse);
+    var extras = tbody.rows[1];
+    if (extras && row.collapsed) {
+        extras.classList.add('collapsed');
+    }
+    return tbody;
+}
+
+function toggle_virtual_row(tbody) {
+    var row = virtual_table.data[tbody.getAttribute('data-row')];
+    row.collapsed = !row.collapsed;
+    if (row.collapsed) {
+        hide_extras(find('.col-result', tbody));
+    } else {
+        show_extras(find('.col-result', tbody));
+    }
+    update_virtual_table();
+}
+
+function set_all_virtual_rows_collapsed(collapsed) {
+    virtual_table.data.forEach(function(row) {
+        if (row.collapsed != collapsed) {
+            row.collapsed = collapsed;
+            row.height = null;
+        }
+    });
+    render_virtual_table(true);
+}
+
+function sort_virtual_table(elem) {
+    var col_index = elem.cellIndex;
+    var key_func;
+    if (elem.classList.contains('numeric')) {
+        key_func = function(row) { return parseFloat(row.keys[col_index]); };
+    } else if (elem.classList.contains('result')) {
+        var strings = ['Error', 'Failed', 'Rerun', 'XFailed', 'XPassed',
+                       'Skipped', 'Passed'];
+        key_func = function(row) { return strings.indexOf(row.keys[col_index]); };
+    } else {
+        key_func = function(row) { return row.keys[col_index].toLowerCase(); };
+    }
+    var orders = virtual_table.orders;
+    if (!orders[col_index]) {
+        orders[col_index] = sort(virtual_table.data, key_func, false);
+    }
+    if (elem.classList.contains('asc')) {
+        virtual_table.rows = orders[col_index];
+    } else {
+        virtual_table.rows = orders[col_index].slice().reverse();
+    }
+    update_virtual_view();
+}
+
+function filter_virtual_table(outcome, checked) {
+    virtual_table.hidden_outcomes[outcome] = !checked;
+    update_virtual_view();
+}
+
+function scroll_to_virtual_anchor() {
+    // rows linked to, e.g. by the suite hotspots, may not be rendered yet
+    var id = window.location.hash.slice(1);
+    if (!id || document.getElementById(id)) {
+        return;
+    }
+    var attribute = 'id="' + id + '"';
+    var vt = virtual_table;
+    var y = 0;
+    for (var i = 0; i < vt.view.length; i++) {
+        if (vt.view[i].html.indexOf(attribute) != -1) {
+            window.scrollTo(0, vt.top.getBoundingClientRect().top + window.pageYOffset + y);
+            render_virtual_table(false);
+            var target = document.getElementById(id);
+            if (target) {
+                target.scrollIntoView();
+            }
+            return;
+        }
+        y += virtual_row_height(vt.view[i]);
+    }
+}
+
+/* Live report
+ *
+ * The page served by --html-live polls the server for the rows of the tests
+ * finished since its last poll, and adds them to its virtual table. Updates
+ * not polled in time are dropped by the server, the report written at the
+ * end of the session holds all the rows.
+ */
+
+var LIVE_POLL_INTERVAL = 1000;
+
+function init_live() {
+    var data = find('#results-data');
+    if (!data || !data.hasAttribute('data-live')) {
+        return;
+    }
+    poll_live(data.getAttribute('data-live'), 0, 0);
+}
+
+function poll_live(url, since, dropped) {
+    var request = new XMLHttpRequest();
+    request.open('GET', url + '?since=' + since);
+    request.onload = function() {
+        if (request.status != 200) {
+            set_live_status(null, dropped);
+            return;
+        }
+        var response = JSON.parse(request.responseText);
+        dropped += response.dropped;
+        add_virtual_rows(response.updates.filter(function(update) {
+            return update[0] == 'row';
+        }).map(function(update) {
+            return update[1];
+        }));
+        set_live_status(response.summary, dropped);
+        if (!response.summary.finished) {
+            window.setTimeout(function() {
+                poll_live(url, response.next, dropped);
+            }, LIVE_POLL_INTERVAL);
+        }
+    };
+    request.onerror = function() {
+        set_live_status(null, dropped);
+    };
+    request.send();
+}
+
+function add_virtual_rows(rows) {
+    if (!rows.length) {
+        return;
+    }
+    var collapsed = get_collapsed_outcomes();
+    var data = virtual_table.data;
+    rows.forEach(function(row) {
+        data.push({id: data.length, outcome: row[0], keys: row[1], html: row[2],
+                   collapsed: collapsed.includes(row[1][0]), height: null});
+    });
+    // the rows are sorted again by the active column
+    virtual_table.orders = {};
+    var active = find('#results-table-head .sortable.active');
+    if (active) {
+        sort_virtual_table(active);
+    } else {
+        virtual_table.rows = data.slice();
+        update_virtual_view();
+    }
+}
+
+function set_live_status(summary, dropped) {
+    var status = find('#live-status');
+    if (!summary) {
+        status.textContent = 'The session finished or the server stopped, see the report ' +
+                             'written at the end of the session.';
+        return;
+    }
+    var text = summary.tests + ' tests ran in ' + summary.duration.toFixed(2) + ' seconds: ' +
+        summary.passed + ' passed, ' + summary.skipped + ' skipped, ' +
+        summary.failed + ' failed, ' + summary.errors + ' errors, ' +
+        summary.xfailed + ' expected failures, ' + summary.xpassed + ' unexpected passes';
+    if (summary.rerun !== null) {
+        text += ', ' + summary.rerun + ' rerun';
+    }
+    text += summary.finished ? '. The session finished, the report is ' + summary.report + '.'
+                             : '. Running...';
+    if (dropped) {
+        text += ' ' + dropped + ' updates were dropped, see the report written at the end of ' +
+                'the session.';
+    }
+    status.textContent = text;
+}
+
+/* Interactive call graph viewer
+ *
+ * Renders the call graphs embedded as JSON by --html-call-graph-format=json.
+ * Nodes are [name, filename, calls, internal time, cumulative time] and
+ * edges [caller, callee, calls, cumulative time]. The graph is only laid out
+ * when its popup is first opened.
+ */
+
+var SVG_NS = "http://www.w3.org/2000/svg";
+var GRAPH_NODE_WIDTH = 220;
+var GRAPH_NODE_HEIGHT = 44;
+var GRAPH_LAYER_GAP = 50;
+var GRAPH_NODE_GAP = 20;
+
+function render_call_graph(viewer) {
+    if (viewer.graph) {
+        return;
+    }
+    var graph = JSON.parse(viewer.firstElementChild.textContent);
+    viewer.graph = graph;
+    viewer.state = {node_threshold: 0.005, edge_threshold: 0.001,
+                    color_by: 'cumulative', search: ''};
+
+    var controls = document.createElement("div");
+    controls.className = "call-graph-controls";
+    controls.innerHTML =
+        'Search: <input type="text" class="call-graph-search"> ' +
+        'Node threshold: <input type="range" class="call-graph-node-threshold" min="0" max="10" step="0.1" value="0.5"> ' +
+        '<span class="call-graph-node-threshold-value">0.5%</span> ' +
+        'Edge threshold: <input type="range" class="call-graph-edge-threshold" min="0" max="10" step="0.1" value="0.1"> ' +
+        '<span class="call-graph-edge-threshold-value">0.1%</span> ' +
+        'Color by: <select class="call-graph-color"><option value="cumulative">cumulative time</option>' +
+        '<option value="internal">internal time</option></select>';
+    viewer.appendChild(controls);
+
+    var svg = document.createElementNS(SVG_NS, "svg");
+    svg.setAttribute("class", "call-graph");
+    viewer.appendChild(svg);
+    add_pan_zoom(svg);
+
+    find('.call-graph-search', controls).addEventListener("input", function(event) {
+        viewer.state.search = event.target.value.toLowerCase();
+        highlight_call_graph(viewer);
+    });
+    find('.call-graph-node-threshold', controls).addEventListener("input", function(event) {
+        viewer.state.node_threshold = parseFloat(event.target.value) / 100;
+        find('.call-graph-node-threshold-value', controls).textContent = event.target.value + "%";
+        draw_call_graph(viewer);
+    });
+    find('.call-graph-edge-threshold', controls).addEventListener("input", function(event) {
+        viewer.state.edge_threshold = parseFloat(event.target.value) / 100;
+        find('.call-graph-edge-threshold-value', controls).textContent = event.target.value + "%";
+        draw_call_graph(viewer);
+    });
+    find('.call-graph-color', controls).addEventListener("change", function(event) {
+        viewer.state.color_by = event.target.value;
+        draw_call_graph(viewer);
+    });
+
+    draw_call_graph(viewer);
+}
+
+function prune_call_graph(graph, state) {
+    var total = graph.total_time || 1;
+    var visible = graph.nodes.map(function(node) {
+        return node[4] / total >= state.node_threshold;
+    });
+    var edges = graph.edges.filter(function(edge) {
+        return visible[edge[0]] && visible[edge[1]] && edge[3] / total >= state.edge_threshold;
+    });
+    return {visible: visible, edges: edges};
+}
+
+function layout_call_graph(graph, pruned) {
+    /* Layered layout: each node is placed one layer below its shallowest caller. */
+    var children = graph.nodes.map(function() { return []; });
+    var has_caller = graph.nodes.map(function() { return false; });
+    pruned.edges.forEach(function(edge) {
+        if (edge[0] != edge[1]) {
+            children[edge[0]].push(edge[1]);
+            has_caller[edge[1]] = true;
+        }
+    });
+    var depth = graph.nodes.map(function() { return -1; });
+    var queue = [];
+    graph.nodes.forEach(function(node, i) {
+        if (pruned.visible[i] && !has_caller[i]) {
+            depth[i] = 0;
+            queue.push(i);
+        }
+    });
+    if (queue.length == 0) {
+        /* Only cycles are left, start from the most expensive node */
+        var top = -1;
+        graph.nodes.forEach(function(node, i) {
+            if (pruned.visible[i] && (top < 0 || node[4] > graph.nodes[top][4])) top = i;
+        });
+        if (top >= 0) {
+            depth[top] = 0;
+            queue.push(top);
+        }
+    }
+    for (var q = 0; q < queue.length; q++) {
+        var current = queue[q];
+        children[current].forEach(function(child) {
+            if (depth[child] < 0) {
+                depth[child] = depth[current] + 1;
+                queue.push(child);
+            }
+        });
+    }
+    var layers = [];
+    var positions = {};
+    queue.forEach(function(i) {
+        var layer = layers[depth[i]] = layers[depth[i]] || [];
+        positions[i] = {x: layer.length * (GRAPH_NODE_WIDTH + GRAPH_NODE_GAP),
+                        y: depth[i] * (GRAPH_NODE_HEIGHT + GRAPH_LAYER_GAP)};
+        layer.push(i);
+    });
+    var width = Math.max.apply(null, layers.map(function(layer) { return layer.length; }).concat([1]));
+    /* Center every layer */
+    layers.forEach(function(layer) {
+        var offset = (width - layer.length) * (GRAPH_NODE_WIDTH + GRAPH_NODE_GAP) / 2;
+        layer.forEach(function(i) { positions[i].x += offset; });
+    });
+    return {positions: positions,
+            width: width * (GRAPH_NODE_WIDTH + GRAPH_NODE_GAP),
+            height: layers.length * (GRAPH_NODE_HEIGHT + GRAPH_LAYER_GAP)};
+}
+
+function temperature_color(ratio) {
+    /* Same range as the Graphviz call graphs: dark blue to saturated red */
+    ratio = Math.max(0, Math.min(1, ratio));
+    var hue = (2.0 / 3.0) * (1 - ratio) * 360;
+    var saturation = 80 + 20 * ratio;
+    var lightness = 25 + 25 * ratio;
+    return "hsl(" + hue + "," + saturation + "%," + lightness + "%)";
+}
+
+function format_seconds(seconds) {
+    return seconds.toFixed(4) + "s";
+}
+
+function draw_call_graph(viewer) {
+    var graph = viewer.graph;
+    var state = viewer.state;
+    var svg = find('svg.call-graph', viewer);
+    var total = graph.total_time || 1;
+    var pruned = prune_call_graph(graph, state);
+    var layout = layout_call_graph(graph, pruned);
+
+    while (svg.firstChild) {
+        svg.removeChild(svg.firstChild);
+    }
+    svg.setAttribute("viewBox", "0 0 " + Math.max(layout.width, 1) + " " + Math.max(layout.height, 1));
+
+    var defs = document.createElementNS(SVG_NS, "defs");
+    defs.innerHTML = '<marker id="call-graph-arrow" viewBox="0 0 10 10" refX="10" refY="5" ' +
+                     'markerWidth="6" markerHeight="6" orient="auto">' +
+                     '<path d="M 0 0 L 10 5 L 0 10 z"></path></marker>';
+    svg.appendChild(defs);
+
+    pruned.edges.forEach(function(edge) {
+        var from = layout.positions[edge[0]];
+        var to = layout.positions[edge[1]];
+        if (!from || !to || edge[0] == edge[1]) return;
+        var line = document.createElementNS(SVG_NS, "path");
+        var x1 = from.x + GRAPH_NODE_WIDTH / 2, y1 = from.y + GRAPH_NODE_HEIGHT;
+        var x2 = to.x + GRAPH_NODE_WIDTH / 2, y2 = to.y;
+        var bend = (y2 - y1) / 2 || GRAPH_LAYER_GAP;
+        line.setAttribute("d", "M " + x1 + " " + y1 + " C " + x1 + " " + (y1 + bend) + " " +
+                               x2 + " " + (y2 - bend) + " " + x2 + " " + y2);
+        line.setAttribute("class", "call-graph-edge");
+        line.setAttribute("stroke", temperature_color(edge[3] / total));
+        line.setAttribute("stroke-width", 1 + 3 * edge[3] / total);
+        line.setAttribute("marker-end", "url(#call-graph-arrow)");
+        var title = document.createElementNS(SVG_NS, "title");
+        title.textContent = edge[2] + " calls, " + format_seconds(edge[3]);
+        line.appendChild(title);
+        svg.appendChild(line);
+    });
+
+    Object.keys(layout.positions).forEach(function(key) {
+        var i = parseInt(key);
+        var node = graph.nodes[i];
+        var position = layout.positions[i];
+        var ratio = (state.color_by == 'internal' ? node[3] : node[4]) / total;
+        var group = document.createElementNS(SVG_NS, "g");
+        group.setAttribute("class", "call-graph-node");
+        group.setAttribute("transform", "translate(" + position.x + "," + position.y + ")");
+        group.setAttribute("data-name", node[0].toLowerCase());
+        var rect = document.createElementNS(SVG_NS, "rect");
+        rect.setAttribute("width", GRAPH_NODE_WIDTH);
+        rect.setAttribute("height", GRAPH_NODE_HEIGHT);
+        rect.setAttribute("fill", temperature_color(ratio));
+        group.appendChild(rect);
+        [node[0],
+         (100 * node[4] / total).toFixed(2) + "% (" + (100 * node[3] / total).toFixed(2) + "%) " + node[2] + "x"
+        ].forEach(function(line, n) {
+            var text = document.createElementNS(SVG_NS, "text");
+            text.setAttribute("x", 5);
+            text.setAttribute("y", 16 + n * 18);
+            text.textContent = line;
+            group.appendChild(text);
+        });
+        var title = document.createElementNS(SVG_NS, "title");
+        title.textContent = node[0] + "\n" + node[1] + "\ncalls: " + node[2] +
+                            "\ninternal: " + format_seconds(node[3]) +
+                            "\ncumulative: " + format_seconds(node[4]);
+        group.appendChild(title);
+        svg.appendChild(group);
+    });
+
+    highlight_call_graph(viewer);
+}
+
+function highlight_call_graph(viewer) {
+    var search = viewer.state.search;
+    find_all('.call-graph-node', viewer).forEach(function(node) {
+        var match = search && node.getAttribute("data-name").indexOf(search) >= 0;
+        node.classList.toggle("highlighted", !!match);
+    });
+}
+
+function add_pan_zoom(svg) {
+    var dragging = null;
+    function view_box() {
+        return svg.getAttribute("viewBox").split(" ").map(parseFloat);
+    }
+    svg.addEventListener("wheel", function(event) {
+        event.preventDefault();
+        var box = view_box();
+        var rect = svg.getBoundingClientRect();
+        var scale = event.deltaY > 0 ? 1.2 : 1 / 1.2;
+        var px = box[0] + (event.clientX - rect.left) / rect.width * box[2];
+        var py = box[1] + (event.clientY - rect.top) / rect.height * box[3];
+        svg.setAttribute("viewBox", [px - (px - box[0]) * scale, py - (py - box[1]) * scale,
+                                     box[2] * scale, box[3] * scale].join(" "));
+    });
+    svg.addEventListener("mousedown", function(event) {
+        dragging = {x: event.clientX, y: event.clientY, box: view_box()};
+    });
+    svg.addEventListener("mousemove", function(event) {
+        if (!dragging) return;
+        var rect = svg.getBoundingClientRect();
+        var box = dragging.box;
+        var dx = (event.clientX - dragging.x) / rect.width * box[2];
+        var dy = (event.clientY - dragging.y) / rect.height * box[3];
+        svg.setAttribute("viewBox", [box[0] - dx, box[1] - dy, box[2], box[3]].join(" "));
+    });
+    window.addEventListener("mouseup", function() {
+        dragging = null;
+    });
+}
+
+/* Flame graph viewer
+ *
+ * Renders the flame graphs embedded as JSON by --html-flame-graph. Frames
+ * are [name, value, children] lists. Clicking a frame zooms into it, and
+ * clicking one of its callers zooms out again. Frames narrower than half a
+ * pixel are not drawn.
+ */
+
+var FLAME_GRAPH_WIDTH = 1200;
+var FLAME_FRAME_HEIGHT = 18;
+
+function render_flame_graph(viewer) {
+    if (viewer.flame) {
+        return;
+    }
+    var flame = JSON.parse(viewer.firstElementChild.textContent);
+    viewer.flame = flame;
+    viewer.state = {focus: flame.root, icicle: false, search: ''};
+    /* Remember the caller of each frame, to draw the callers of the focused frame */
+    var depth = 0;
+    var frontier = [[flame.root, 1]];
+    while (frontier.length) {
+        var item = frontier.pop();
+        depth = Math.max(depth, item[1]);
+        item[0][2].forEach(function(child) {
+            child.parent = item[0];
+            frontier.push([child, item[1] + 1]);
+        });
+    }
+    flame.depth = depth;
+
+    var controls = document.createElement("div");
+    controls.className = "flame-graph-controls";
+    controls.innerHTML =
+        'Search: <input type="text" class="flame-graph-search"> ' +
+        'Layout: <select class="flame-graph-layout"><option value="flame">flame graph</option>' +
+        '<option value="icicle">icicle</option></select> ' +
+        '<button class="flame-graph-reset">Reset zoom</button>';
+    viewer.appendChild(controls);
+
+    var svg = document.createElementNS(SVG_NS, "svg");
+    svg.setAttribute("class", "flame-graph");
+    viewer.appendChild(svg);
+
+    find('.flame-graph-search', controls).addEventListener("input", function(event) {
+        viewer.state.search = event.target.value.toLowerCase();
+        highlight_flame_graph(viewer);
+    });
+    find('.flame-graph-layout', controls).addEventListener("change", function(event) {
+        viewer.state.icicle = event.target.value == 'icicle';
+        draw_flame_graph(viewer);
+    });
+    find('.flame-graph-reset', controls).addEventListener("click", function() {
+        viewer.state.focus = flame.root;
+        draw_flame_graph(viewer);
+    });
+    svg.addEventListener("click", function(event) {
+        var frame = event.target.parentNode;
+        if (frame && frame.frame) {
+            viewer.state.focus = frame.frame;
+            draw_flame_graph(viewer);
+        }
+    });
+
+    draw_flame_graph(viewer);
+}
+
+function flame_color(name) {
+    /* Warm colors, stable for a given function */
+    var hash = 0;
+    for (var i = 0; i < name.length; i++) {
+        hash = (hash * 31 + name.charCodeAt(i)) | 0;
+    }
+    hash = Math.abs(hash);
+    return "hsl(" + (hash % 55) + ",85%," + (55 + (hash >> 8) % 15) + "%)";
+}
+
+function draw_flame_graph(viewer) {
+    var flame = viewer.flame;
+    var state = viewer.state;
+    var svg = find('svg.flame-graph', viewer);
+    var height = flame.depth * FLAME_FRAME_HEIGHT;
+    var total = flame.root[1] || 1;
+    var scale = FLAME_GRAPH_WIDTH / (state.focus[1] || 1);
+
+    while (svg.firstChild) {
+        svg.removeChild(svg.firstChild);
+    }
+    svg.setAttribute("viewBox", "0 0 " + FLAME_GRAPH_WIDTH + " " + height);
+    svg.style.height = height + "px";
+
+    function draw_frame(frame, x, width, level) {
+        var y = state.icicle ? level * FLAME_FRAME_HEIGHT : height - (level + 1) * FLAME_FRAME_HEIGHT;
+        var group = document.createElementNS(SVG_NS, "g");
+        group.setAttribute("class", "flame-frame");
+        group.setAttribute("data-name", frame[0].toLowerCase());
+        group.frame = frame;
+        var rect = document.createElementNS(SVG_NS, "rect");
+        rect.setAttribute("x", x);
+        rect.setAttribute("y", y);
+        rect.setAttribute("width", width);
+        rect.setAttribute("height", FLAME_FRAME_HEIGHT);
+        rect.setAttribute("fill", flame_color(frame[0]));
+        group.appendChild(rect);
+        var chars = Math.floor((width - 6) / 7);
+        if (chars > 2) {
+            var text = document.createElementNS(SVG_NS, "text");
+            text.setAttribute("x", x + 3);
+            text.setAttribute("y", y + FLAME_FRAME_HEIGHT - 5);
+            text.textContent = frame[0].length > chars ? frame[0].slice(0, chars - 2) + ".." : frame[0];
+            group.appendChild(text);
+        }
+        var title = document.createElementNS(SVG_NS, "title");
+        title.textContent = frame[0] + "\n" +
+            (flame.unit == 's' ? format_seconds(frame[1]) : frame[1] + " " + flame.unit) +
+            " (" + (100 * frame[1] / total).toFixed(2) + "%)";
+        group.appendChild(title);
+        svg.appendChild(group);
+    }
+
+    /* The callers of the focused frame span the whole width */
+    var callers = [];
+    for (var frame = state.focus; frame; frame = frame.parent) {
+        callers.unshift(frame);
+    }
+    callers.forEach(function(caller, level) {
+        draw_frame(caller, 0, FLAME_GRAPH_WIDTH, level);
+    });
+    var frontier = [[state.focus, 0, callers.length - 1]];
+    while (frontier.length) {
+        var item = frontier.pop();
+        var x = item[1];
+        item[0][2].forEach(function(child) {
+            var width = child[1] * scale;
+            if (width >= 0.5) {
+                draw_frame(child, x, width, item[2] + 1);
+                frontier.push([child, x, item[2] + 1]);
+            }
+            x += width;
+        });
+    }
+
+    highlight_flame_graph(viewer);
+}
+
+function highlight_flame_graph(viewer) {
+    var search = viewer.state.search;
+    find_all('.flame-frame', viewer).forEach(function(frame) {
+        var match = search && frame.getAttribute("data-name").indexOf(search) >= 0;
+        frame.classList.toggle("highlighted", !!match);
+    });
 }
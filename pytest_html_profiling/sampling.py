@@ -0,0 +1,108 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import signal
+from collections import Counter
+
+
+def is_supported():
+    return hasattr(signal, 'setitimer') and hasattr(signal, 'SIGPROF')
+
+
+class StackSampler(object):
+    """Statistical profiler that samples the Python stack on a SIGPROF timer.
+
+    The sampler mimics the parts of the cProfile.Profile interface used by
+    the plugin (enable, disable, create_stats and stats), so the sampled
+    stacks make a ProfileData like a regular profile. As
+    sampling does not see individual calls, the call counts in the
+    resulting statistics are the number of samples in which a function was
+    on the stack. The timer measures CPU time of the process, so time spent
+    sleeping or waiting on I/O is not sampled.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stats = {}
+        self._old_handler = None
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def enable(self):
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def disable(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        if self._old_handler is not None:
+            signal.signal(signal.SIGPROF, self._old_handler)
+            self._old_handler = None
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        self.stacks[tuple(stack)] += 1
+
+    def create_stats(self):
+        self.disable()
+        stats = {}
+        for stack, count in self.stacks.items():
+            time = count * self.interval
+            leaf = stack[-1]
+            seen_funcs = set()
+            seen_calls = set()
+            caller = None
+            for func in stack:
+                entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+                if func not in seen_funcs:
+                    # recursive functions are only counted once per sample
+                    seen_funcs.add(func)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += time
+                if caller is not None and (caller, func) not in seen_calls:
+                    seen_calls.add((caller, func))
+                    call = entry[4].setdefault(caller, [0, 0, 0.0, 0.0])
+                    call[0] += count
+                    call[1] += count
+                    call[3] += time
+                    if func == leaf:
+                        call[2] += time
+                caller = func
+            stats[leaf][2] += time
+
+        self.stats = dict(
+            (func, (cc, nc, tt, ct,
+                    dict((caller, tuple(call)) for caller, call in callers.items())))
+            for func, (cc, nc, tt, ct, callers) in stats.items())
+
+    def folded(self, root=None):
+        """Return the sampled stacks in the folded format used by flame graph tools.
+
+        If root is given, only the stacks through that function are returned,
+        starting at its outermost frame.
+        """
+        lines = []
+        for stack, count in self.stacks.items():
+            if root is not None:
+                if root not in stack:
+                    continue
+                stack = stack[stack.index(root):]
+            frames = ';'.join(format_frame(func) for func in stack)
+            lines.append('{0} {1}\n'.format(frames, count))
+        return ''.join(lines)
+
+
+def format_frame(func):
+    filename, line, name = func
+    return '{0} ({1}:{2})'.format(name, filename, line)
@@ -0,0 +1,86 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+import marshal
+import sqlite3
+import zlib
+
+from .profile_data import StatsSource
+
+STATS = 'test.cprof'
+
+
+class ProfileStore(object):
+    """Single-file store for the profiles and derived artifacts of a test session.
+
+    The store is an SQLite database with one row per test node id and
+    artifact name (e.g. 'test.cprof' or 'call_graph_non_pruned.png'), holding
+    the zlib-compressed content of the artifact. Writes are buffered and
+    committed in bulk, one transaction per batch. Any single artifact can
+    later be read back by random access, e.g.:
+
+        store = ProfileStore('pytest_profiles/2019_08_06_12_00_00.sqlite')
+        stats = pstats.Stats(store.get_stats_source('test_foo.py::test_bar'))
+    """
+
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS artifacts ('
+                'nodeid TEXT NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, '
+                'PRIMARY KEY (nodeid, name))')
+
+    def put(self, nodeid, name, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._pending.append((nodeid, name, sqlite3.Binary(zlib.compress(data))))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def put_stats(self, nodeid, stats):
+        self.put(nodeid, STATS, marshal.dumps(stats))
+
+    def flush(self):
+        if self._pending:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO artifacts (nodeid, name, data) '
+                    'VALUES (?, ?, ?)',
+                    self._pending)
+            self._pending = []
+
+    def get(self, nodeid, name):
+        self.flush()
+        row = self._conn.execute(
+            'SELECT data FROM artifacts WHERE nodeid = ? AND name = ?',
+            (nodeid, name)).fetchone()
+        if row is None:
+            raise KeyError((nodeid, name))
+        return zlib.decompress(bytes(row[0]))
+
+    def get_stats(self, nodeid):
+        return marshal.loads(self.get(nodeid, STATS))
+
+    def get_stats_source(self, nodeid):
+        return StatsSource(self.get_stats(nodeid))
+
+    def nodeids(self):
+        self.flush()
+        return [row[0] for row in self._conn.execute(
+            'SELECT DISTINCT nodeid FROM artifacts ORDER BY nodeid')]
+
+    def names(self, nodeid):
+        self.flush()
+        return [row[0] for row in self._conn.execute(
+            'SELECT name FROM artifacts WHERE nodeid = ? ORDER BY name', (nodeid,))]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -11,9 +11,13 @@ setup(
     url="https://github.com/hyperbrowser/pytest-html-profiling",
     packages=["pytest_html_profiling"],
     package_data={"pytest_html_profiling": ["resources/*"]},
-    entry_points={"pytest11": ["html = pytest_html_profiling.profiling_plugin"]},
+    entry_points={
+        "pytest11": ["html = pytest_html_profiling.profiling_plugin"],
+        "console_scripts": ["pytest-html-profiling = pytest_html_profiling.cli:main"],
+    },
     setup_requires=["setuptools_scm"],
-    install_requires=["pytest>=3.0", "pytest-metadata", 'gprof2dot'],
+    install_requires=["pytest>=3.0", "pytest-metadata", 'gprof2dot',
+                      'futures; python_version < "3"'],
     license="Mozilla Public License 2.0 (MPL 2.0)",
     keywords="py.test pytest html report",
     classifiers=[
@@ -0,0 +1,97 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Benchmark of adding rows to the results table of HTMLReport.
+
+Measures the time per added row once the table holds 1k to 200k rows, for
+the per-outcome buckets used by HTMLReport and for the previous ordering,
+which inserted each row at its sorted position with bisect. Only the
+ordering is measured, not the rendering of the rows. Run with the package
+installed (e.g. pip install -e .):
+
+    python testing/bench_result_buckets.py [--sizes 1000,10000,...] [--window 1000]
+"""
+
+from __future__ import print_function
+
+import argparse
+import bisect
+import gc
+import random
+import timeit
+
+from py.xml import html
+
+from pytest_html_profiling.plugin import HTMLReport
+
+OUTCOMES = ["Passed"] * 90 + ["Failed"] * 4 + ["Skipped"] * 4 + ["Error"] * 2
+
+
+class Config(object):
+    class pluginmanager(object):
+        @staticmethod
+        def hasplugin(name):
+            return False
+
+    def getoption(self, name, default=None):
+        return default
+
+
+class BisectReport(HTMLReport):
+    """HTMLReport with the previous bisect insertion of the rows."""
+
+    def __init__(self, logfile, config):
+        super(BisectReport, self).__init__(logfile, config)
+        self.results = []
+        self.test_logs = []
+
+    def _add_row(self, outcome, tbody):
+        result = self.TestResult.__new__(self.TestResult)
+        result.outcome = outcome
+        index = bisect.bisect_right(self.results, result)
+        self.results.insert(index, result)
+        self.test_logs.insert(index, tbody)
+
+
+def measure(report_cls, sizes, window):
+    """Return the mean time per added row after reaching each size."""
+    rng = random.Random(0)
+    report = report_cls("report.html", Config())
+    tbody = html.tbody()
+    timings = []
+    added = 0
+    for size in sizes:
+        for _ in range(size - added):
+            report._add_row(rng.choice(OUTCOMES), tbody)
+        outcomes = [rng.choice(OUTCOMES) for _ in range(window)]
+        gc.disable()
+        start = timeit.default_timer()
+        for outcome in outcomes:
+            report._add_row(outcome, tbody)
+        timings.append((timeit.default_timer() - start) / window)
+        gc.enable()
+        added = size + window
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,50000,100000,200000")
+    parser.add_argument("--window", type=int, default=1000)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    buckets = measure(HTMLReport, sizes, args.window)
+    bisected = measure(BisectReport, sizes, args.window)
+    print("{0:>8}  {1:>14}  {2:>14}".format("rows", "buckets (us)", "bisect (us)"))
+    for size, bucket_time, bisect_time in zip(sizes, buckets, bisected):
+        print(
+            "{0:>8}  {1:>14.2f}  {2:>14.2f}".format(
+                size, bucket_time * 1e6, bisect_time * 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -126,3 +126,266 @@ QUnit.test('find_all', function(assert) {
   assert.equal(find_all('.sortable').length, 3);
   assert.equal(find_all('.not-in-table').length, 0);
 });
+
+QUnit.module('virtual table', {
+  beforeEach: function(assert) {
+    this.table = find('#results-table').cloneNode(true);
+    find_all('.results-table-row').forEach(function(elem) {
+      elem.parentNode.removeChild(elem);
+    });
+    var data = document.createElement('script');
+    data.type = 'application/json';
+    data.id = 'results-data';
+    data.textContent = JSON.stringify([
+      virtual_row('passed', 'Passed', 'test_b', '0.20'),
+      virtual_row('failed', 'Failed', 'test_c', '1.50'),
+      virtual_row('passed', 'Passed', 'test_a', '0.10')
+    ]);
+    document.body.appendChild(data);
+    var status = document.createElement('p');
+    status.id = 'live-status';
+    document.body.appendChild(status);
+    init();
+  },
+  afterEach: function(assert) {
+    window.removeEventListener('scroll', update_virtual_table);
+    window.removeEventListener('resize', update_virtual_table);
+    window.removeEventListener('hashchange', scroll_to_virtual_anchor);
+    virtual_table = null;
+    ['#results-data', '#live-status'].forEach(function(selector) {
+      var elem = find(selector);
+      elem.parentNode.removeChild(elem);
+    });
+    var table = find('#results-table');
+    table.parentNode.replaceChild(this.table, table);
+  }
+});
+
+function virtual_row(outcome, result, name, duration) {
+  return [outcome, [result, name, duration, ''],
+          '<tr><td class="col-result">' + result + '</td>' +
+          '<td class="col-name">' + name + '</td>' +
+          '<td class="col-duration">' + duration + '</td>' +
+          '<td class="col-links"></td></tr>' +
+          '<tr><td class="extra" colspan="4"><div class="log"></div></td></tr>'];
+}
+
+function virtual_names() {
+  return virtual_table.view.map(function(row) {
+    return row.keys[1];
+  });
+}
+
+QUnit.test('virtual_table_init', function(assert) {
+  assert.equal(virtual_table.data.length, 3);
+  assert.deepEqual(virtual_names(), ['test_b', 'test_c', 'test_a']);
+  //Passed and Failed results have their log collapsed by default
+  assert.equal(virtual_table.data[0].collapsed, true);
+  assert.equal(find('#not-found-message').hidden, true);
+
+  var tbody = create_virtual_row(virtual_table.data[1]);
+  assert.equal(tbody.className, 'failed results-table-row');
+  assert.equal(tbody.getAttribute('data-row'), '1');
+  assert.equal(tbody.rows[1].className, 'collapsed');
+  assert.notEqual(find('.expander', tbody), null);
+});
+
+QUnit.test('virtual_table_sort_column', function(assert) {
+  function sort_column_test(col_re, names) {
+    sort_column(find(col_re));
+    assert.deepEqual(virtual_names(), names);
+  }
+
+  //the result column is sorted ascending initially, so it is reversed first
+  sort_column_test('[col=result]', ['test_a', 'test_b', 'test_c']);
+  sort_column_test('[col=result]', ['test_c', 'test_b', 'test_a']);
+
+  //name
+  sort_column_test('[col=name]', ['test_a', 'test_b', 'test_c']);
+  sort_column_test('[col=name]', ['test_c', 'test_b', 'test_a']);
+
+  //numeric
+  sort_column_test('[col=duration]', ['test_a', 'test_b', 'test_c']);
+  sort_column_test('[col=duration]', ['test_c', 'test_b', 'test_a']);
+
+  //sorting does not reorder the data rows are looked up in
+  assert.equal(virtual_table.data[0].keys[1], 'test_b');
+});
+
+QUnit.test('virtual_table_filter_table', function(assert) {
+  function filter_table_test(outcome, checked, names) {
+    var filter_input = document.createElement('input');
+    filter_input.setAttribute('data-test-result', outcome);
+    filter_input.checked = checked;
+    filter_table(filter_input);
+    assert.deepEqual(virtual_names(), names);
+  }
+
+  filter_table_test('passed', false, ['test_c']);
+  assert.equal(find('#not-found-message').hidden, true);
+  filter_table_test('failed', false, []);
+  assert.equal(find('#not-found-message').hidden, false);
+
+  //filters apply to the sorted rows
+  sort_column(find('[col=name]'));
+  filter_table_test('passed', true, ['test_a', 'test_b']);
+  assert.equal(find('#not-found-message').hidden, true);
+  filter_table_test('failed', true, ['test_a', 'test_b', 'test_c']);
+});
+
+QUnit.test('virtual_table_show_hide_all_extras', function(assert) {
+  function collapsed() {
+    return virtual_table.data.map(function(row) {
+      return row.collapsed;
+    });
+  }
+
+  show_all_extras();
+  assert.deepEqual(collapsed(), [false, false, false]);
+  hide_all_extras();
+  assert.deepEqual(collapsed(), [true, true, true]);
+});
+
+QUnit.test('add_virtual_rows', function(assert) {
+  sort_column(find('[col=name]'));
+  add_virtual_rows([virtual_row('skipped', 'Skipped', 'test_0', '0.00'),
+                    virtual_row('passed', 'Passed', 'test_d', '0.30')]);
+  //new rows are appended to the data and the view is sorted again
+  assert.equal(virtual_table.data.length, 5);
+  assert.equal(virtual_table.data[3].id, 3);
+  assert.equal(virtual_table.data[4].keys[1], 'test_d');
+  assert.deepEqual(virtual_names(),
+                   ['test_0', 'test_a', 'test_b', 'test_c', 'test_d']);
+
+  //hidden outcomes stay hidden
+  var filter_input = document.createElement('input');
+  filter_input.setAttribute('data-test-result', 'skipped');
+  filter_input.checked = false;
+  filter_table(filter_input);
+  add_virtual_rows([virtual_row('skipped', 'Skipped', 'test_e', '0.00')]);
+  assert.deepEqual(virtual_names(), ['test_a', 'test_b', 'test_c', 'test_d']);
+
+  add_virtual_rows([]);
+  assert.equal(virtual_table.data.length, 6);
+});
+
+QUnit.test('poll_live', function(assert) {
+  var requests = [];
+  var XMLHttpRequest_ = window.XMLHttpRequest;
+  window.XMLHttpRequest = function() {
+    requests.push(this);
+  };
+  window.XMLHttpRequest.prototype.open = function(method, url) {
+    this.url = url;
+  };
+  window.XMLHttpRequest.prototype.send = function() {};
+  var summary = {tests: 4, duration: 1.5, passed: 3, skipped: 0, failed: 1,
+                 errors: 0, xfailed: 0, xpassed: 0, rerun: null,
+                 finished: true, report: 'report.html'};
+  try {
+    poll_live('/updates', 2, 1);
+  } finally {
+    window.XMLHttpRequest = XMLHttpRequest_;
+  }
+  assert.equal(requests.length, 1);
+  assert.equal(requests[0].url, '/updates?since=2');
+  requests[0].status = 200;
+  requests[0].responseText = JSON.stringify({
+    next: 4, dropped: 2, summary: summary,
+    updates: [['row', virtual_row('passed', 'Passed', 'test_d', '0.30')],
+              ['other', null]]
+  });
+  requests[0].onload();
+
+  assert.deepEqual(virtual_names(), ['test_b', 'test_c', 'test_a', 'test_d']);
+  assert.equal(find('#live-status').textContent,
+               '4 tests ran in 1.50 seconds: 3 passed, 0 skipped, 1 failed, ' +
+               '0 errors, 0 expected failures, 0 unexpected passes. ' +
+               'The session finished, the report is report.html. ' +
+               '3 updates were dropped, see the report written at the end of ' +
+               'the session.');
+
+  set_live_status(null, 0);
+  assert.equal(find('#live-status').textContent.indexOf('The session finished'), 0);
+});
+
+QUnit.module('lazy extras', {
+  beforeEach: function(assert) {
+    this.extra = document.createElement('div');
+    this.extra.id = 'lazy-extra-test';
+    document.body.appendChild(this.extra);
+  },
+  afterEach: function(assert) {
+    this.extra.parentNode.removeChild(this.extra);
+  }
+});
+
+function lazy_extra_loader(element, src, data) {
+  var loader = document.createElement('script');
+  loader.type = 'application/octet-stream';
+  loader.className = 'lazy-extra';
+  if (src) {
+    loader.setAttribute('data-src', src);
+  }
+  loader.textContent = data || '';
+  element.appendChild(loader);
+  return loader;
+}
+
+QUnit.test('load_lazy_extra_loaded', function(assert) {
+  var calls = 0;
+  load_lazy_extra(this.extra, function() {
+    calls++;
+  });
+  assert.equal(calls, 1);
+});
+
+QUnit.test('load_lazy_extra_script', function(assert) {
+  var done = assert.async();
+  var element = this.extra;
+  var calls = 0;
+  lazy_extra_loader(element, 'data:text/javascript,' + encodeURIComponent(
+      'load_extra_content("lazy-extra-test", ' +
+      '"<p class=\\"lazy-content\\">Loaded</p>");'));
+  load_lazy_extra(element, function() {
+    calls++;
+    assert.equal(calls, 1);
+    assert.equal(find('.lazy-content', element).textContent, 'Loaded');
+    assert.equal(find('script.lazy-extra', element), null);
+    assert.equal(lazy_extras[element.id], undefined);
+    done();
+  });
+  //clicks while the extra is loading do not load it again
+  load_lazy_extra(element, function() {
+    calls++;
+  });
+  assert.equal(find_all('script[src^="data:"]', document.head).length, 1);
+});
+
+QUnit.test('load_lazy_extra_error', function(assert) {
+  var done = assert.async();
+  var element = this.extra;
+  lazy_extra_loader(element, 'does-not-exist.js');
+  load_lazy_extra(element, function() {
+    assert.equal(element.textContent, 'Could not load does-not-exist.js');
+    done();
+  });
+});
+
+QUnit.test('load_lazy_extra_compressed', function(assert) {
+  var done = assert.async();
+  var element = this.extra;
+  //'<p class="lazy-content">Inflated</p>' zlib compressed and base64 encoded
+  lazy_extra_loader(element, null,
+                    'eJyzKVBIzkksLrZVykmsqtRNzs8rSc0rUbLzzEvLSSxJTbHRL7ADAO0WDMo=');
+  load_lazy_extra(element, function() {
+    if (typeof DecompressionStream === 'undefined') {
+      assert.equal(element.textContent,
+                   'This browser cannot decompress the embedded data.');
+    } else {
+      assert.equal(find('.lazy-content', element).textContent, 'Inflated');
+    }
+    assert.equal(find('script.lazy-extra', element), null);
+    done();
+  });
+});
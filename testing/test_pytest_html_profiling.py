@@ -2,14 +2,17 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from base64 import b64encode
+from base64 import b64decode, b64encode
 from distutils.version import LooseVersion
 import json
+import marshal
 import os
 import sys
 import pkg_resources
 import random
 import re
+import time
+import zlib
 
 import pytest
 
@@ -28,6 +31,32 @@ def read_html(path):
         return f.read()
 
 
+def make_work_module(testdir, runs=None, work="sum(range(100))", check=None, extra=""):
+    """Write the test module profiled by most tests: test_work calls work(), defined
+    on line 2, once or for each n in range(runs), then runs check, if given. Other
+    tests can be appended as extra."""
+    source = ["import pytest", "def work():", "    return " + work]
+    if runs is None:
+        source.append("def test_work():")
+    else:
+        source.append('@pytest.mark.parametrize("n", range({0}))'.format(runs))
+        source.append("def test_work(n):")
+    source.append("    work()")
+    if check:
+        source.append("    " + check)
+    return testdir.makepyfile("\n".join(source) + "\n" + extra)
+
+
+def profile_test_dir(session_dir, nodeid):
+    from pytest_html_profiling.profiling_plugin import ProfilingHTMLReport
+
+    return session_dir.join(ProfilingHTMLReport.get_test_dirname(nodeid))
+
+
+def results_table(html):
+    return html[html.index('id="results-table"') :]
+
+
 def assert_results_by_outcome(html, test_outcome, test_outcome_number, label=None):
     # Asserts if the test number of this outcome in the summary is correct
     regex_summary = r"(\d)+ {0}".format(label or test_outcome)
@@ -841,3 +870,1330 @@ class TestHTML:
         testdir.makepyfile("def test_pass(): pass")
         result = testdir.runpytest("--css", "style.css")
         assert result.ret == 0
+
+    def test_streaming(self, testdir):
+        testdir.makepyfile(
+            """
+            import pytest
+            def test_pass_1(): pass
+            def test_fail_1(): assert False
+            @pytest.mark.skip
+            def test_skip(): pass
+            def test_pass_2(): print("\u2603 <tag>")
+            def test_fail_2(): assert False
+            @pytest.mark.xfail
+            def test_xfail(): assert False
+        """
+        )
+        result, html = run(testdir, "report.html")
+        streamed_result, streamed_html = run(
+            testdir, "streamed.html", "--html-streaming"
+        )
+        assert streamed_result.ret == result.ret
+        assert_results(streamed_html, tests=5, passed=2, failed=2, skipped=1, xfailed=1)
+        rows = re.findall('<td class="col-name">(.*?)</td>', html)
+        assert re.findall('<td class="col-name">(.*?)</td>', streamed_html) == rows
+        assert rows[:2] == [
+            "test_streaming.py::test_fail_1",
+            "test_streaming.py::test_fail_2",
+        ]
+        assert "\u2603 &lt;tag&gt;" in streamed_html
+        assert "pytest-html:results" not in streamed_html
+
+    @pytest.mark.parametrize("args", [[], ["--html-streaming"]])
+    def test_virtual_table(self, testdir, args):
+        testdir.makepyfile(
+            """
+            import pytest
+            def test_pass(): print("</script> \u2603")
+            def test_fail(): assert False
+            @pytest.mark.skip
+            def test_skip(): pass
+        """
+        )
+        result, html = run(testdir, "report.html", "--html-virtual-table", *args)
+        assert result.ret == 1
+        assert "2 tests ran" in html
+        assert "results-table-row" not in results_table(html).split("<script")[0]
+        data = re.search(
+            '<script id="results-data" type="application/json">(.*?)</script>',
+            html,
+            re.S,
+        )
+        rows = json.loads(data.group(1))
+        assert [(row[0], row[1][:2]) for row in rows] == [
+            ("failed", ["Failed", "test_virtual_table.py::test_fail"]),
+            ("skipped", ["Skipped", "test_virtual_table.py::test_skip::setup"]),
+            ("passed", ["Passed", "test_virtual_table.py::test_pass"]),
+        ]
+        assert float(rows[0][1][2]) >= 0
+        assert rows[0][2].lstrip().startswith("<tr>")
+        assert "&lt;/script&gt; \u2603" in rows[2][2]
+
+    def test_json_results(self, testdir):
+        testdir.makepyfile(
+            """
+            import pytest
+            @pytest.fixture
+            def broken():
+                yield
+                raise ValueError
+            def test_pass(): pass
+            def test_fail(broken): assert False
+            @pytest.mark.skip
+            def test_skip(): pass
+        """
+        )
+        path = testdir.tmpdir.join("results", "report.jsonl")
+        result, html = run(testdir, "report.html", "--html-json", path)
+        assert result.ret == 1
+        records = [json.loads(line) for line in path.readlines()]
+        assert [(record["type"], record.get("nodeid")) for record in records] == [
+            ("test", "test_json_results.py::test_pass"),
+            ("test", "test_json_results.py::test_fail"),
+            ("test", "test_json_results.py::test_skip"),
+            ("summary", None),
+        ]
+        assert [record.get("outcome") for record in records[:3]] == [
+            "passed",
+            "error",
+            "skipped",
+        ]
+        assert sorted(records[0]["durations"]) == ["call", "setup", "teardown"]
+        assert records[0]["duration"] == sum(records[0]["durations"].values())
+        assert sorted(records[2]["durations"]) == ["setup", "teardown"]
+        assert "profile" not in records[0]
+        summary = records[3]
+        assert (summary["tests"], summary["passed"], summary["failed"]) == (2, 1, 1)
+        assert (summary["errors"], summary["skipped"]) == (1, 1)
+        assert summary["duration"] > 0
+
+    def test_json_results_without_html(self, testdir):
+        testdir.makepyfile("def test_pass(): pass")
+        result = testdir.runpytest("--html-json", "report.jsonl")
+        assert result.ret != 0
+        result.stderr.fnmatch_lines(["*--html-json requires --html.*"])
+        assert not testdir.tmpdir.join("report.jsonl").check()
+
+    def test_live(self, testdir):
+        testdir.makepyfile(
+            """
+            import io
+            import json
+            import threading
+            import time
+            try:
+                from urllib.request import urlopen
+            except ImportError:
+                from urllib2 import urlopen
+            def poll(url):
+                # as the live page does, until the session finished
+                since = 0
+                while True:
+                    content = urlopen(url + "updates?since=%d" % since).read()
+                    updates = json.loads(content.decode("utf-8"))
+                    since = updates["next"]
+                    if updates["summary"]["finished"]:
+                        with io.open("finished.json", "wb") as f:
+                            f.write(content)
+                        return
+                    time.sleep(0.05)
+            def test_pass(): pass
+            def test_fail(): assert False
+            def test_zpoll(request):
+                url = request.config._html.live.url
+                with io.open("page.html", "wb") as f:
+                    f.write(urlopen(url).read())
+                with io.open("updates.json", "wb") as f:
+                    f.write(urlopen(url + "updates?since=1").read())
+                threading.Thread(target=poll, args=(url,)).start()
+        """
+        )
+        result, html = run(testdir, "report.html", "--html-live", "0")
+        assert result.ret == 1
+        result.stdout.fnmatch_lines(["live html report: http://127.0.0.1:*/"])
+        page = testdir.tmpdir.join("page.html").read_text("utf-8")
+        assert 'data-live="updates"' in page
+        assert "results-table-row" not in results_table(page)
+        updates = json.loads(testdir.tmpdir.join("updates.json").read_text("utf-8"))
+        assert updates["next"] == 4
+        assert updates["dropped"] == 0
+        assert (updates["summary"]["passed"], updates["summary"]["failed"]) == (1, 1)
+        assert not updates["summary"]["finished"]
+        assert [update[0] for update in updates["updates"]] == ["test", "row", "test"]
+        assert updates["updates"][0][1]["nodeid"] == "test_live.py::test_pass"
+        assert updates["updates"][1][1][:2] == [
+            "failed",
+            ["Failed", "test_live.py::test_fail", updates["updates"][1][1][1][2], ""],
+        ]
+        assert updates["updates"][2][1]["outcome"] == "failed"
+        assert_results(html, tests=3, passed=2, failed=1)
+        # the server is kept up until polled once the session finished
+        finished = testdir.tmpdir.join("finished.json")
+        for _ in range(100):
+            if finished.check():
+                break
+            time.sleep(0.05)
+        summary = json.loads(finished.read_text("utf-8"))["summary"]
+        assert summary["finished"]
+        assert summary["tests"] == 3
+
+    def test_live_without_html(self, testdir):
+        testdir.makepyfile("def test_pass(): pass")
+        result = testdir.runpytest("--html-live", "0")
+        assert result.ret != 0
+        result.stderr.fnmatch_lines(["*--html-live requires --html.*"])
+
+
+class TestHTMLProfiling:
+    @pytest.mark.parametrize(
+        "args",
+        [
+            [],
+            ["--html-profile-deferred"],
+            ["--html-profile-deferred", "--html-streaming"],
+        ],
+    )
+    def test_profiling(self, testdir, args):
+        make_work_module(testdir)
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-call-graph", *args
+        )
+        assert result.ret == 0
+        assert_results(html)
+        assert "pytest-html-profiling:" not in html
+        assert "--- PROFILE (SORTED BY CUMULATIVE TIME)---" in html
+        assert "--- PROFILE (SORTED BY INTERNAL TIME)---" in html
+        assert "test_profiling.py:2(work)" in html
+        images = re.findall(r'<img src="pytest_profiles/.*\.png">', results_table(html))
+        assert len(images) == 3
+
+    @pytest.mark.parametrize("args", [[], ["--html-profile-deferred"]])
+    def test_profiling_same_test_names(self, testdir, args):
+        testdir.makepyfile(
+            test_first="""
+            def first():
+                return sum(range(100))
+            def test_work():
+                first()
+        """,
+            test_second="""
+            def second():
+                return sum(range(100))
+            class TestWork(object):
+                def test_work(self):
+                    second()
+        """,
+        )
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-call-graph", *args
+        )
+        assert result.ret == 0
+        assert_results(html, tests=2, passed=2)
+        images = re.findall(
+            r'<img src="(pytest_profiles/.*?\.png)">', results_table(html)
+        )
+        assert len(images) == len(set(images)) == 6
+        (session_dir,) = testdir.tmpdir.join("pytest_profiles").listdir(
+            lambda path: path.check(dir=1)
+        )
+        for nodeid, function in [
+            ("test_first.py::test_work", "first"),
+            ("test_second.py::TestWork::test_work", "second"),
+        ]:
+            test_dir = profile_test_dir(session_dir, nodeid)
+            assert test_dir.basename.startswith("test_work-")
+            stats = marshal.loads(test_dir.join("test.cprof").read_binary())
+            assert function in [key[2] for key in stats]
+
+    @pytest.mark.parametrize(
+        "args", [[], ["--html-profile-deferred"], ["--self-contained-html"]]
+    )
+    def test_profiling_lazy(self, testdir, args):
+        make_work_module(testdir)
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-call-graph",
+            "--html-call-graph-format=json",
+            "--html-profile-lazy",
+            *args
+        )
+        assert result.ret == 0
+        assert_results(html)
+        assert "pytest-html-profiling:" not in html
+        assert "SORTED BY" not in html
+        loaders = re.findall(
+            r'<script type="application/octet-stream" class="lazy-extra"'
+            r'(?: data-src="(.*?)")?>(.*?)</script>',
+            results_table(html),
+        )
+        assert len(loaders) == 3
+        contents = []
+        for src, data in loaders:
+            if "--self-contained-html" in args:
+                assert not src
+                contents.append(zlib.decompress(b64decode(data)).decode("utf-8"))
+            else:
+                assert src.startswith("pytest_profiles/") and not data
+                with open(str(testdir.tmpdir.join(src))) as f:
+                    asset = f.read()
+                assert asset.startswith('load_extra_content("test_profiling_lazy.py::')
+                contents.append(json.loads(asset.split(", ", 1)[1][: -len(");\n")]))
+        assert "--- PROFILE (SORTED BY INTERNAL TIME)---" in contents[0]
+        assert "--- PROFILE (SORTED BY CUMULATIVE TIME)---" in contents[1]
+        assert "call-graph-viewer" in contents[2]
+
+    @pytest.mark.parametrize("profiler", ["cprofile", "sampling"])
+    def test_profiling_without_harness(self, testdir, profiler):
+        testdir.makepyfile(
+            """
+            import time
+            import pytest
+            def work():
+                end = time.time() + 0.05
+                while time.time() < end:
+                    pass
+            @pytest.mark.parametrize("n", [1, 2])
+            def test_work(n):
+                work()
+        """
+        )
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profiler",
+            profiler,
+            "--html-call-graph",
+            "--html-call-graph-format=json",
+            "--html-profile-hotspots=0",
+        )
+        assert result.ret == 0
+        assert_results(html, tests=2, passed=2)
+        table = results_table(html).split("<script>")[0]
+        assert "test_profiling_without_harness.py:3(work)" in table
+        assert "pluggy" not in table
+        assert "_pytest" not in table
+        graphs = re.findall(
+            '<div class="call-graph-viewer">'
+            '<script type="application/json">(.*?)</script></div>',
+            table,
+        )
+        assert len(graphs) == 2
+        for graph in graphs:
+            names = [node[0] for node in json.loads(graph)["nodes"]]
+            assert "test_profiling_without_harness:7:test_work" in names
+            assert "test_profiling_without_harness:3:work" in names
+            assert not any("_pytest" in name or "pluggy" in name for name in names)
+
+    @pytest.mark.parametrize("table", [False, True])
+    def test_profiling_top_functions(self, testdir, table):
+        make_work_module(testdir)
+        args = [
+            "--html-profiling",
+            "--html-profile-top=1",
+            "--html-profile-include=*/test_profiling_top_functions.py",
+            "--html-profile-exclude=*/_pytest/*",
+            "--html-profile-hotspots=0",
+        ]
+        if table:
+            args.append("--html-profile-table")
+        result, html = run(testdir, "report.html", *args)
+        assert result.ret == 0
+        assert_results(html)
+        assert "--- PROFILE (SORTED BY INTERNAL TIME)---" in html
+        assert "test_profiling_top_functions.py:4(test_work)" in html
+        assert "_pytest" not in results_table(html).split("<script")[0]
+        if table:
+            tables = re.findall(r'<table class="profile-table">.*?</table>', html)
+            assert len(tables) == 2
+            assert all(table.count("<td>") == 6 for table in tables)
+            assert "1 of 2 functions listed" in html
+        else:
+            assert '<table class="profile-table">' not in html
+            assert "List reduced from 2 to 1 due to restriction" in html
+
+    def test_deferred_workers(self, testdir):
+        testdir.makepyfile(
+            """
+            import pytest
+            @pytest.mark.parametrize("n", range(4))
+            def test_work(n):
+                sum(range(n))
+        """
+        )
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profile-deferred",
+            "--html-profile-workers",
+            "2",
+        )
+        assert result.ret == 0
+        assert_results(html, tests=4, passed=4)
+        assert "pytest-html-profiling:" not in html
+        table = results_table(html)
+        assert len(re.findall("PROFILE \\(SORTED BY INTERNAL TIME\\)", table)) == 4
+
+    def test_deferred_processing_error(self, testdir):
+        testdir.makeconftest(
+            """
+            from pytest_html_profiling import profiling_plugin
+            process_profile = profiling_plugin.process_profile
+            def failing_process_profile(name, *args, **kwargs):
+                if name == "test_broken":
+                    raise ValueError("cannot process " + name)
+                return process_profile(name, *args, **kwargs)
+            def pytest_configure(config):
+                profiling_plugin.process_profile = failing_process_profile
+            def pytest_unconfigure(config):
+                profiling_plugin.process_profile = process_profile
+        """
+        )
+        testdir.makepyfile(
+            """
+            def test_broken():
+                sum(range(100))
+            def test_fine():
+                sum(range(100))
+        """
+        )
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profile-deferred"
+        )
+        assert result.ret == 0
+        assert_results(html, tests=2, passed=2)
+        assert "pytest-html-profiling:" not in html
+        table = results_table(html)
+        assert len(re.findall("PROFILE \\(SORTED BY INTERNAL TIME\\)", table)) == 1
+        assert (
+            "The profile could not be processed: ValueError: cannot process test_broken"
+            in table
+        )
+
+    def test_sampling_profiler(self, testdir):
+        testdir.makepyfile(
+            """
+            import time
+            def busy():
+                end = time.process_time() + 0.1
+                while time.process_time() < end:
+                    pass
+            def test_busy():
+                busy()
+        """
+        )
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profiler",
+            "sampling",
+            "--html-sampling-interval",
+            "0.001",
+        )
+        assert result.ret == 0
+        assert_results(html)
+        assert "test_sampling_profiler.py:2(busy)" in html
+        folded = testdir.tmpdir.join("pytest_profiles").visit("test.folded")
+        assert "busy (" in next(folded).read()
+
+    @pytest.mark.parametrize("args", [[], ["--html-profile-deferred"]])
+    def test_profile_store(self, testdir, args):
+        from pytest_html_profiling.store import ProfileStore
+
+        testdir.makepyfile(
+            test_one="def test_same_name(): sum(range(10))",
+            test_two="def test_same_name(): sum(range(20))",
+        )
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-call-graph",
+            "--html-profile-store",
+            *args
+        )
+        assert result.ret == 0
+        assert_results(html, tests=2, passed=2)
+        images = re.findall('<img src="data:image/png;base64,', results_table(html))
+        assert len(images) == 6
+
+        profile_dir = testdir.tmpdir.join("pytest_profiles")
+        (store_path,) = profile_dir.listdir("*.sqlite")
+        assert store_path.ext == ".sqlite"
+        store = ProfileStore(str(store_path))
+        nodeids = ["test_one.py::test_same_name", "test_two.py::test_same_name"]
+        assert store.nodeids() == ["<session>"] + nodeids
+        assert "call_graph_non_pruned.png" in store.names(nodeids[0])
+        assert any(key[2] == "test_same_name" for key in store.get_stats(nodeids[1]))
+        store.close()
+
+    def test_profile_data(self, tmpdir):
+        import cProfile
+        import gprof2dot
+        from pytest_html_profiling.profile_data import ProfileData
+
+        def work():
+            return sorted(str(i) for i in range(100))
+
+        prof = cProfile.Profile()
+        prof.enable()
+        work()
+        prof.disable()
+        data = ProfileData.from_profiler(prof)
+        path = str(tmpdir.join("test.cprof"))
+        data.dump(path)
+
+        assert "Ordered by: internal time" in data.format_stats("time")
+        assert "Ordered by: cumulative time" in data.format_stats("cumulative")
+
+        expected = gprof2dot.PstatsParser(path).parse()
+        profile = data.to_gprof2dot()
+        assert sorted(f.name for f in profile.functions.values()) == sorted(
+            f.name for f in expected.functions.values()
+        )
+
+        (root,) = data.find_functions(":work")
+        expected.prune_root(
+            [f.id for f in expected.functions.values() if f.name.endswith(":work")]
+        )
+        profile = data.to_gprof2dot([root])
+        assert sorted(f.name for f in profile.functions.values()) == sorted(
+            f.name for f in expected.functions.values()
+        )
+
+    @pytest.mark.parametrize("args", [[], ["--html-profile-deferred"]])
+    def test_interactive_call_graph(self, testdir, args):
+        make_work_module(testdir)
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-call-graph",
+            "--html-call-graph-format",
+            "json",
+            *args
+        )
+        assert result.ret == 0
+        assert "<img src" not in html
+        viewers = re.findall(
+            '<div class="call-graph-viewer"><script type="application/json">'
+            "(.*?)</script></div>",
+            results_table(html),
+        )
+        assert len(viewers) == 1
+        graph = json.loads(viewers[0])
+        names = [node[0] for node in graph["nodes"]]
+        assert names[:2] == [
+            "test_interactive_call_graph:2:work",
+            "test_interactive_call_graph:4:test_work",
+        ]
+        assert [1, 0, 1] in [edge[:3] for edge in graph["edges"]]
+
+    @pytest.mark.parametrize("args", [[], ["--html-profile-deferred"]])
+    def test_flame_graph(self, testdir, args):
+        testdir.makepyfile(
+            """
+            def leaf():
+                return sum(range(100))
+            def work():
+                return leaf()
+            def test_work():
+                work()
+        """
+        )
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-flame-graph", *args
+        )
+        assert result.ret == 0
+        assert "<img src" not in html
+        viewers = re.findall(
+            '<div class="flame-graph-viewer"><script type="application/json">'
+            "(.*?)</script></div>",
+            html,
+        )
+        # the test, and the session in the suite hotspots
+        assert len(viewers) == 2
+        graph = json.loads(viewers[0])
+        assert graph["unit"] == "s"
+        (test,) = graph["root"][2]
+        assert test[0] == "test_flame_graph:5:test_work"
+        (work,) = test[2]
+        assert work[0] == "test_flame_graph:3:work"
+        assert work[2][0][0] == "test_flame_graph:1:leaf"
+        assert graph["total"] >= test[1] >= work[1] >= work[2][0][1]
+
+    def test_profile_export(self, testdir):
+        make_work_module(testdir, runs=2, work="sum(range(1000))")
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profile-export=speedscope",
+            "--html-profile-export=chrome",
+        )
+        assert result.ret == 0
+        profile_dir = testdir.tmpdir.join("pytest_profiles")
+        (session_dir,) = profile_dir.listdir(lambda path: path.check(dir=1))
+        for nodeid in [
+            "test_profile_export.py::test_work[0]",
+            "test_profile_export.py::test_work[1]",
+            "<session>",
+        ]:
+            test_dir = profile_test_dir(session_dir, nodeid)
+            speedscope = json.loads(test_dir.join("test.speedscope.json").read())
+            frames = [frame["name"] for frame in speedscope["shared"]["frames"]]
+            assert "work" in frames
+            (profile,) = speedscope["profiles"]
+            assert profile["unit"] == "seconds"
+            assert len(profile["samples"]) == len(profile["weights"])
+            trace = json.loads(test_dir.join("test.trace.json").read())
+            assert "work" in [event["name"] for event in trace["traceEvents"]]
+
+        (trace_path,) = profile_dir.listdir("*.trace.json")
+        events = json.loads(trace_path.read())["traceEvents"]
+        tracks = dict(
+            (event["args"]["name"], event["tid"])
+            for event in events
+            if event["name"] == "thread_name"
+        )
+        assert sorted(tracks) == [
+            "test_profile_export.py::test_work[0]",
+            "test_profile_export.py::test_work[1]",
+        ]
+        for nodeid, tid in tracks.items():
+            spans = [event for event in events if event.get("tid") == tid]
+            (test,) = [span for span in spans if span.get("cat") == "test"]
+            assert test["name"] == nodeid
+            phases = [span for span in spans if span.get("cat") == "phase"]
+            assert [phase["name"] for phase in phases] == ["setup", "call", "teardown"]
+            for phase in phases:
+                assert test["ts"] <= phase["ts"]
+                assert phase["ts"] + phase["dur"] <= test["ts"] + test["dur"] + 1
+
+    def test_profile_export_same_test_names(self, testdir):
+        testdir.makepyfile(
+            test_first="""
+            def first():
+                return sum(range(100))
+            def test_work():
+                first()
+        """,
+            test_second="""
+            def second():
+                return sum(range(100))
+            class TestWork(object):
+                def test_work(self):
+                    second()
+        """,
+        )
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profile-export=speedscope",
+            "--html-profile-export=chrome",
+        )
+        assert result.ret == 0
+        table = results_table(html)
+        link_regex = '<a class="url" href="(.*?)"[^>]*>{0}</a>'
+        for label in ["speedscope profile", "Chrome trace"]:
+            links = re.findall(link_regex.format(label), table)
+            assert len(links) == len(set(links)) == 2
+        for link, function in zip(
+            re.findall(link_regex.format("speedscope profile"), table),
+            ["first", "second"],
+        ):
+            speedscope = json.loads(testdir.tmpdir.join(link).read())
+            frames = speedscope["shared"]["frames"]
+            assert function in [frame["name"] for frame in frames]
+
+    @pytest.mark.parametrize("args", [[], ["--html-profile-deferred"]])
+    def test_callgrind_export(self, testdir, args):
+        make_work_module(testdir, work="sum(range(1000))")
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profile-export=callgrind",
+            *args
+        )
+        assert result.ret == 0
+        (session_dir,) = testdir.tmpdir.join("pytest_profiles").listdir(
+            lambda path: path.check(dir=1)
+        )
+        test_dir = profile_test_dir(session_dir, "test_callgrind_export.py::test_work")
+        (callgrind,) = test_dir.listdir("callgrind.out.*")
+        links = re.findall(
+            '<a class="url" href="(.*?)"[^>]*>Callgrind profile</a>', html
+        )
+        assert links == [callgrind.relto(testdir.tmpdir)]
+        content = callgrind.read()
+        assert content.startswith("# callgrind format\n")
+        assert "events: Microseconds\n" in content
+        # test_work calls work once, from the first line of test_work
+        assert re.search(
+            r"fn=\(\d+\) test_work:4\n4 \d+\n"
+            r"cfi=\(\d+\)\ncfn=\(\d+\)\ncalls=1 2\n4 \d+\n",
+            content,
+        )
+        assert len(session_dir.join("session").listdir("callgrind.out.*")) == 1
+
+    def test_flame_graph_from_folded_stacks(self):
+        from pytest_html_profiling import flamegraph
+
+        folded = (
+            "test (test_a.py:5);work (test_a.py:3);leaf (test_a.py:1) 6\n"
+            "test (test_a.py:5);work (test_a.py:3) 3\n"
+            "test (test_a.py:5);rare (test_a.py:7) 1\n"
+            "test (test_a.py:5);work (test_a.py:3);other (test_b.py:1) 2\n"
+        )
+        graph = flamegraph.from_folded(folded, min_fraction=0.1)
+        assert graph == {
+            "unit": "samples",
+            "total": 12,
+            "root": [
+                "all",
+                12,
+                [
+                    [
+                        "test_a:5:test",
+                        12,
+                        [
+                            [
+                                "test_a:3:work",
+                                11,
+                                [["test_a:1:leaf", 6, []], ["test_b:1:other", 2, []]],
+                            ]
+                        ],
+                    ]
+                ],
+            ],
+        }
+
+    @pytest.mark.parametrize(
+        "args", [[], ["--html-profile-deferred"], ["--html-profile-store"]]
+    )
+    def test_xdist_profiling(self, testdir, args):
+        pytest.importorskip("xdist")
+        make_work_module(testdir, runs=4)
+        result, html = run(
+            testdir,
+            "report.html",
+            "-n",
+            "2",
+            "--html-profiling",
+            "--html-call-graph",
+            *args
+        )
+        assert result.ret == 0
+        assert_results(html, tests=4, passed=4)
+        assert "pytest-html-profiling:" not in html
+        table = results_table(html)
+        assert len(re.findall("PROFILE \\(SORTED BY INTERNAL TIME\\)", table)) == 4
+        assert len(re.findall("test_xdist_profiling.py:2\\(work\\)", table)) == 8
+        assert len(re.findall("<img src=", results_table(html))) == 12
+        profile_dir = testdir.tmpdir.join("pytest_profiles")
+        assert len(profile_dir.listdir(lambda path: path.ext != ".jsonl")) == 1
+
+    def test_live_files(self, testdir):
+        testdir.tmpdir.join("secret.txt").write("secret")
+        testdir.makepyfile(
+            """
+            import io
+            import json
+            import re
+            try:
+                from urllib.request import urlopen
+                from urllib.error import HTTPError
+                from urllib.parse import urljoin
+            except ImportError:
+                from urllib2 import HTTPError, urlopen
+                from urlparse import urljoin
+            def test_work():
+                sum(range(100))
+            def test_zfetch(request):
+                url = request.config._html.live.url
+                updates = json.loads(urlopen(url + "updates").read().decode("utf-8"))
+                (row,) = [update[1][2] for update in updates["updates"]
+                          if update[0] == "row"]
+                srcs = re.findall('data-src="(.*?)"', row)
+                with io.open("live.json", "w", encoding="utf-8") as f:
+                    f.write(json.dumps({
+                        "row": row,
+                        "srcs": srcs,
+                        "extras": [urlopen(urljoin(url, src)).read().decode("utf-8")
+                                   for src in srcs],
+                    }))
+                for path in ["../secret.txt", "%2e%2e/secret.txt", "../nothing.js"]:
+                    try:
+                        urlopen(url + path)
+                    except HTTPError as err:
+                        assert err.code == 404
+                    else:
+                        assert False, path
+                # the end of the session is not polled
+                request.config._html.live.final_poll.set()
+        """
+        )
+        result, html = run(
+            testdir,
+            "report/report.html",
+            "--html-profiling",
+            "--html-profile-lazy",
+            "--html-profile-phases",
+            "--html-live",
+            "0",
+        )
+        assert result.ret == 0
+        result.stdout.fnmatch_lines(["live html report: http://127.0.0.1:*/report/"])
+        fetched = json.loads(testdir.tmpdir.join("live.json").read_text("utf-8"))
+        # the teardown profile is only in the report
+        assert "pytest-html-profiling:" not in fetched["row"]
+        assert fetched["srcs"]
+        for src, extra in zip(fetched["srcs"], fetched["extras"]):
+            assert src.startswith("../pytest_profiles/")
+            assert extra.startswith("load_extra_content(")
+
+    @pytest.mark.parametrize(
+        "args", [[], ["-n", "2"], ["-n", "2", "--html-profile-deferred"]]
+    )
+    def test_json_results_profile(self, testdir, args):
+        if args:
+            pytest.importorskip("xdist")
+        make_work_module(testdir, runs=2)
+        path = testdir.tmpdir.join("report.jsonl")
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profile-top=3",
+            "--html-memory-profiling",
+            "--html-json",
+            path,
+            *args
+        )
+        assert result.ret == 0
+        records = [json.loads(line) for line in path.readlines()]
+        assert len(records) == 3
+        for record in sorted(records[:2], key=lambda record: record["nodeid"]):
+            assert record["outcome"] == "passed"
+            profile = record["profile"]
+            assert profile["calls"] >= 2
+            assert len(profile["top_internal"]) == len(profile["top_cumulative"]) == 3
+            assert "test_json_results_profile:2:work" in [
+                function["function"] for function in profile["top_cumulative"]
+            ]
+            assert profile["top_cumulative"][0]["cumulative"] == profile["time"]
+            memory = record["memory"]
+            assert sorted(memory["phases"]) == ["call", "setup", "teardown"]
+            assert memory["peak"] == max(
+                phase["peak"] for phase in memory["phases"].values()
+            )
+        assert records[2]["type"] == "summary"
+        assert records[2]["passed"] == 2
+
+    def test_suite_hotspots(self, testdir):
+        make_work_module(testdir, runs=3, extra="def test_other():\n    pass\n")
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-call-graph",
+            "--html-profile-hotspots",
+            "3",
+        )
+        assert result.ret == 0
+        assert_results(html, tests=4, passed=4)
+        hotspots = html[html.index("Suite hotspots") : html.index('id="results-table"')]
+        assert "Aggregated profile of 4 tests." in hotspots
+        assert len(re.findall("<table class=\"hotspots\">", hotspots)) == 2
+        assert len(re.findall("<td class=\"col-function\"", hotspots)) == 6
+        anchors = set(re.findall('href="#(test-[^"]+)"', hotspots))
+        assert "test-test_suite_hotspots.py__test_work_0_" in anchors
+        for anchor in anchors:
+            assert 'id="{0}"'.format(anchor) in html
+        assert len(re.findall(r'<img src="pytest_profiles/.*\.png">', hotspots)) == 2
+        (session_dir,) = testdir.tmpdir.join("pytest_profiles").listdir(
+            lambda path: path.check(dir=1)
+        )
+        session_dir = session_dir.join("session")
+        assert session_dir.join("test.cprof").check()
+
+    def test_session_profile_keeps_top_tests(self):
+        from pytest_html_profiling.profile_data import ProfileData, SessionProfile
+
+        func = ("test_a.py", 1, "work")
+        session = SessionProfile(max_tests=2)
+        for i, ct in enumerate([0.3, 0.1, 0.5, 0.2]):
+            session.add("test_{0}".format(i), ProfileData({func: (1, 1, ct, ct, {})}))
+        assert session.num_tests == 4
+        assert session.test_counts[func] == 4
+        assert session.top_tests(func) == ["test_2", "test_0"]
+        assert session.stats[func][:2] == (4, 4)
+
+    def test_profile_baseline(self, testdir):
+        source = """
+            def work():
+                return sum(range(100))
+            def test_work():
+                for i in range({0}):
+                    work()
+            def test_same():
+                work()
+        """
+        testdir.makepyfile(source.format(1))
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profile-history"
+        )
+        assert result.ret == 0
+        assert "vs baseline" not in html
+        assert testdir.tmpdir.join("pytest_profiles", "history.sqlite").check()
+
+        testdir.makepyfile(source.format(10))
+        testdir.makepyfile(test_new="def test_new(): pass")
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profile-baseline=last"
+        )
+        assert result.ret == 0
+        assert_results(html, tests=3, passed=3)
+        assert "\u0394 vs baseline" in html
+        assert len(re.findall(r'<td class="col-delta regression"', html)) == 1
+        assert len(re.findall(r'<td class="col-delta"[^>]*>new</td>', html)) == 1
+        start = html.index("Performance regressions")
+        regressions = html[start : html.index("Results")]
+        assert "1 of 2 tests compared with session" in regressions
+        assert "test_profile_baseline.py::test_work" in regressions
+        assert "test_same" not in regressions
+        assert "test_profile_baseline:work: +" in regressions
+        assert "+9 calls" in regressions
+
+    @pytest.mark.parametrize("min_time, regressed", [(None, False), ("0", True)])
+    def test_profile_baseline_short_test(self, testdir, min_time, regressed):
+        # the same calls, taking several times longer but well under a millisecond
+        source = "def test_short(): sum(range({0}))"
+        testdir.makepyfile(source.format(10))
+        args = ["--html-profiling", "--html-profile-history"]
+        result, html = run(testdir, "report.html", *args)
+        assert result.ret == 0
+
+        testdir.makepyfile(source.format(10000))
+        args.append("--html-profile-baseline=last")
+        if min_time is not None:
+            args.append("--html-profile-regression-min-time=" + min_time)
+        result, html = run(testdir, "report.html", *args)
+        assert result.ret == 0
+        start = html.index("Performance regressions")
+        regressions = html[start : html.index("Results")]
+        assert ("1 of 1 tests" in regressions) == regressed
+        assert ("test_short" in regressions) == regressed
+
+    def test_profile_baseline_unknown(self, testdir):
+        testdir.makepyfile("def test_pass(): pass")
+        result = testdir.runpytest(
+            "--html=report.html", "--html-profiling", "--html-profile-baseline=nope"
+        )
+        assert result.ret != 0
+        result.stderr.fnmatch_lines(["*no session nope in the profile history*"])
+
+    def test_profile_baseline_other_profiler(self, testdir):
+        from pytest_html_profiling import history
+
+        testdir.makepyfile("def test_pass(): pass")
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profile-history"
+        )
+        assert result.ret == 0
+        store = history.ProfileHistory(
+            str(testdir.tmpdir.join("pytest_profiles", "history.sqlite"))
+        )
+        (name,) = store.runs()
+        store.close()
+
+        sampled = ["--html-profiling", "--html-profiler=sampling"]
+        result, html = run(
+            testdir, "report.html", "--html-profile-baseline=last", *sampled
+        )
+        assert result.ret == 0
+        assert "vs baseline" not in html
+
+        result = testdir.runpytest(
+            "--html=report.html", "--html-profile-baseline=" + name, *sampled
+        )
+        assert result.ret != 0
+        message = "*session {0} was not profiled with --html-profiler=sampling *"
+        result.stderr.fnmatch_lines([message.format(name)])
+
+    def test_profile_history_profiler(self, tmpdir):
+        from pytest_html_profiling import history
+
+        records = {"test_a": history.PerformanceRecord(0.1, 10, 0.1, {})}
+        store = history.ProfileHistory(str(tmpdir.join("history.sqlite")))
+        store.add_run("first", records)
+        store.add_run("sampled", records, "sampling", 0.001)
+        store.add_run("last", records)
+        assert store.last_run("cprofile") == "last"
+        assert store.last_run("sampling", 0.001) == "sampled"
+        assert store.last_run("sampling", 0.01) is None
+        assert store.get_profiler("sampled") == ("sampling", 0.001)
+        assert store.get_profiler("first") == ("cprofile", None)
+        store.close()
+
+    def test_profile_cache(self, testdir):
+        testdir.makepyfile(
+            helper="""
+            def work():
+                return sum(range(100))
+        """,
+            test_profile_cache="""
+            from helper import work
+            def test_work():
+                work()
+            def test_other():
+                pass
+        """,
+        )
+        args = ["--html-profiling", "--html-call-graph", "--html-profile-cache"]
+        result, html = run(testdir, "report.html", *args)
+        assert result.ret == 0
+        assert "Profile reused" not in html
+        assert testdir.tmpdir.join("pytest_profiles", "profile_cache.sqlite").check()
+
+        result, html = run(testdir, "report.html", *args)
+        assert result.ret == 0
+        assert len(re.findall("Profile reused from session", html)) == 2
+        assert len(re.findall("helper.py:1\\(work\\)", results_table(html))) == 2
+        assert len(re.findall("<img src=", results_table(html))) == 6
+
+        testdir.makepyfile(
+            helper="""
+            def work():
+                return sum(range(1000))
+        """
+        )
+        path = testdir.tmpdir.join("report.jsonl")
+        result, html = run(testdir, "report.html", "--html-json", path, *args)
+        assert result.ret == 0
+        assert len(re.findall("Profile reused from session", html)) == 1
+        records = [json.loads(line) for line in path.readlines()][:2]
+        reused = [(record["nodeid"], record["profile"]["reused"]) for record in records]
+        assert reused == [
+            ("test_profile_cache.py::test_work", False),
+            ("test_profile_cache.py::test_other", True),
+        ]
+
+        result, html = run(testdir, "report.html", "--html-profiling")
+        assert "Profile reused" not in html
+
+    def test_perf_budget(self, testdir):
+        testdir.makepyfile(
+            """
+            import pytest
+            def work():
+                return sorted(range(10))
+            @pytest.mark.perf_budget(functions={"test_perf_budget.work": 2})
+            def test_over():
+                for i in range(3):
+                    work()
+            @pytest.mark.perf_budget(
+                max_seconds=60, max_calls=100, functions={"builtins.sorted": 2}
+            )
+            def test_within():
+                work()
+            @pytest.mark.perf_budget(max_calls=1, max_peak_memory=1, xfail=True)
+            def test_xfail():
+                work()
+            def test_no_budget():
+                work()
+        """
+        )
+        result, html = run(testdir, "report.html", "--html-profiling")
+        assert result.ret == 1
+        result.stdout.fnmatch_lines(
+            ["*Performance budget exceeded: calls of test_perf_budget.work 3 > 2*"]
+        )
+        assert_results(html, tests=4, passed=2, failed=1, xfailed=1)
+        assert len(re.findall('<table class="hotspots budget">', html)) == 3
+        assert len(re.findall('<tr class="exceeded">', html)) == 2
+        assert "<td>calls of builtins.sorted</td><td>2</td><td>1</td>" in html
+        assert "<td>peak memory (bytes)</td><td>1</td><td>not measured</td>" in html
+
+    def test_perf_budget_sampling(self, testdir):
+        testdir.makepyfile(
+            """
+            import pytest
+            def work():
+                return sorted(range(10))
+            @pytest.mark.perf_budget(
+                max_seconds=60,
+                max_calls=0,
+                functions={"test_perf_budget_sampling.work": 0},
+            )
+            def test_work():
+                work()
+        """
+        )
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profiler=sampling"
+        )
+        assert result.ret == 0
+        assert_results(html, tests=1, passed=1)
+        assert '<tr class="exceeded">' not in html
+        assert "<td>calls</td><td>0</td><td>not measured</td>" in html
+        assert (
+            "<td>calls of test_perf_budget_sampling.work</td><td>0</td>"
+            "<td>not measured</td>" in html
+        )
+
+    @pytest.mark.parametrize("args", [[], ["--html-profile-store"]])
+    def test_render(self, testdir, args):
+        from pytest_html_profiling import cli
+
+        testdir.makeconftest(
+            """
+            def pytest_configure(config):
+                with open("lifecycle.txt", "a") as f:
+                    f.write("configure\\n")
+            def pytest_unconfigure(config):
+                with open("lifecycle.txt", "a") as f:
+                    f.write("unconfigure\\n")
+        """
+        )
+        make_work_module(testdir, runs=3, check="assert n < 2")
+        result, html = run(
+            testdir,
+            "report.html",
+            "--html-profiling",
+            "--html-profile-export=chrome",
+            *args
+        )
+        assert result.ret == 1
+        profile_dir = testdir.tmpdir.join("pytest_profiles")
+        manifests = profile_dir.listdir("*.manifest.jsonl")
+        assert len(manifests) == 1
+        assert "PROFILE (SORTED BY" not in manifests[0].read()
+        (trace_path,) = profile_dir.listdir("*.trace.json")
+        trace = trace_path.read()
+
+        assert (
+            cli.main(
+                [
+                    "render",
+                    str(testdir.tmpdir.join("pytest_profiles")),
+                    "--html",
+                    str(testdir.tmpdir.join("rendered.html")),
+                    "--html-profile-table",
+                    "--html-profile-top=2",
+                    "--html-profile-export=chrome",
+                ]
+            )
+            == 0
+        )
+        # the session is rendered in place, its timeline is left as it is
+        assert profile_dir.listdir("*.trace.json") == [trace_path]
+        assert trace_path.read() == trace
+        lifecycle = testdir.tmpdir.join("lifecycle.txt").read().split()
+        assert lifecycle == ["configure", "unconfigure"] * 2
+        rendered = read_html(testdir.tmpdir.join("rendered.html"))
+        assert_results(rendered, tests=3, passed=2, failed=1)
+        assert "Suite hotspots" in rendered
+        table = results_table(rendered)
+        assert len(re.findall('<table class="profile-table">', table)) == 6
+        assert "test_render.py:2(work)" in table
+        assert "assert 2 &lt; 2" in table
+
+    def test_merge(self, testdir):
+        from pytest_html_profiling import cli
+
+        make_work_module(
+            testdir,
+            runs=3,
+            check="assert n < 2",
+            extra="def test_shared():\n    work()\n",
+        )
+        for shard, args in [
+            ("shard1", ["-k", "test_work"]),
+            ("shard2", ["-k", "test_shared"]),
+            ("shard3", ["-k", "test_shared", "--html-profile-store"]),
+        ]:
+            run(
+                testdir,
+                shard + ".html",
+                "--html-profiling",
+                "--html-profile-dir=" + shard,
+                *args
+            )
+
+        assert (
+            cli.main(
+                [
+                    "merge",
+                    "shard1",
+                    "shard2",
+                    str(testdir.tmpdir.join("shard3")),
+                    "--html",
+                    "merged.html",
+                    "--html-profile-dir=merged",
+                    "--html-profile-hotspots=5",
+                    "--html-profile-export=chrome",
+                ]
+            )
+            == 0
+        )
+        html = read_html(testdir.tmpdir.join("merged.html"))
+        assert_results(html, tests=5, passed=4, failed=1)
+        table = results_table(html)
+        assert "test_merge.py::test_shared@shard3" in table
+        assert len(re.findall("PROFILE \\(SORTED BY INTERNAL TIME\\)", table)) == 5
+        assert "Suite hotspots" in html
+        (session_dir,) = testdir.tmpdir.join("merged").listdir(
+            lambda path: path.check(dir=1)
+        )
+        test_dir = profile_test_dir(session_dir, "test_merge.py::test_shared@shard3")
+        assert test_dir.join("test.cprof").check()
+
+    def test_merge_same_test_names(self, testdir):
+        from pytest_html_profiling import cli
+
+        testdir.makepyfile(
+            test_first="""
+            def first():
+                return sum(range(100))
+            def test_work():
+                first()
+        """,
+            test_second="""
+            def second():
+                return sum(range(100))
+            class TestWork(object):
+                def test_work(self):
+                    second()
+        """,
+        )
+        run(
+            testdir,
+            "shard1.html",
+            "--html-profiling",
+            "--html-profile-dir=shard1",
+            "test_first.py",
+        )
+        # the tests of the same name are profiled by different workers
+        run(
+            testdir,
+            "shard2.html",
+            "--html-profiling",
+            "--html-profile-dir=shard2",
+            "-n",
+            "2",
+        )
+
+        assert (
+            cli.main(
+                [
+                    "merge",
+                    "shard1",
+                    "shard2",
+                    "--html",
+                    "merged.html",
+                    "--html-profile-dir=merged",
+                ]
+            )
+            == 0
+        )
+        html = read_html(testdir.tmpdir.join("merged.html"))
+        assert_results(html, tests=3, passed=3)
+        table = results_table(html)
+        assert len(re.findall("PROFILE \\(SORTED BY INTERNAL TIME\\)", table)) == 3
+        (session_dir,) = testdir.tmpdir.join("merged").listdir(
+            lambda path: path.check(dir=1)
+        )
+        for nodeid, function in [
+            ("test_first.py::test_work", "first"),
+            ("test_first.py::test_work@shard2", "first"),
+            ("test_second.py::TestWork::test_work", "second"),
+        ]:
+            test_dir = profile_test_dir(session_dir, nodeid)
+            stats = marshal.loads(test_dir.join("test.cprof").read_binary())
+            assert function in [key[2] for key in stats]
+
+    def test_suite_hotspots_disabled(self, testdir):
+        testdir.makepyfile("def test_pass(): pass")
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profile-hotspots", "0"
+        )
+        assert result.ret == 0
+        assert "Suite hotspots" not in html
+
+    def test_profile_phases(self, testdir):
+        testdir.makepyfile(
+            """
+            import pytest
+            @pytest.fixture(scope="module")
+            def resource():
+                yield sum(range(1000))
+                sum(range(1000))
+            @pytest.mark.parametrize("n", range(3))
+            def test_work(resource, n):
+                pass
+        """
+        )
+        result, html = run(
+            testdir, "report.html", "--html-profiling", "--html-profile-phases"
+        )
+        assert result.ret == 0
+        assert_results(html, tests=3, passed=3)
+        assert "pytest-html-profiling:" not in html
+        table = results_table(html)
+        assert len(re.findall("--- SETUP PROFILE", table)) == 3
+        assert len(re.findall("--- TEARDOWN PROFILE", table)) == 3
+        assert len(re.findall("fixture resource \\(module scope\\)", table)) == 1
+        costs = html[html.index("Fixture cost") : html.index('id="results-table"')]
+        row = re.search('<td class="col-fixture">resource</td>(.*?)</tr>', costs, re.S)
+        assert '<td class="col-scope">module</td>' in row.group(1)
+        assert '<td class="col-setups">1</td>' in row.group(1)
+        assert '<td class="col-tests">3</td>' in row.group(1)
+        assert 'href="#test-test_profile_phases.py__test_work_0_"' in row.group(1)
+        (session_dir,) = testdir.tmpdir.join("pytest_profiles").listdir(
+            lambda path: path.check(dir=1)
+        )
+        test_dir = profile_test_dir(session_dir, "test_profile_phases.py::test_work[0]")
+        assert test_dir.join("setup.cprof").check()
+        assert test_dir.join("teardown.cprof").check()
+
+    def test_memory_profiling(self, testdir):
+        pytest.importorskip("tracemalloc")
+        testdir.makepyfile(
+            """
+            retained = []
+            def test_allocate():
+                retained.append(bytearray(2 * 1024 * 1024))
+            def test_nothing():
+                pass
+        """
+        )
+        result, html = run(testdir, "report.html", "--html-memory-profiling")
+        assert result.ret == 0
+        assert_results(html, tests=2, passed=2)
+        assert "pytest-html-profiling:" not in html
+        assert "PROFILE (SORTED BY" not in html
+        assert (
+            '<th class="sortable numeric" col="memory">Peak memory (MiB)</th>' in html
+        )
+        peaks = dict(
+            re.findall(
+                '<td class="col-name">test_memory_profiling.py::(\\w+)</td>.*?'
+                '<td class="col-memory">([\\d.]+)</td>',
+                html,
+                re.S,
+            )
+        )
+        assert float(peaks["test_allocate"]) >= 2.0
+        assert float(peaks["test_nothing"]) < 1.0
+        assert len(re.findall("--- MEMORY PROFILE ---", html)) == 2
+        assert re.search(
+            "2048\\.\\d KiB +\\+\\d+ blocks  .*test_memory_profiling.py:3", html
+        )